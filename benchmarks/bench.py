@@ -0,0 +1,265 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+""" Offline performance benchmarks for iotlabcli
+
+Run the library against a local `fake_server` and time the main user
+operations for different testbed sizes:
+
+ * submit:  experiment description assembly and submission
+ * submit_lists: same, with nodes given as 100 lists
+ * submit_stream: same as submit, streamed with ExperimentBuilder
+ * command: node command fan-out ('reset' and 'update' on all nodes)
+ * wait:    polling an experiment state until 'Running'
+ * archive: downloading and writing an experiment archive
+ * parse:   nodes lists parsing, expansion and exclusion
+
+With --memory, peak memory allocated during one more run of each benchmark
+is also printed, python >= 3.4 only.
+
+Results may be saved as a baseline and later runs compared against it,
+exiting with an error when a benchmark got slower than the tolerance.
+
+    $ python benchmarks/bench.py --save benchmarks/baseline.json
+    $ python benchmarks/bench.py --compare benchmarks/baseline.json
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# pylint:disable=wrong-import-position
+from iotlabcli import rest, experiment, node, transport, cache  # noqa
+from iotlabcli.parser import common, node as node_parser  # noqa
+from fake_server import FakeTestbed, FakeServer, SITES  # noqa
+
+FIRMWARE = os.path.join(os.path.dirname(BENCH_DIR), 'integration', 'tp.hex')
+SCALES = (10, 1000, 10000)
+# differences below this value in seconds are not considered as regressions
+MIN_DIFFERENCE = 0.02
+BENCHMARKS = {}
+# Api transports, 'fake' answers in-process without the HTTP server
+TRANSPORTS = {
+    'requests': lambda testbed, url: None,
+    'session': lambda testbed, url: transport.SessionTransport(),
+    'urllib3': lambda testbed, url: transport.Urllib3Transport(),
+    'asyncio': lambda testbed, url: transport.AsyncioTransport(),
+    'fake': lambda testbed, url: transport.FakeTransport(testbed.handle, url),
+}
+
+
+def benchmark(func):
+    """ Register `func` as a benchmark """
+    BENCHMARKS[func.__name__.replace('bench_', '')] = func
+    return func
+
+
+@benchmark
+def bench_submit(api, testbed):
+    """ Submit a physical experiment on all the testbed nodes """
+    resources = [experiment.exp_resources(testbed.nodes(), FIRMWARE)]
+    return lambda: experiment.submit_experiment(api, 'bench', 20, resources)
+
+
+@benchmark
+def bench_submit_lists(api, testbed):
+    """ Submit a physical experiment with many nodes lists """
+    nodes = testbed.nodes()
+    step = max(1, len(nodes) // 100)
+    resources = [experiment.exp_resources(nodes[i:i + step], FIRMWARE)
+                 for i in range(0, len(nodes), step)]
+    return lambda: experiment.submit_experiment(api, 'bench', 20, resources)
+
+
+@benchmark
+def bench_submit_stream(api, testbed):
+    """ Submit a physical experiment with a streamed description """
+    builder = experiment.ExperimentBuilder('bench', 20)
+    builder.add(testbed.nodes(), FIRMWARE)
+    return lambda: builder.submit(api)
+
+
+@benchmark
+def bench_command(api, testbed):
+    """ Reset then update all the experiment nodes """
+    exp_id = _submitted_experiment(api, testbed)
+    nodes = testbed.nodes()
+
+    def _run():
+        """ Benchmarked function """
+        node.node_command(api, 'reset', exp_id, nodes)
+        node.node_command(api, 'update', exp_id, nodes, FIRMWARE)
+    return _run
+
+
+@benchmark
+def bench_wait(api, testbed):
+    """ Wait for a new experiment to get 'Running' """
+    exp_id = _submitted_experiment(api, testbed)
+
+    def _run():
+        """ Benchmarked function """
+        testbed.experiments[exp_id]['state'] = 'Waiting'
+        experiment.wait_experiment(api, exp_id, step=0)
+    return _run
+
+
+@benchmark
+def bench_archive(api, testbed):
+    """ Download an experiment archive """
+    exp_id = _submitted_experiment(api, testbed)
+    return lambda: experiment.get_experiment(api, exp_id, 'data')
+
+
+@benchmark
+def bench_parse(api, testbed):
+    """ Parse a nodes list per site, list them, then exclude them from an
+    experiment nodes """
+    exp_id = _submitted_experiment(api, testbed)
+    nodes_str = '1-%u' % max(2, len(testbed.nodes()))
+
+    def _run():
+        """ Benchmarked function """
+        nodes_ll = [common.nodes_list_from_info(site, 'm3', nodes_str)
+                    for site in SITES]
+        node_parser.list_nodes(api, exp_id, nodes_ll=nodes_ll)
+        excl_ll = [common.nodes_ranges_from_info(site, 'm3', nodes_str)
+                   for site in SITES]
+        node_parser.list_nodes(api, exp_id, excl_nodes_ll=excl_ll)
+    return _run
+
+
+def _submitted_experiment(api, testbed):
+    """ Submit an experiment on all nodes and return its id """
+    resources = [experiment.exp_resources(testbed.nodes(), FIRMWARE)]
+    return experiment.submit_experiment(api, 'bench', 20, resources)['id']
+
+
+def run_benchmark(name, scale, opts):
+    """ Run benchmark `name` for a testbed of `scale` nodes
+    :returns: best time of `opts.repeat` runs in seconds, and peak memory in
+        bytes of one more run with `opts.memory`, else None """
+    testbed = FakeTestbed(nb_nodes=scale, latency=opts.latency)
+    with FakeServer(testbed) as server:
+        api = rest.Api('user', 'password', url=server.url,
+                       transport=TRANSPORTS[opts.transport](testbed,
+                                                            server.url))
+        func = BENCHMARKS[name](api, testbed)
+        timings = []
+        for _ in range(opts.repeat):
+            start = time.time()
+            func()
+            timings.append(time.time() - start)
+        peak = _peak_memory(func) if opts.memory else None
+    return min(timings), peak
+
+
+def _peak_memory(func):
+    """ Peak memory allocated while running `func`, python >= 3.4 """
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(opts):
+    """ Run selected benchmarks in a temporary directory
+    :returns: {'name/scale': seconds} """
+    results = {}
+    cwd = os.getcwd()
+    tmp_dir = tempfile.mkdtemp()
+    os.chdir(tmp_dir)  # archives are written in current directory
+    cache_dir, cache.CACHE_DIR = cache.CACHE_DIR, tmp_dir
+    try:
+        for name in opts.benchmarks:
+            for scale in opts.scales:
+                key = '{0}/{1}'.format(name, scale)
+                results[key], peak = run_benchmark(name, scale, opts)
+                print('{0:<20} {1:10.4f}s'.format(key, results[key]) + (
+                    '' if peak is None else ' {0:10.1f}KB'.format(
+                        peak / 1024.0)))
+    finally:
+        cache.CACHE_DIR = cache_dir
+        os.chdir(cwd)
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Compare results with baseline
+    :returns: list of regressions messages """
+    regressions = []
+    for key, value in sorted(results.items()):
+        ref = baseline.get(key)
+        if ref is None:
+            continue
+        ratio = value / ref if ref else 1.0
+        if ratio > 1 + tolerance and value - ref > MIN_DIFFERENCE:
+            regressions.append('{0}: {1:.4f}s > {2:.4f}s (x{3:.2f})'.format(
+                key, value, ref, ratio))
+    return regressions
+
+
+def opts_parser():
+    """ Argument parser """
+    parser = argparse.ArgumentParser(description='iotlabcli benchmarks')
+    parser.add_argument(
+        '--scales', default=SCALES, type=lambda s: [int(n) for n in
+                                                    s.split(',')],
+        help='comma separated testbed sizes, default: %(default)s')
+    parser.add_argument(
+        '--benchmarks', default=sorted(BENCHMARKS),
+        type=lambda s: s.split(','),
+        help='comma separated benchmarks in {0}'.format(sorted(BENCHMARKS)))
+    parser.add_argument('--repeat', default=5, type=int,
+                        help='number of runs, best one is kept')
+    parser.add_argument('--latency', default=0.0, type=float,
+                        help='server latency per request in seconds')
+    parser.add_argument('--memory', action='store_true',
+                        help='also print peak memory, python >= 3.4')
+    parser.add_argument('--transport', default='requests',
+                        choices=sorted(TRANSPORTS),
+                        help='Api transport, default: %(default)s')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save results as baseline to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare results with baseline FILE')
+    parser.add_argument('--tolerance', default=0.5, type=float,
+                        help='allowed slow down ratio, default: %(default)s')
+    return parser
+
+
+def main(args=None):
+    """ Run benchmarks and compare/save results """
+    opts = opts_parser().parse_args(args)
+    results = run_benchmarks(opts)
+
+    if opts.save:
+        with open(opts.save, 'w') as baseline:
+            json.dump(results, baseline, indent=4, sort_keys=True)
+            baseline.write('\n')
+
+    if opts.compare:
+        with open(opts.compare) as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  opts.tolerance)
+        if regressions:
+            print('Regressions:\n  ' + '\n  '.join(regressions),
+                  file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
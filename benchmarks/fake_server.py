@@ -0,0 +1,506 @@
+# -*- coding:utf-8 -*-
+""" Local stand-in for the IoT-LAB REST server
+
+Implements the experiments, nodes and profiles endpoints used by iotlabcli
+with an in-memory testbed, so cli-tools can be benchmarked offline.
+
+The request handling itself is done by `FakeTestbed.handle`, which does not
+depend on sockets, and `FakeServer` exposes it over HTTP on localhost.
+
+    with FakeServer(FakeTestbed(nb_nodes=10)) as server:
+        api = Api('user', 'password', url=server.url)
+
+"""
+
+# pylint:disable=too-many-public-methods,too-many-instance-attributes
+
+import io
+import json
+import hashlib
+import re
+import tarfile
+import threading
+import time
+import zlib
+try:
+    # pylint:disable=import-error,no-name-in-module
+    from urllib.parse import urlsplit, parse_qsl, unquote
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:  # pragma: no cover
+    # pylint:disable=import-error,no-name-in-module
+    from urlparse import urlsplit, parse_qsl
+    from urllib import unquote
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+SITES = ['grenoble', 'strasbourg', 'lille', 'rocquencourt', 'euratech']
+ARCHIS = [('m3', 'm3:at86rf231'), ('a8', 'a8:at86rf231'),
+          ('wsn430', 'wsn430:cc2420')]
+DOMAIN_DNS = 'iot-lab.info'
+# zlib wbits for supported Content-Encoding
+CONTENT_ENCODINGS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+# error answers by exception type
+ERRORS = {KeyError: (404, 'Not found: %s'),
+          ValueError: (400, 'Bad request: %s'),
+          TypeError: (415, 'Unsupported Media Type: %s')}
+# answers larger than this are gzipped when the client accepts it
+MIN_COMPRESSED_SIZE = 1024
+
+# states an experiment goes through when its state is polled
+STATES_PROGRESSION = ['Waiting', 'toLaunch', 'Launching', 'Running']
+
+
+def _error_answer(err):
+    """ Return (status, message format) for `err`, or its closest mapped
+    base class
+
+    >>> _error_answer(UnicodeDecodeError('utf-8', b'', 0, 1, 'invalid'))
+    (400, 'Bad request: %s')
+    >>> _error_answer(RuntimeError())
+    (500, 'Internal error: %s')
+    """
+    for cls in type(err).__mro__:
+        if cls in ERRORS:
+            return ERRORS[cls]
+    return (500, 'Internal error: %s')
+
+
+class FakeTestbed(object):
+    """ In-memory testbed answering the REST API requests
+
+    :param nb_nodes: number of nodes in the testbed, split between sites
+    :param latency: seconds to wait before answering each request
+    :param polls_per_state: number of 'state' requests before an experiment
+        goes to the next state
+    :param compression: accept gzip/deflate compressed request bodies,
+        else answer '415 Unsupported Media Type'
+    :param firmware_reference: allow updating nodes with a firmware already
+        uploaded for the experiment, referenced by its sha1
+    """
+    # pylint:disable=too-many-arguments
+    def __init__(self, nb_nodes=100, latency=0.0, polls_per_state=1,
+                 compression=True, firmware_reference=True):
+        self.latency = latency
+        self.compression = compression
+        self.firmware_reference = firmware_reference
+        self.uploaded_bytes = 0
+        self.polls_per_state = polls_per_state
+        self.resources = self._generate_resources(nb_nodes)
+        self.experiments = {}
+        self.profiles = {}
+        self.requests_count = 0
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _generate_resources(nb_nodes):
+        """ Generate `nb_nodes` resources spread on sites and archis """
+        resources = []
+        for num in range(nb_nodes):
+            site = SITES[num % len(SITES)]
+            node_type, archi = ARCHIS[(num // len(SITES)) % len(ARCHIS)]
+            node_id = 1 + num // (len(SITES) * len(ARCHIS))
+            resources.append({
+                'archi': archi,
+                'mobile': 0,
+                'mobility_type': ' ',
+                'network_address': '{0}-{1}.{2}.{3}'.format(
+                    node_type, node_id, site, DOMAIN_DNS),
+                'site': site,
+                'state': 'Alive',
+                'uid': '{0:04x}'.format(num),
+                'x': 0, 'y': 0, 'z': 0,
+            })
+        return resources
+
+    def nodes(self, nb_nodes=None):
+        """ Return the network addresses of the testbed nodes """
+        nodes = [res['network_address'] for res in self.resources]
+        return nodes[:nb_nodes]
+
+    def handle(self, method, path, body=b'', headers=None):
+        """ Answer a request
+
+        :param method: HTTP method
+        :param path: url path and query, relative to the api root
+        :param body: request body as bytes
+        :param headers: request headers dict
+        :returns: (status_code, content_type, content as bytes)
+        """
+        headers = headers or {}
+        with self._lock:
+            self.requests_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlsplit(path)
+        parts = [unquote(p) for p in url.path.strip('/').split('/') if p]
+        query = url.query
+        try:
+            body = self._decode_body(body, headers)
+            ret = self._route(method, parts, query, body, headers)
+        except (KeyError, ValueError, TypeError) as err:
+            status, msg = _error_answer(err)
+            return status, 'text/plain', (msg % err).encode('utf-8')
+
+        if isinstance(ret, bytes):
+            return 200, 'application/octet-stream', ret
+        return 200, 'application/json', json.dumps(ret).encode('utf-8')
+
+    def _decode_body(self, body, headers):
+        """ Decompress body according to its Content-Encoding
+        :raises TypeError: for unsupported encodings """
+        encoding = _header(headers, 'Content-Encoding')
+        if not encoding:
+            return body
+        if not self.compression or encoding not in CONTENT_ENCODINGS:
+            raise TypeError('Unsupported Content-Encoding %r' % encoding)
+        try:
+            return zlib.decompress(body, CONTENT_ENCODINGS[encoding])
+        except zlib.error as err:
+            raise ValueError(err)
+
+    def _route(self, method, parts, query, body, headers):
+        """ Call the method handling 'parts' url """
+        # pylint:disable=too-many-arguments
+        route = (method, tuple(parts[:1] + ['*'] * (len(parts) - 1)))
+        handler = {
+            ('GET', ('experiments',)): self._get_experiments,
+            ('POST', ('experiments',)): self._submit_experiment,
+            ('GET', ('experiments', '*')): self._get_experiment,
+            ('DELETE', ('experiments', '*')): self._stop_experiment,
+            ('POST', ('experiments', '*', '*')): self._node_command,
+            ('GET', ('profiles',)): self._get_profiles,
+            ('GET', ('profiles', '*')): self._get_profile,
+            ('POST', ('profiles', '*')): self._add_profile,
+            ('DELETE', ('profiles', '*')): self._del_profile,
+        }.get(route)
+        if handler is None:
+            raise KeyError(method + ' /' + '/'.join(parts))
+        return handler(parts[1:], query, body, headers)
+
+    # Experiments
+
+    def _get_experiments(self, _, query, *__):
+        """ experiments?resources|id|sites|state=... """
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        if 'sites' in params:
+            return {'items': [{'site': site} for site in SITES]}
+
+        resources = self.resources
+        if 'site' in params:
+            resources = [r for r in resources if r['site'] == params['site']]
+        if 'resources' in params:
+            return {'items': resources}
+        if 'id' in params:
+            return {'items': [self._resources_id(resources, with_state=True)]}
+
+        states = params.get('state', 'Running').split(',')
+        exps = self._list_experiments(states)
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 0)) or len(exps)
+        return {'items': exps[offset:offset + limit], 'total': len(exps)}
+
+    def _list_experiments(self, states):
+        """ Experiments in `states` summaries, listing also makes
+        experiments progress """
+        exps = []
+        for _, exp in sorted(self.experiments.items()):
+            state = self._poll_state(exp)
+            if state in states:
+                exps.append(dict(self._exp_summary(exp), state=state))
+        return exps
+
+    def _submit_experiment(self, _, __, body, headers):
+        """ POST experiments multipart """
+        files = parse_multipart(body, headers)
+        desc = json.loads(files.pop('new_exp.json').decode('utf-8'))
+        for assoc in desc.get('firmwareassociations') or []:
+            if assoc['firmwarename'] not in files:
+                raise ValueError('Missing firmware %r' % assoc['firmwarename'])
+
+        with self._lock:
+            exp_id = self._next_id
+            self._next_id += 1
+        self.uploaded_bytes += sum(len(fw) for fw in files.values())
+        self.experiments[exp_id] = {
+            'id': exp_id, 'desc': desc, 'firmwares': files,
+            'uploaded': _sha1s(files),
+            'state': 'Waiting', 'polls': 0,
+        }
+        return {'id': exp_id}
+
+    def _get_experiment(self, parts, query, *_):
+        """ experiments/<id>?option """
+        exp = self.experiments[int(parts[0])]
+        if query == 'state':
+            return {'state': self._poll_state(exp)}
+        elif query == 'resources':
+            return {'items': self._exp_resources(exp)}
+        elif query == 'id':
+            return {'items': [self._resources_id(self._exp_resources(exp))]}
+        elif query == 'data':
+            return self._exp_archive(exp)
+        elif query == '':
+            return exp['desc']
+        raise ValueError(query)
+
+    def _stop_experiment(self, parts, *_):
+        """ DELETE experiments/<id> """
+        exp = self.experiments[int(parts[0])]
+        exp['state'] = 'Terminated'
+        return {'id': exp['id'], 'status': 'Delete request registered'}
+
+    def _node_command(self, parts, command, body, headers):
+        """ POST experiments/<id>/nodes?command """
+        exp = self.experiments[int(parts[0])]
+        command, _, sha1 = command.partition('=')
+        if command == 'update' and sha1 and self.firmware_reference:
+            # update with an uploaded firmware
+            if sha1 not in exp['uploaded']:
+                raise KeyError('firmware %s' % sha1)
+            nodes = json.loads(body.decode('utf-8'))
+        elif command == 'update' and not sha1:
+            files = parse_multipart(body, headers)
+            nodes = json.loads(files.pop('nodes.json').decode('utf-8'))
+            if len(files) != 1:
+                raise ValueError('Expected one firmware')
+            self.uploaded_bytes += sum(len(fw) for fw in files.values())
+            exp['uploaded'].update(_sha1s(files))
+        elif command in ('start', 'stop', 'reset'):
+            nodes = json.loads(body.decode('utf-8'))
+        else:
+            raise ValueError(command)
+        nodes = nodes or self._exp_nodes(exp)
+        return {'0': nodes}
+
+    # Profiles
+
+    def _get_profiles(self, *_):
+        """ GET profiles """
+        return list(self.profiles.values())
+
+    def _get_profile(self, parts, *_):
+        """ GET profiles/<name> """
+        return self.profiles[parts[0]]
+
+    def _add_profile(self, parts, _, body, __):
+        """ POST profiles/<name> """
+        self.profiles[parts[0]] = json.loads(body.decode('utf-8'))
+        return parts[0].encode('utf-8')
+
+    def _del_profile(self, parts, *_):
+        """ DELETE profiles/<name> """
+        del self.profiles[parts[0]]
+        return b''
+
+    # Helpers
+
+    def _poll_state(self, exp):
+        """ Return experiment state and make it progress """
+        state = exp['state']
+        if state not in STATES_PROGRESSION:
+            return state
+        exp['polls'] += 1
+        if exp['polls'] >= self.polls_per_state and state != 'Running':
+            exp['polls'] = 0
+            exp['state'] = STATES_PROGRESSION[
+                STATES_PROGRESSION.index(state) + 1]
+        return state
+
+    @staticmethod
+    def _exp_summary(exp):
+        """ Experiment entry in experiments list """
+        return {'id': exp['id'], 'state': exp['state'],
+                'name': exp['desc'].get('name'),
+                'duration': exp['desc'].get('duration')}
+
+    def _exp_nodes(self, exp):
+        """ Return experiment nodes, physical or selected from alias """
+        if exp['desc']['type'] == 'physical':
+            return exp['desc']['nodes']
+        nodes = []
+        for alias in exp['desc']['nodes']:
+            props = alias['properties']
+            matching = [r['network_address'] for r in self.resources
+                        if r['site'] == props['site'] and
+                        r['archi'] == props['archi'] and
+                        r['network_address'] not in nodes]
+            nodes.extend(matching[:alias['nbnodes']])
+        return nodes
+
+    def _exp_resources(self, exp):
+        """ Experiment resources list """
+        nodes = set(self._exp_nodes(exp))
+        return [res for res in self.resources
+                if res['network_address'] in nodes]
+
+    @staticmethod
+    def _resources_id(resources, with_state=False):
+        """ Resources in exp_list format {site: {archi: [state:] '1-3+5'}} """
+        ids = {}
+        for res in resources:
+            node, site = res['network_address'].split('.')[0:2]
+            archi, num = node.rsplit('-', 1)
+            keys = [site, archi] + ([res['state']] if with_state else [])
+            ids.setdefault(tuple(keys), []).append(int(num))
+
+        result = {}
+        for keys, nums in ids.items():
+            cur = result
+            for key in keys[:-1]:
+                cur = cur.setdefault(key, {})
+            cur[keys[-1]] = _exp_list_str(nums)
+        return result
+
+    @staticmethod
+    def _exp_archive(exp):
+        """ Experiment tar.gz with description and firmwares """
+        files = dict(exp['firmwares'])
+        files['%s.json' % exp['id']] = json.dumps(exp['desc']).encode('utf-8')
+
+        out = io.BytesIO()
+        archive = tarfile.open(fileobj=out, mode='w:gz')
+        for name, data in sorted(files.items()):
+            info = tarfile.TarInfo('%s/%s' % (exp['id'], name))
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        archive.close()
+        return out.getvalue()
+
+
+def _sha1s(files):
+    """ Return the set of `files` contents sha1 """
+    return set(hashlib.sha1(content).hexdigest()
+               for content in files.values())
+
+
+def _exp_list_str(nums):
+    """ Short nodes list string for nums
+
+    >>> _exp_list_str([5, 1, 2, 3, 7])
+    '1-3+5+7'
+    """
+    ranges = []
+    for num in sorted(set(nums)):
+        if ranges and ranges[-1][1] == num - 1:
+            ranges[-1][1] = num
+        else:
+            ranges.append([num, num])
+    return '+'.join(str(first) if first == last else '%d-%d' % (first, last)
+                    for first, last in ranges)
+
+
+def parse_multipart(body, headers):
+    """ Parse a 'multipart/form-data' body to a {filename: content} dict """
+    content_type = _header(headers, 'Content-Type')
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if match is None:
+        raise ValueError('No multipart boundary: %r' % content_type)
+    boundary = b'--' + match.group(1).encode('ascii')
+
+    files = {}
+    for part in body.split(boundary)[1:]:
+        if part.startswith(b'--'):
+            break  # final boundary
+        head, _, content = part.partition(b'\r\n\r\n')
+        name = re.search(br'filename="([^"]*)"', head) or \
+            re.search(br'name="([^"]*)"', head)
+        files[name.group(1).decode('utf-8')] = content[:-2]  # strip '\r\n'
+    return files
+
+
+def _header(headers, name):
+    """ Case insensitive header lookup """
+    for key, value in headers.items():
+        if key.lower() == name.lower():
+            return value
+    return ''
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """ Forward HTTP requests to the server testbed """
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, avoid keep-alive connections
+    # waiting for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def _handle(self):
+        """ Read request and write testbed answer """
+        body = self._read_body()
+        path = self.path[len(self.server.root):]
+        status, content_type, content = self.server.testbed.handle(
+            self.command, path, body, dict(self.headers.items()))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if len(content) >= MIN_COMPRESSED_SIZE and \
+                'gzip' in self.headers.get('Accept-Encoding', ''):
+            compress = zlib.compressobj(6, zlib.DEFLATED,
+                                        CONTENT_ENCODINGS['gzip'])
+            content = compress.compress(content) + compress.flush()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _read_body(self):
+        """ Read request body, with Content-Length or chunked encoding """
+        if self.headers.get('Transfer-Encoding', '') == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                chunk = self.rfile.read(size + 2)[:size]  # strip '\r\n'
+                if not size:
+                    break
+                chunks.append(chunk)
+            return b''.join(chunks)
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    do_GET = do_POST = do_DELETE = _handle
+
+    def log_message(self, *args):  # pylint:disable=arguments-differ
+        """ Be quiet """
+        pass
+
+
+class _ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """ Threaded HTTP server with a testbed """
+    daemon_threads = True
+
+
+class FakeServer(object):
+    """ Run `testbed` as an HTTP server on localhost in a thread """
+    root = '/rest/'
+
+    def __init__(self, testbed, port=0):
+        self.testbed = testbed
+        self._server = _ThreadedHTTPServer(('127.0.0.1', port),
+                                           _RequestHandler)
+        self._server.testbed = testbed
+        self._server.root = self.root
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={'poll_interval': 0.01})
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        """ Api url of the server """
+        return 'http://127.0.0.1:%d%s' % (self._server.server_address[1],
+                                          self.root)
+
+    def start(self):
+        """ Start serving requests """
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop the server """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
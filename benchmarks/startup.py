@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+""" Command line startup benchmark
+
+Time short commands parsing, like `experiment-cli get -s`, with all the
+subcommands parsers built (eager) or only the used one (lazy):
+
+ * parser: building the parser and parsing arguments, in process
+ * process: python interpreter startup, iotlabcli import and parsing
+
+    $ python benchmarks/startup.py
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+# pylint:disable=wrong-import-position
+from iotlabcli.parser import experiment, profile  # noqa
+
+COMMANDS = {
+    'experiment': (experiment, ['get', '-s']),
+    'profile': (profile, ['get', '-l']),
+}
+PROCESS_CODE = ('from iotlabcli.parser import {0}; '
+                '{0}.parse_options(lazy={1}).parse_args({2!r})')
+
+
+def best_time(func, repeat):
+    """ Best time of `repeat` runs of `func` in seconds """
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def bench_parser(cli, lazy, repeat):
+    """ Build `cli` parser and parse its short command """
+    module, args = COMMANDS[cli]
+    return best_time(
+        lambda: module.parse_options(lazy=lazy).parse_args(args), repeat)
+
+
+def bench_process(cli, lazy, repeat):
+    """ Run a python process importing `cli` parser and parsing its short
+    command """
+    module, args = COMMANDS[cli]
+    code = PROCESS_CODE.format(module.__name__.split('.')[-1], lazy, args)
+    cmd = [sys.executable, '-c', code]
+    return best_time(lambda: subprocess.check_call(cmd, cwd=ROOT_DIR),
+                     repeat)
+
+
+def opts_parser():
+    """ Argument parser """
+    parser = argparse.ArgumentParser(description='iotlabcli startup')
+    parser.add_argument('--repeat', default=20, type=int,
+                        help='number of runs, best one is kept')
+    return parser
+
+
+def main(args=None):
+    """ Run startup benchmarks """
+    opts = opts_parser().parse_args(args)
+    for bench in (bench_parser, bench_process):
+        for cli in sorted(COMMANDS):
+            timings = [bench(cli, lazy, opts.repeat) for lazy in (False, True)]
+            print('{0:<8} {1:<11} eager {2:8.2f}ms  lazy {3:8.2f}ms'.format(
+                bench.__name__.replace('bench_', ''), cli,
+                timings[0] * 1000, timings[1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -117,12 +117,8 @@ class TestCliToolsExperiments(unittest.TestCase):
 
     @staticmethod
     def _find_working_nodes(site, archi, num):
-        """ Find working nodes, there should be at least num nodes """
-        cmd = 'experiment-cli info -li --site {}'.format(site)
-        nodes = call_cli(cmd)["items"][0][site][archi]["Alive"]
-        nodes_str = '+'.join(nodes.split('+')[0:num])
-        LOGGER.debug("nodes_str: %r", nodes_str)
-        return '{},{},{}'.format(site, archi, nodes_str)
+        """ Select num working nodes when submitting """
+        return '{},{},pick:{}'.format(site, archi, num)
 
     def test_an_experiment_physical_one_site(self):
         """ Run an experiment on m3 nodes simple"""
@@ -1,29 +1,79 @@
 # -*- coding:utf-8 -*-
-""" Authentication file management """
+""" Authentication file management
+
+Credentials are resolved from the first of these providers giving them:
+
+ * explicit username and password
+ * explicit username, password from the system keyring or asked on console
+ * IOTLAB_USERNAME and IOTLAB_PASSWORD environment variables
+ * IOTLAB_USERNAME environment variable, password from the system keyring
+ * password file, IOTLAB_PASSWORD_FILE environment variable or RC_FILE
+
+The password file is only read again when modified and keyring passwords
+are looked up once per process. The system keyring is used if the python
+`keyring` module is installed, with service name KEYRING_SERVICE.
+"""
 
 import os
 import getpass
 from base64 import b64encode, b64decode
 
 HOME_DIRECTORY = os.getenv('USERPROFILE') or os.getenv('HOME')
-RC_FILE = (os.getenv('IOTLAB_PASSWORD_FILE') or
-           os.path.join(HOME_DIRECTORY, '.iotlabrc'))
+# default password file, IOTLAB_PASSWORD_FILE is read when used
+RC_FILE = os.path.join(HOME_DIRECTORY, '.iotlabrc')
+KEYRING_SERVICE = 'iotlabcli'
+
+# password file path: ((mtime, size), (username, password))
+_RC_CACHE = {}
+# username: keyring password or None
+_KEYRING_PASSWORDS = {}
 
 
 def get_user_credentials(username=None, password=None):
     """ Return user credentials.
-    If provided in arguments return them, if password missing, ask on console,
-    or try to read them from password file """
-
-    if (password is not None) and (username is not None):
-        pass
-    elif (password is None) and (username is not None):
-        password = getpass.getpass()
-    else:
-        username, password = _read_password_file()
+    If provided in arguments return them, if password missing, get it from
+    keyring or ask on console, else try environment and password file """
+
+    if username is not None:
+        if password is None:
+            password = _keyring_password(username) or getpass.getpass()
+        return username, password
+    return _env_credentials() or _read_password_file()
+
+
+def _env_credentials():
+    """ Return credentials from environment variables, password from keyring
+    if not set, or None """
+    username = os.getenv('IOTLAB_USERNAME')
+    if username is None:
+        return None
+    password = os.getenv('IOTLAB_PASSWORD') or _keyring_password(username)
+    if password is None:
+        return None
     return username, password
 
 
+def _keyring_password(username):
+    """ Return `username` password from system keyring or None, looked up
+    once per process """
+    if username not in _KEYRING_PASSWORDS:
+        _KEYRING_PASSWORDS[username] = _keyring_lookup(username)
+    return _KEYRING_PASSWORDS[username]
+
+
+def _keyring_lookup(username):
+    """ Return `username` password from system keyring or None """
+    try:
+        # imported on use, slow to import and optional
+        import keyring.errors  # pylint:disable=import-error
+    except ImportError:
+        return None
+    try:
+        return keyring.get_password(KEYRING_SERVICE, username)
+    except keyring.errors.KeyringError:
+        return None
+
+
 def write_password_file(username, password):
     """ Create a password file for basic authentication http when
     command-line option username and password are used We write .iotlabrc
@@ -35,26 +85,52 @@ def write_password_file(username, password):
     :type password: string
     """
     assert (username is not None) and (password is not None)
-    with open(RC_FILE, 'w') as pass_file:
+    rc_file = _password_file_path()
+    with open(rc_file, 'w') as pass_file:
         # encode/decode for python3
         enc_password = b64encode(password.encode('utf-8')).decode('utf-8')
         pass_file.write('{user}:{passwd}'.format(user=username,
                                                  passwd=enc_password))
+    _RC_CACHE[rc_file] = (_file_version(rc_file), (username, password))
+
+
+def _password_file_path():
+    """ Return password file path, IOTLAB_PASSWORD_FILE or RC_FILE """
+    return os.getenv('IOTLAB_PASSWORD_FILE') or RC_FILE
 
 
 def _read_password_file():
     """ Try to read password file (.iotlabrc) in user home directory when
     command-line option username and password are not used. If password
     file exist whe return username and password for basic auth http
-    authentication
+    authentication. Content is cached until the file is modified.
     """
-    if not os.path.exists(RC_FILE):
+    rc_file = _password_file_path()
+    try:
+        version = _file_version(rc_file)
+    except OSError:
         return None, None
+    cached = _RC_CACHE.get(rc_file)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    _RC_CACHE[rc_file] = (version, _parse_password_file(rc_file))
+    return _RC_CACHE[rc_file][1]
+
+
+def _file_version(path):
+    """ Return `path` (mtime, size) to detect modifications
+    :raises OSError: if `path` does not exist """
+    stat = os.stat(path)
+    return (stat.st_mtime, stat.st_size)
+
+
+def _parse_password_file(rc_file):
+    """ Return password file `rc_file` (username, password) """
     try:
-        with open(RC_FILE, 'r') as password_file:
+        with open(rc_file, 'r') as password_file:
             username, enc_password = password_file.readline().split(':')
             # encode/decode for python3
             password = b64decode(enc_password.encode('utf-8')).decode('utf-8')
             return username, password
     except ValueError:
-        raise ValueError('Bad password file format: %r' % RC_FILE)
+        raise ValueError('Bad password file format: %r' % rc_file)
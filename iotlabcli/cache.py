@@ -0,0 +1,199 @@
+# -*- coding:utf-8 -*-
+""" On-disk cache for REST API results
+
+Values are stored as json files in a per user and per API url directory in
+the cache directory, which is '~/.cache/iotlabcli' or the `IOTLAB_CACHE_DIR`
+environment variable.
+
+Results that never change, like finished experiments ones, are kept in a
+permanent `LRUCache` bounded to `LRU_MAX_SIZE` bytes, or to the
+`IOTLAB_CACHE_MAX_SIZE` environment variable, '0' disabling it.
+"""
+
+import os
+import json
+import time
+import errno
+import hashlib
+import tempfile
+
+CACHE_DIR = None  # use default
+LRU_MAX_SIZE = 256 * 1024 * 1024
+
+
+def cache_dir():
+    """ Return the cache root directory """
+    return os.path.expanduser(
+        CACHE_DIR or os.getenv('IOTLAB_CACHE_DIR') or
+        os.path.join('~', '.cache', 'iotlabcli'))
+
+
+def _hash(value):
+    """ Hex digest for `value` string """
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def api_cache(api):
+    """ Return the DiskCache for `api` url and user """
+    return DiskCache(_hash('%s %s' % (api.url, api.auth.username)))
+
+
+def finished_cache(api):
+    """ Return the LRUCache for `api` url and user immutable results """
+    return LRUCache(os.path.join(api_cache(api).directory, 'finished'))
+
+
+class DiskCache(object):
+    """ Json values cache, stored as files in `namespace` directory
+
+    >>> import shutil
+    >>> tmp_dir = tempfile.mkdtemp()
+    >>> cache = DiskCache('test', directory=tmp_dir)
+    >>> cache.get('key') is None
+    True
+    >>> cache.set('key', {'value': 1})
+    >>> cache.get('key') == {'value': 1}
+    True
+    >>> cache.get('key', max_age=0) is None  # too old
+    True
+    >>> cache.delete('key')
+    >>> cache.get('key') is None
+    True
+    >>> shutil.rmtree(tmp_dir)
+    """
+    def __init__(self, namespace, directory=None):
+        self.directory = os.path.join(directory or cache_dir(), namespace)
+
+    def path(self, key):
+        """ Path of the file storing `key` """
+        return os.path.join(self.directory, _hash(key))
+
+    def get(self, key, max_age=None):
+        """ Return value stored for `key`, or None if there is no value or
+        if it is older than `max_age` seconds """
+        path = self.path(key)
+        try:
+            if max_age is not None and \
+                    time.time() - os.path.getmtime(path) >= max_age:
+                return None
+            with open(path) as _fd:
+                return json.load(_fd)
+        except (IOError, OSError, ValueError):
+            # missing, removed concurrently or corrupted
+            return None
+
+    def set(self, key, value):
+        """ Store `value` for `key`, atomically replacing previous value """
+        _makedirs(self.directory)
+        _fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(_fd, 'w') as tmp_file:
+            json.dump(value, tmp_file)
+        os.rename(tmp_path, self.path(key))
+
+    def delete(self, key):
+        """ Remove value stored for `key` """
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+
+class LRUCache(object):
+    """ Permanent bytes values cache, stored as files in `namespace`
+    directory. Least recently used values are removed when the cache grows
+    over `max_size` bytes.
+
+    >>> import shutil
+    >>> tmp_dir = tempfile.mkdtemp()
+    >>> cache = LRUCache('test', max_size=10, directory=tmp_dir)
+    >>> cache.set('a', b'12345')
+    >>> cache.set('b', b'12345')
+    >>> cache.get('a') == b'12345'
+    True
+    >>> cache.set('c', b'12345')  # 'b' is the least recently used
+    >>> [cache.get(key) is None for key in ('a', 'b', 'c')]
+    [False, True, False]
+    >>> cache = LRUCache('disabled', max_size=0, directory=tmp_dir)
+    >>> cache.set('a', b'12345')
+    >>> cache.get('a') is None
+    True
+    >>> shutil.rmtree(tmp_dir)
+    """
+    def __init__(self, namespace, max_size=None, directory=None):
+        self.directory = os.path.join(directory or cache_dir(), namespace)
+        if max_size is None:
+            max_size = os.getenv('IOTLAB_CACHE_MAX_SIZE') or LRU_MAX_SIZE
+        self.max_size = int(max_size)
+
+    def path(self, key):
+        """ Path of the file storing `key` """
+        return os.path.join(self.directory, _hash(key))
+
+    def get(self, key):
+        """ Return bytes stored for `key` or None, and mark it as used """
+        if not self.max_size:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as _fd:
+                value = _fd.read()
+            _touch(path)
+            return value
+        except (IOError, OSError):
+            # missing or evicted concurrently
+            return None
+
+    def set(self, key, value):
+        """ Store bytes `value` for `key` and evict least recently used
+        values over `max_size`, nothing is stored if it is 0 """
+        if not self.max_size:
+            return
+        _makedirs(self.directory)
+        _fd, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                         prefix='.tmp')
+        with os.fdopen(_fd, 'wb') as tmp_file:
+            tmp_file.write(value)
+        _touch(tmp_path)
+        os.rename(tmp_path, self.path(key))
+        self._evict()
+
+    def _evict(self):
+        """ Remove least recently used values until size is under max_size
+        """
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+
+    def _entries(self):
+        """ Generate (mtime, size, path) for stored values """
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp'):  # being written
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:  # removed concurrently
+                continue
+            yield (stat.st_mtime, stat.st_size, path)
+
+
+def _touch(path):
+    """ Set `path` modification time to now, with sub-second precision """
+    now = time.time()
+    os.utime(path, (now, now))
+
+
+def _makedirs(path):
+    """ Create directory `path` and its parents if they do not exist """
+    try:
+        os.makedirs(path)
+    except OSError as err:
+        if err.errno != errno.EEXIST:  # pragma: no cover
+            raise
@@ -0,0 +1,148 @@
+# -*- coding:utf-8 -*-
+""" Deadlines for composite operations
+
+A `Deadline` is a total time budget, used as a context manager. While it is
+active in a thread, Api requests timeouts are bounded by its remaining time
+and waits are interrupted when it expires or when it is cancelled from
+another thread. Deadlines can be nested, the inner one ends at the latest
+with its parent.
+
+    >>> with Deadline(60) as deadline:
+    ...     current() is deadline, 0 < deadline.remaining() <= 60
+    (True, True)
+    >>> current() is None
+    True
+
+    >>> with Deadline(0.01):  # doctest: +IGNORE_EXCEPTION_DETAIL
+    ...     sleep(1)
+    Traceback (most recent call last):
+    DeadlineExceeded: Timeout reached
+"""
+
+import time
+import threading
+
+INFINITY = float('+inf')
+_LOCAL = threading.local()
+
+
+class DeadlineExceeded(RuntimeError):
+    """ Deadline expired or cancelled """
+    pass
+
+
+class Deadline(object):
+    """ Time budget of `timeout` seconds, infinite if None """
+    def __init__(self, timeout=None, parent=None):
+        self.parent = parent if parent is not None else current()
+        self.end = time.time() + (INFINITY if timeout is None else timeout)
+        if self.parent is not None:
+            self.end = min(self.end, self.parent.end)
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """ Cancel the deadline, may be called from another thread """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        """ Deadline or its parent was cancelled """
+        return self._cancelled.is_set() or (
+            self.parent is not None and self.parent.cancelled)
+
+    def remaining(self):
+        """ Return remaining time in seconds
+        :raises DeadlineExceeded: if cancelled or expired """
+        if self.cancelled:
+            raise DeadlineExceeded('Cancelled')
+        remaining = self.end - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded('Timeout reached')
+        return remaining
+
+    def sleep(self, seconds):
+        """ Sleep `seconds`, interrupted by cancellation
+        :raises DeadlineExceeded: if cancelled or expired before the end """
+        end = time.time() + seconds
+        while True:
+            remaining = end - time.time()
+            if remaining <= 0:
+                return
+            # wake up regularly to see parents cancellation
+            self._cancelled.wait(min(remaining, self.remaining(), 0.1))
+            self.remaining()
+
+    def timeout(self, timeout):
+        """ Return requests `timeout`, (connect, read) or seconds, bounded by
+        remaining time """
+        remaining = self.remaining()
+        if isinstance(timeout, tuple):
+            return tuple(_bounded(value, remaining) for value in timeout)
+        return _bounded(timeout, remaining)
+
+    def __enter__(self):
+        _stack().append(self)
+        return self
+
+    def __exit__(self, *_):
+        _stack().pop()
+
+
+def _bounded(timeout, remaining):
+    """ Return `timeout` bounded by `remaining`, None is no timeout
+
+    >>> _bounded(None, 5), _bounded(10, 5), _bounded(1, 5)
+    (5, 5, 1)
+    """
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def _stack():
+    """ Current thread active deadlines """
+    if not hasattr(_LOCAL, 'stack'):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+def current():
+    """ Return the deadline active in this thread, or None """
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def sleep(seconds):
+    """ Sleep `seconds`, bounded by the current deadline if any """
+    deadline = current()
+    if deadline is None:
+        time.sleep(seconds)
+    else:
+        deadline.sleep(seconds)
+
+
+def wait(event):
+    """ Wait for threading `event`, bounded by the current deadline if any
+    :raises DeadlineExceeded: if cancelled or expired before the event """
+    deadline = current()
+    while not event.is_set():
+        event.wait(None if deadline is None else
+                   min(deadline.remaining(), 0.1))
+
+
+def request_timeout(timeout):
+    """ Return requests `timeout` bounded by the current deadline if any """
+    deadline = current()
+    return timeout if deadline is None else deadline.timeout(timeout)
+
+
+def bind(function):
+    """ Return `function` running with the current deadline, to use it in
+    worker threads """
+    deadline = current()
+    if deadline is None:
+        return function
+
+    def _bound(*args, **kwargs):
+        """ Run `function` with deadline """
+        with deadline:
+            return function(*args, **kwargs)
+    return _bound
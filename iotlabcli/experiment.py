@@ -4,14 +4,20 @@
 from os.path import basename
 import json
 import time
+from iotlabcli import cache
+from iotlabcli import deadline
+from iotlabcli import firmware
 from iotlabcli import helpers
+from iotlabcli import resources as _resources
+from iotlabcli import selection
 
 # static name for experiment file : rename by server-rest
 EXP_FILENAME = 'new_exp.json'
 
 
 def submit_experiment(api, name, duration,  # pylint:disable=too-many-arguments
-                      resources, start_time=None, print_json=False):
+                      resources, start_time=None, print_json=False,
+                      validate=False):
     """ Submit user experiment with JSON Encoder serialization object
     Experiment and firmware(s). If submission is accepted by scheduler OAR
     we print JSONObject response with id submission.
@@ -20,23 +26,41 @@ def submit_experiment(api, name, duration,  # pylint:disable=too-many-arguments
     :param name: experiment name
     :param duration: experiment duration in seconds
     :param resources: list of 'exp_resources' which
+        nodes may be selected at submission with `selection.NodesPick`
     :param print_json: select if experiment should be printed as json instead
         of submitted
+    :param validate: check experiment against testbed resources before
+        submitting it, see `check_experiment`
     """
 
     assert resources, 'Empty resources: %r' % resources
-    experiment = _Experiment(name, duration, start_time)
+    resources = selection.resolve_picks(api, resources)
+    builder = ExperimentBuilder(name, duration, start_time)
 
-    exp_files = helpers.FilesDict()
     for res_dict in resources:
-        experiment.add_exp_resources(res_dict)
-        exp_files.add_firmware(res_dict.get('firmware', None))  # firmware
+        builder.add_resources(res_dict)
 
     if print_json:  # output experiment description
-        return experiment
+        return builder.experiment
+    preparation = builder.prepare_firmwares()
+    if validate:
+        # fetch resources while firmwares are read
+        _resources.get_resources(api)
+    exp_files = builder.files(preparation)
+    if validate:
+        check_experiment(api, builder.experiment, exp_files)
     # submit experiment
-    exp_files[EXP_FILENAME] = helpers.json_dumps(experiment)  # exp description
-    return api.submit_experiment(exp_files)
+    result = api.submit_experiment(exp_files)
+    _register_firmwares(api, result,
+                        (_fw.sha1 for _fw in preparation.get()))
+    return result
+
+
+def _register_firmwares(api, result, sha1s):
+    """ Record submitted experiment firmwares `sha1s` as uploaded, to
+    reference them when updating nodes, see firmware.FirmwareRegistry """
+    if 'id' in result:
+        firmware.FirmwareRegistry(api).add(result['id'], sha1s)
 
 
 def stop_experiment(api, exp_id):
@@ -69,8 +93,11 @@ def get_experiment(api, exp_id, option=''):
             * 'id':        resources id list: (1-34+72 format)
             * 'state':     experiment state
             * 'data':      experiment tar.gz with description and firmwares
+
+    Terminated or Error experiments never change, their results are kept in
+    the `cache.finished_cache` once their state or description was got.
     """
-    result = api.get_experiment_info(exp_id, option)
+    result = _get_experiment_info(api, exp_id, option)
     if option == 'data':
         _write_experiment_archive(exp_id, result)
         result = 'Written'
@@ -78,7 +105,50 @@ def get_experiment(api, exp_id, option=''):
     return result
 
 
-def load_experiment(api, exp_desc_path, firmware_list=()):
+def _get_experiment_info(api, exp_id, option):
+    """ Return experiment info from finished experiments cache or from api.
+    Experiment state is read from the result for the 'state' and ''
+    (description) options. Other results are only cached for experiments
+    already known as finished, no state is requested for them. """
+    finished = cache.finished_cache(api)
+    key = '%s?%s' % (exp_id, option)
+    content = finished.get(key)
+    if content is not None:
+        return content if option == 'data' else json.loads(
+            content.decode('utf-8'))
+
+    result = api.get_experiment_info(exp_id, option)
+    if option in ('', 'state'):
+        state = result.get('state')
+    else:
+        state = _cached_state(finished, exp_id)
+    if state in FINAL_STATES:
+        _cache_finished_info(finished, exp_id, option, state, result)
+    return result
+
+
+def _cached_state(finished, exp_id):
+    """ Experiment state from finished experiments cache or None """
+    content = finished.get('%s?state' % exp_id)
+    if content is None:
+        return None
+    return json.loads(content.decode('utf-8'))['state']
+
+
+def _cache_finished_info(finished, exp_id, option, state, result):
+    """ Store finished experiment `state` and `result` for `option`
+    Cache write errors are ignored, the result is only not cached """
+    content = result if option == 'data' else \
+        helpers.json_line(result).encode('utf-8')
+    state = helpers.json_line({'state': state}).encode('utf-8')
+    try:
+        finished.set('%s?state' % exp_id, state)
+        finished.set('%s?%s' % (exp_id, option), content)
+    except (IOError, OSError):
+        pass
+
+
+def load_experiment(api, exp_desc_path, firmware_list=(), validate=False):
     """ Load and submit user experiment description with firmware(s)
 
     Firmwares required for experiment will be loaded from current directory,
@@ -87,6 +157,8 @@ def load_experiment(api, exp_desc_path, firmware_list=()):
     :param api: API Rest api object
     :param exp_desc_path: path to experiment json description file
     :param firmware_list: list of firmware path
+    :param validate: check experiment against testbed resources before
+        submitting it, see `check_experiment`
     """
 
     # 1. load experiment description
@@ -112,22 +184,51 @@ def load_experiment(api, exp_desc_path, firmware_list=()):
             err, exp_desc_path))
     else:
         # Add all firmwares to the experiment files
-        for _fw_path in firmwares:
-            exp_files.add_firmware(_fw_path)
-    return api.submit_experiment(exp_files)
+        firmwares = firmware.prepare_firmwares(firmwares)
+        for _fw in firmwares:
+            exp_files[_fw.name] = _fw.content
+    if validate:
+        check_experiment(api, exp_dict, exp_files)
+    result = api.submit_experiment(exp_files)
+    _register_firmwares(api, result, (_fw.sha1 for _fw in firmwares))
+    return result
 
 
-def info_experiment(api, list_id=False, site=None):
+def info_experiment(api, list_id=False, site=None, archi=None, state=None):
     """ Print testbed information for user experiment submission:
     * resources description
     * resources description in short mode
 
+    When filtering on archi or state, the result is computed locally from
+    the cached resources index.
+
     :param api: API Rest api object
     :param list_id: By default, return full nodes list, if list_id
         return output in exp_list format '3-12+42'
     :param site: Restrict informations collection on site
+    :param archi: Restrict to archi, 'm3:at86rf231' or 'm3', comma separated
+    :param state: Restrict to nodes states, comma separated
     """
-    return api.get_resources(list_id, site)
+    if archi is None and state is None:
+        return api.get_resources(list_id, site)
+
+    index = _resources.ResourcesIndex.from_api(api)
+    if list_id:
+        return index.exp_list(site=site, archi=archi, state=state)
+    return {'items': index.filter(site=site, archi=archi, state=state)}
+
+
+def count_resources(api, site=None, archi=None, state=None):
+    """ Count testbed resources per site, node type and state, from the
+    cached resources index.
+
+    :param api: API Rest api object
+    :param site: Restrict to site, comma separated
+    :param archi: Restrict to archi, 'm3:at86rf231' or 'm3', comma separated
+    :param state: Restrict to nodes states, comma separated
+    """
+    index = _resources.ResourcesIndex.from_api(api)
+    return index.counts(site=site, archi=archi, state=state)
 
 
 def wait_experiment(api, exp_id, states='Running',
@@ -139,35 +240,231 @@ def wait_experiment(api, exp_id, states='Running',
     :param exp_id: scheduler OAR id submission
     :param states: Comma separated string of states to wait for
     :param step: time to wait between each server check
-    :param timeout: timeout if wait takes too long
+    :param timeout: timeout if wait takes too long, the current
+        `deadline.Deadline` also applies
+    :raises deadline.DeadlineExceeded: on timeout or cancellation
+    """
+
+    full_states = helpers.check_experiment_state(states + ',Terminated,Error')
+
+    with deadline.Deadline(timeout) as wait_deadline:
+        while True:
+            state = get_experiment(api, exp_id, 'state')['state']
+            if state not in full_states:
+                wait_deadline.sleep(step)
+                continue
+            if state in states:  # state was awaited
+                return state
+            # non wanted state, usually 'Terminated or Error'
+            raise RuntimeError("Experiment {0} already in state {1!r}".format(
+                exp_id, str(state)))
+
+
+# States of experiments listed by watch_experiments, others are final
+WATCH_STATES = helpers.OAR_STATES[:helpers.OAR_STATES.index('Terminated')]
+FINAL_STATES = ('Terminated', 'Error')
+
+
+def watch_experiments(api, exp_ids=None, step=5, timeout=float('+inf')):
+    """ Generate experiments state changes events
+
+    Experiments states are polled every `step` seconds, with one listing
+    request for all active experiments, and an event is generated for each
+    experiment when its state changes:
 
+        {'id': 123, 'state': 'Running', 'previous': 'Launching',
+         'time': 1400000000.0}
+
+    The first event of an experiment has a None 'previous' state.
+
+    :param api: API Rest api object
+    :param exp_ids: experiments ids to watch, watching stops when they are
+        all Terminated or in Error. If None, watch all user experiments.
+    :param step: time to wait between each server check
+    :param timeout: stop watching after `timeout` seconds
+    :raises deadline.DeadlineExceeded: on current deadline expiration or
+        cancellation
     """
+    end_time = time.time() + timeout
+    states = {}
+    finished = set()
+    while True:
+        watched = (set(exp_ids or ()) | set(states)) - finished
+        current = _watch_poll(api, exp_ids, watched)
+        now = time.time()
+        for exp_id, state in sorted(current.items()):
+            if states.get(exp_id) != state:
+                yield {'id': exp_id, 'state': state,
+                       'previous': states.get(exp_id), 'time': now}
+                states[exp_id] = state
+        finished.update(exp_id for exp_id, state in current.items()
+                        if state in FINAL_STATES)
+
+        if exp_ids and finished.issuperset(exp_ids) or \
+                time.time() + step >= end_time:
+            return
+        deadline.sleep(step)
 
-    start_time = time.time()
-    end_time = start_time + timeout
 
-    full_states = helpers.check_experiment_state(states + ',Terminated,Error')
+def _watch_poll(api, exp_ids, watched):
+    """ Return {exp_id: state} for active experiments in `exp_ids`, or all.
+    `watched` experiments not active anymore are requested individually """
+    exps = api.get_experiments(state=','.join(WATCH_STATES))['items']
+    current = dict((exp['id'], str(exp['state'])) for exp in exps
+                   if not exp_ids or exp['id'] in exp_ids)
+    for exp_id in watched - set(current):
+        current[exp_id] = str(get_experiment(api, exp_id, 'state')['state'])
+    return current
+
+
+# Nodes states where they cannot be used in an experiment
+UNAVAILABLE_STATES = ('Absent', 'Suspected', 'Dead')
+# archis allowed for AliasNodes
+ALIAS_ARCHIS = ['wsn430:cc1101', 'wsn430:cc2420',
+                'm3:at86rf231', 'a8:at86rf231']
 
-    while time.time() < end_time:  # timeout
-        state = get_experiment(api, exp_id, 'state')['state']
-        if state not in full_states:
-            time.sleep(step)
-            continue
-        if state in states:  # state was awaited
-            return state
-        # non wanted state, usually 'Terminated or Error'
-        raise RuntimeError(
-            "Experiment {0} already in state {1!r}".format(exp_id, str(state)))
 
-    raise RuntimeError("Timeout reached")
+def check_experiment(api, exp, exp_files=None):
+    """ Validate experiment before submitting it.
+
+    :raises ValueError: with all the errors found by `validate_experiment`
+    """
+    errors = validate_experiment(exp, exp_files,
+                                 _resources.get_resources(api))
+    if errors:
+        raise ValueError('Invalid experiment:\n  - ' + '\n  - '.join(errors))
+
+
+def validate_experiment(exp, exp_files, resources):
+    """ Check the whole experiment against testbed `resources` and return
+    the list of errors found.
+
+    It checks that:
+     * nodes are all physical or all alias
+     * physical nodes exist and are available
+     * alias archis exist on their site, with enough available nodes
+     * associations are on experiment nodes, and do not give several
+       firmwares or profiles to the same node
+     * associated firmwares are in `exp_files`
+
+    :param exp: _Experiment object or experiment description dict
+    :param exp_files: experiment files dict, firmwares not checked if None
+    :param resources: testbed resources, as returned by `get_resources`
+    """
+    desc = exp if isinstance(exp, dict) else exp.to_dict()
+    nodes = [_node_desc(node) for node in desc['nodes']]
+
+    errors = []
+    if desc['type'] == 'alias':
+        errors += _alias_nodes_errors(nodes, resources)
+    else:
+        errors += _physical_nodes_errors(nodes, resources)
+    errors += _assocs_errors(desc, nodes, 'firmware')
+    errors += _assocs_errors(desc, nodes, 'profile')
+    if exp_files is not None:
+        errors += ["Firmware '%s' not in experiment files" % name for name in
+                   _assocs_names(desc, 'firmware') if name not in exp_files]
+    return errors
+
+
+def _node_desc(node):
+    """ Return node url or alias description dict """
+    return node.to_dict() if isinstance(node, AliasNodes) else node
+
+
+def _physical_nodes_errors(nodes, resources):
+    """ Check physical nodes exist and are available """
+    errors = []
+    states = dict((res['network_address'], res['state'])
+                  for res in resources)
+    for node in nodes:
+        if isinstance(node, dict):
+            errors.append('Alias nodes in physical experiment: %r' % node)
+        elif node not in states:
+            errors.append("Unknown node '%s'" % node)
+        elif states[node] in UNAVAILABLE_STATES:
+            errors.append("Node '%s' is not available: '%s'" % (
+                node, states[node]))
+    return errors
+
+
+def _alias_nodes_errors(nodes, resources):
+    """ Check alias archi exist on site with enough available nodes """
+    errors = []
+    requested = {}
+    for node in nodes:
+        if not isinstance(node, dict):
+            errors.append("Physical node in alias experiment: '%s'" % node)
+            continue
+        props = node['properties']
+        if props['archi'] not in ALIAS_ARCHIS:
+            errors.append("Invalid archi '%s' for alias '%s'" % (
+                props['archi'], node['alias']))
+            continue
+        key = (props['site'], props['archi'], bool(props['mobile']))
+        requested[key] = requested.get(key, 0) + node['nbnodes']
+
+    available = _available_nodes_count(resources)
+    for (site, archi, mobile), count in sorted(requested.items()):
+        num = available.get((site, archi, mobile), 0)
+        if count > num:
+            errors.append(
+                "Not enough %s'%s' nodes on site '%s': %u requested, %u "
+                'available' % ('mobile ' if mobile else '', archi, site,
+                               count, num))
+    return errors
+
+
+def _available_nodes_count(resources):
+    """ Count available nodes per (site, archi, mobile) """
+    available = {}
+    for res in resources:
+        if res['state'] not in UNAVAILABLE_STATES:
+            key = (res['site'], res['archi'], bool(int(res['mobile'])))
+            available[key] = available.get(key, 0) + 1
+    return available
+
+
+def _assocs_names(desc, assoc_type):
+    """ Return associations names of `assoc_type` 'firmware' or 'profile' """
+    return [name for name, _ in _assocs(desc, assoc_type)]
+
+
+def _assocs(desc, assoc_type):
+    """ Return associations (name, nodes) of `assoc_type` """
+    name_key = assoc_type + 'name'
+    assocs = desc[assoc_type + 'associations'] or []
+    assocs = [assoc if isinstance(assoc, dict) else assoc.to_dict()
+              for assoc in assocs]
+    return [(assoc[name_key], assoc['nodes']) for assoc in assocs]
+
+
+def _assocs_errors(desc, nodes, assoc_type):
+    """ Check associations nodes are in experiment and only associated once
+    """
+    errors = []
+    exp_nodes = set(node['alias'] if isinstance(node, dict) else node
+                    for node in nodes)
+    associated = {}
+    for name, assoc_nodes in _assocs(desc, assoc_type):
+        for node in assoc_nodes:
+            if node not in exp_nodes:
+                errors.append("%s '%s' node '%s' not in experiment" % (
+                    assoc_type.title(), name, node))
+            elif associated.setdefault(node, name) != name:
+                errors.append("Node '%s' has several %ss: '%s' and '%s'" % (
+                    node, assoc_type, associated[node], name))
+    return errors
 
 
 def exp_resources(nodes, firmware_path=None, profile_name=None):
     """ Create an experiment dict
 
-    :param nodes: a list of nodes url or a AliasNodes object
+    :param nodes: a list of nodes url, a AliasNodes or a NodesPick object
         * ['m3-1.grenoble.iot-lab.info', 'wsn430-2.strasbourg.iot-lab.info']
         * AliasNodes(5, 'grenoble', 'm3:at86rf321', mobile=False)
+        * NodesPick(5, ['grenoble'], 'm3'), physical nodes selected when
+          submitting
     :param firmware_path: Firmware associated
     :param profile_name: Name of the profile associated
 
@@ -187,7 +484,91 @@ def exp_resources(nodes, firmware_path=None, profile_name=None):
     return exp_dict
 
 
-class AliasNodes(object):  # pylint: disable=too-few-public-methods
+class ExperimentBuilder(object):
+    """ Build an experiment incrementally and submit it.
+
+    With `submit`, experiment description and firmwares are written to the
+    upload stream while being serialized/read, and never fully copied in
+    memory.
+
+    >>> builder = ExperimentBuilder('exp_name', 20)
+    >>> builder.add(['m3-1.grenoble.iot-lab.info'], profile_name='prof')
+    >>> builder.add(['m3-2.grenoble.iot-lab.info'])
+    >>> builder.experiment.nodes
+    ['m3-1.grenoble.iot-lab.info', 'm3-2.grenoble.iot-lab.info']
+    """
+    def __init__(self, name, duration, start_time=None):
+        """
+        :param name: experiment name
+        :param duration: experiment duration in minutes
+        :param start_time: experiment start time, seconds since 1970
+        """
+        self.experiment = _Experiment(name, duration, start_time)
+        self.firmwares = helpers.FilesDict()
+
+    def add_resources(self, exp_dict):
+        """ Add an 'exp_resources' dict to the experiment
+
+        :raises ValueError: for `selection.NodesPick` nodes, they should be
+            selected first with `selection.resolve_picks`
+        """
+        if isinstance(exp_dict['nodes'], selection.NodesPick):
+            raise ValueError('Nodes %r should be selected first, '
+                             'see selection.resolve_picks' %
+                             (exp_dict['nodes'],))
+        self.experiment.add_exp_resources(exp_dict)
+
+        firmware_path = exp_dict.get('firmware', None)
+        if firmware_path is not None:
+            self.firmwares[basename(firmware_path)] = helpers.FileContent(
+                firmware_path)
+
+    def add(self, nodes, firmware_path=None, profile_name=None):
+        """ Add nodes with firmware and profile, see `exp_resources` """
+        self.add_resources(exp_resources(nodes, firmware_path, profile_name))
+
+    def prepare_firmwares(self):
+        """ Start reading and checking firmwares in background
+        :returns: firmware.FirmwaresPreparation """
+        return firmware.FirmwaresPreparation(
+            [content.path for content in self.firmwares.values()])
+
+    def files(self, preparation=None):
+        """ Return experiment files with description and firmwares content
+
+        :param preparation: firmwares preparation, started if None
+        :raises ValueError: for missing or corrupted firmwares
+        """
+        preparation = preparation or self.prepare_firmwares()
+        exp_files = helpers.FilesDict()
+        for _fw in preparation.get():
+            exp_files[_fw.name] = _fw.content
+        exp_files[EXP_FILENAME] = helpers.json_dumps(self.experiment)
+        return exp_files
+
+    def multipart_body(self):
+        """ Return experiment files as a streamed multipart body """
+        exp_files = helpers.FilesDict()
+        exp_files[EXP_FILENAME] = helpers.JsonContent(self.experiment)
+        exp_files.update(self.firmwares)
+        return helpers.MultipartBody(exp_files)
+
+    def submit(self, api):
+        """ Submit the experiment, streaming its description and firmwares
+
+        :param api: API Rest api object
+        """
+        assert self.experiment.nodes, 'Empty experiment'
+        result = api.submit_experiment(self.multipart_body())
+        # streamed firmwares are only hashed if references are enabled
+        _register_firmwares(api, result, (
+            firmware.file_sha1(content.path)
+            for content in self.firmwares.values()))
+        return result
+
+
+class AliasNodes(helpers.Serializable):
+    # pylint: disable=too-few-public-methods
     """An AliasNodes class
 
     >>> AliasNodes(5, 'grenoble', 'm3:at86rf231', False)
@@ -205,9 +586,9 @@ class AliasNodes(object):  # pylint: disable=too-few-public-methods
 'm3:at86rf231', 'a8:at86rf231']
 
     """
+    __slots__ = _fields = ('alias', 'nbnodes', 'properties')
     _alias = 0  # static count of current alias number
-    _archis = ['wsn430:cc1101', 'wsn430:cc2420',
-               'm3:at86rf231', 'a8:at86rf231']
+    _archis = ALIAS_ARCHIS
 
     def __init__(self, nbnodes, site, archi, mobile=False, _alias=None):
         """
@@ -239,16 +620,14 @@ class AliasNodes(object):  # pylint: disable=too-few-public-methods
             self.nbnodes, self.properties['site'], self.properties['archi'],
             self.properties['mobile'], self.alias)
 
-    def __eq__(self, other):  # pragma: no cover
-        return self.__dict__ == other.__dict__
-
 
 #
 # Private methods
 #
 
 
-class _FirmwareAssociations(object):  # pylint: disable=too-few-public-methods
+class _FirmwareAssociations(helpers.Serializable):
+    # pylint: disable=too-few-public-methods
     """A _FirmwareAssociations class
 
     >>> fw = _FirmwareAssociations('name', ['3'])
@@ -257,6 +636,8 @@ class _FirmwareAssociations(object):  # pylint: disable=too-few-public-methods
     >>> fw == {'firmwarename': 'name', 'nodes':['3']}
     False
     """
+    __slots__ = _fields = ('firmwarename', 'nodes')
+
     def __init__(self, firmwarename, nodes):
         self.firmwarename = firmwarename
         self.nodes = nodes
@@ -266,7 +647,8 @@ class _FirmwareAssociations(object):  # pylint: disable=too-few-public-methods
                 self.firmwarename == other.firmwarename)
 
 
-class _ProfileAssociations(object):  # pylint: disable=too-few-public-methods
+class _ProfileAssociations(helpers.Serializable):
+    # pylint: disable=too-few-public-methods
     """A _ProfileAssociations class
 
     # coverage
@@ -277,6 +659,8 @@ class _ProfileAssociations(object):  # pylint: disable=too-few-public-methods
     False
 
     """
+    __slots__ = _fields = ('profilename', 'nodes')
+
     def __init__(self, profilename, nodes):
         self.profilename = profilename
         self.nodes = nodes
@@ -286,8 +670,11 @@ class _ProfileAssociations(object):  # pylint: disable=too-few-public-methods
                 self.profilename == other.profilename)
 
 
-class _Experiment(object):
+class _Experiment(helpers.Serializable):
     """ Class describing an experiment """
+    __slots__ = _fields = ('duration', 'reservation', 'name', 'type', 'nodes',
+                           'firmwareassociations', 'profileassociations')
+
     def __init__(self, name, duration, start_time=None):
         self.duration = duration
         self.reservation = start_time
@@ -318,9 +705,9 @@ class _Experiment(object):
 
             cur_assoc = l_l.pop(l_l.index(assoc))
             # Add nodes to the list, uniq
-            nodes = list(set(cur_assoc.nodes + assoc.nodes))
             # keep sorted to ease tests and readability
-            assoc.nodes = sorted(nodes, key=helpers.node_url_sort_key)
+            assoc.nodes = helpers.sorted_nodes_union(cur_assoc.nodes,
+                                                     assoc.nodes)
 
         l_l.append(assoc)
         return l_l
@@ -371,10 +758,8 @@ class _Experiment(object):
         """Set physical nodes list """
         self._set_type('physical')
 
-        self.nodes.extend(nodes_list)
         # Keep unique values and sorted
-        self.nodes = sorted(list(set(self.nodes)),
-                            key=helpers.node_url_sort_key)
+        self.nodes = helpers.sorted_nodes_union(self.nodes, nodes_list)
 
     def set_alias_nodes(self, alias_nodes):
         """Set alias nodes list """
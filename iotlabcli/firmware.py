@@ -0,0 +1,202 @@
+# -*- coding:utf-8 -*-
+""" Firmwares preparation before upload
+
+Firmwares are read, hashed and their format checked concurrently in a
+thread pool, so missing or corrupted files are reported before uploading
+anything, and slow filesystems reads are overlapped.
+
+Firmwares already sent to an experiment are recorded, by content hash, in
+a `FirmwareRegistry` so they can be referenced instead of uploaded again.
+The server may not support references, so they are only used when the
+IOTLAB_FIRMWARE_REFERENCE environment variable is set.
+"""
+
+import os
+import hashlib
+import binascii
+from multiprocessing.pool import ThreadPool
+
+from iotlabcli import cache
+from iotlabcli import helpers
+
+FIRMWARE_JOBS = 8
+# reference uploaded firmwares in nodes updates instead of uploading them
+FIRMWARE_REFERENCE = bool(os.getenv('IOTLAB_FIRMWARE_REFERENCE'))
+# experiments firmwares records are forgotten after a week
+REGISTRY_MAX_AGE = 7 * 24 * 3600
+# references are tried again a day after the server did not support them
+REFERENCE_UNSUPPORTED_MAX_AGE = 24 * 3600
+ELF_MAGIC = b'\x7fELF'
+# ELF header size by ELF class, 32 or 64 bits
+ELF_HEADER_SIZE = {1: 52, 2: 64}
+
+
+class Firmware(object):  # pylint:disable=too-few-public-methods
+    """ Firmware file content, hash and format ('elf', 'hex' or None) """
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.content = helpers.read_file(path, 'b')
+        data = _bytes(self.content)
+        self.sha1 = hashlib.sha1(data).hexdigest()
+        self.format = sniff_format(data)
+
+    def __repr__(self):
+        return 'Firmware(%r, format=%r, sha1=%r)' % (self.path, self.format,
+                                                     self.sha1)
+
+
+def sniff_format(data):
+    """ Return firmware format detected from its content
+    :raises ValueError: when content looks like a corrupted elf or hex file
+
+    >>> sniff_format(b'\\x7fELF\\x01\\x01' + 46 * b'\\x00')
+    'elf'
+    >>> sniff_format(b':0100000001FE\\n:00000001FF\\n')
+    'hex'
+    >>> sniff_format(b'raw binary') is None
+    True
+
+    >>> sniff_format(b'\\x7fELF\\x02\\x01' + 46 * b'\\x00')
+    Traceback (most recent call last):
+    ValueError: Truncated elf header
+    >>> sniff_format(b':0100000001FF\\n:00000001FF\\n')
+    Traceback (most recent call last):
+    ValueError: Invalid hex record line 1: invalid checksum
+    """
+    if data.startswith(ELF_MAGIC):
+        _check_elf(data)
+        return 'elf'
+    if data.startswith(b':'):
+        _check_hex(data)
+        return 'hex'
+    return None
+
+
+def _check_elf(data):
+    """ Check elf header """
+    elf_class, elf_data = bytearray(data[4:6].ljust(2, b'\x00'))
+    if elf_class not in ELF_HEADER_SIZE or elf_data not in (1, 2):
+        raise ValueError('Invalid elf header')
+    if len(data) < ELF_HEADER_SIZE[elf_class]:
+        raise ValueError('Truncated elf header')
+
+
+def _check_hex(data):
+    """ Check Intel hex records and end of file record """
+    record_type = None
+    for num, line in enumerate(data.splitlines(), 1):
+        line = line.strip()
+        if line:
+            record_type = _hex_record(line, num)[3]
+    if record_type != 1:
+        raise ValueError('Missing hex end of file record')
+
+
+def _hex_record(line, num):
+    """ Decode and check Intel hex record `line` """
+    try:
+        record = bytearray(binascii.unhexlify(line[1:]))
+    except (TypeError, ValueError, binascii.Error):
+        record = None
+    if not line.startswith(b':') or record is None or len(record) < 5 or \
+            len(record) != record[0] + 5:
+        raise ValueError('Invalid hex record line %u' % num)
+    if sum(record) & 0xff:
+        raise ValueError('Invalid hex record line %u: invalid checksum' % num)
+    return record
+
+
+def _bytes(content):
+    """ Content as bytes """
+    return content if isinstance(content, bytes) else content.encode('utf-8')
+
+
+def file_sha1(path):
+    """ Return file `path` content sha1, like Firmware.sha1 """
+    return hashlib.sha1(_bytes(helpers.read_file(path, 'b'))).hexdigest()
+
+
+def _prepare(path):
+    """ Return Firmware for path, or an error message """
+    try:
+        return Firmware(path)
+    except (IOError, OSError) as err:
+        return 'Firmware %r: %s' % (path, err.strerror or err)
+    except ValueError as err:
+        return 'Firmware %r: %s' % (path, err)
+
+
+class FirmwaresPreparation(object):  # pylint:disable=too-few-public-methods
+    """ Firmwares prepared in background with `jobs` threads.
+    Results are returned by `get` """
+    def __init__(self, paths, jobs=FIRMWARE_JOBS):
+        paths = sorted(set(paths))
+        self._pool = ThreadPool(max(1, min(jobs, len(paths))))
+        self._result = self._pool.map_async(_prepare, paths)
+        self._pool.close()
+
+    def get(self):
+        """ Wait for preparation and return the Firmware objects list
+        :raises ValueError: with all firmwares errors """
+        firmwares = self._result.get()
+        self._pool.join()
+        errors = [fw for fw in firmwares if not isinstance(fw, Firmware)]
+        if errors:
+            raise ValueError('Invalid firmwares:\n  - ' +
+                             '\n  - '.join(errors))
+        return firmwares
+
+
+def prepare_firmwares(paths, jobs=FIRMWARE_JOBS):
+    """ Read and check firmwares concurrently
+    :returns: Firmware objects list, sorted by path
+    :raises ValueError: with all firmwares errors """
+    return FirmwaresPreparation(paths, jobs).get()
+
+
+class FirmwareRegistry(object):
+    """ Firmwares sha1 uploaded per experiment, stored in api disk cache
+
+    The registry also remembers, for REFERENCE_UNSUPPORTED_MAX_AGE, if the
+    server does not support updating nodes with a firmware reference.
+    Nothing is recorded when references are disabled, see `enabled`. """
+    def __init__(self, api):
+        self._cache = cache.api_cache(api)
+
+    @property
+    def enabled(self):
+        """ Firmware references are enabled with FIRMWARE_REFERENCE """
+        return FIRMWARE_REFERENCE
+
+    def uploaded(self, exp_id):
+        """ Return the sha1 list of firmwares uploaded for `exp_id` """
+        return self._cache.get('firmwares/%s' % exp_id,
+                               max_age=REGISTRY_MAX_AGE) or []
+
+    def add(self, exp_id, sha1s):
+        """ Record firmwares `sha1s` as uploaded for `exp_id`, `sha1s` is
+        not iterated when references are disabled """
+        if not self.enabled:
+            return
+        uploaded = self.uploaded(exp_id)
+        self._cache.set('firmwares/%s' % exp_id,
+                        uploaded + [sha1 for sha1 in sha1s
+                                    if sha1 not in uploaded])
+
+    def discard(self, exp_id, sha1):
+        """ Forget firmware `sha1` for `exp_id` """
+        self._cache.set('firmwares/%s' % exp_id,
+                        [fw for fw in self.uploaded(exp_id) if fw != sha1])
+
+    @property
+    def reference_supported(self):
+        """ References are enabled and the server was not recorded as not
+        supporting them """
+        return self.enabled and self._cache.get(
+            'firmwares_reference', max_age=REFERENCE_UNSUPPORTED_MAX_AGE) \
+            is not False
+
+    def reference_unsupported(self):
+        """ Record that the server does not support firmware references """
+        self._cache.set('firmwares_reference', False)
@@ -1,8 +1,12 @@
 # -*- coding:utf-8 -*-
 """Helpers methods"""
 
+import io
 import os
 import json
+import itertools
+import uuid
+import zlib
 
 OAR_STATES = ["Waiting", "toLaunch", "Launching",
               "Running",
@@ -91,6 +95,11 @@ def get_current_exp(exp_by_states, states):
     raise ValueError("You have no {0!r} experiment".format(states_str))
 
 
+# Parsed nodes identities, by node url
+_NODES_KEYS = {}
+NODES_KEYS_MAX = 100000
+
+
 def node_url_sort_key(node_url):
     """
     >>> node_url_sort_key("m3-2.grenoble.iot-lab.info")
@@ -105,12 +114,251 @@ def node_url_sort_key(node_url):
     ('grenoble', 'node-a8', 2)
 
     """
+    try:
+        return _NODES_KEYS[node_url]
+    except KeyError:
+        pass
+
     if node_url.isdigit():
-        return int(node_url)
-    _node, site = node_url.split('.')[0:2]
+        key = int(node_url)
+    else:
+        _node, site = node_url.split('.')[0:2]
+        node_type, num_str = _node.rsplit('-', 1)
+        key = (site, node_type, int(num_str))
+    set_node_url_sort_key(node_url, key)
+    return key
+
+
+def set_node_url_sort_key(node_url, key):
+    """ Register the (site, node_type, num) identity of `node_url`, so it
+    does not have to be parsed by node_url_sort_key """
+    if len(_NODES_KEYS) >= NODES_KEYS_MAX:
+        _NODES_KEYS.clear()
+    _NODES_KEYS[node_url] = key
+
+
+def sorted_nodes_union(nodes, new_nodes):
+    """ Return unique nodes from `nodes` and `new_nodes` sorted with
+    node_url_sort_key.
+    Sorting is linear when both lists are already sorted.
+
+    >>> sorted_nodes_union(['m3-1.grenoble.iot-lab.info', \
+'m3-3.grenoble.iot-lab.info'], ['m3-2.grenoble.iot-lab.info', \
+'m3-3.grenoble.iot-lab.info'])  # doctest: +NORMALIZE_WHITESPACE
+    ['m3-1.grenoble.iot-lab.info', 'm3-2.grenoble.iot-lab.info',
+     'm3-3.grenoble.iot-lab.info']
+    """
+    known = set(nodes)
+    if len(known) != len(nodes):
+        nodes = list(known)
+    new_nodes = [node for node in new_nodes if node not in known]
+    # keep given order for sorted runs detection
+    return sorted(nodes + _unique(new_nodes), key=node_url_sort_key)
+
+
+def _unique(values):
+    """ Remove duplicates in values list keeping order
+
+    >>> _unique([3, 1, 3, 2, 1])
+    [3, 1, 2]
+    """
+    if len(set(values)) == len(values):
+        return values
+    seen = set()
+    return [val for val in values if not (val in seen or seen.add(val))]
+
+
+def exp_list_ranges(nodes_str):
+    """ Parse a short nodes list '1-5+6+8-12' to a list of (first, last)
+    ranges, without expanding it. Ranges are kept in given order.
 
-    node_type, num_str = _node.rsplit('-', 1)
-    return site, node_type, int(num_str)
+    >>> exp_list_ranges('1-34+72+40-41')
+    [(1, 34), (72, 72), (40, 41)]
+
+    >>> exp_list_ranges('3-3')
+    Traceback (most recent call last):
+    ValueError: Invalid nodes list: 3-3 ([0-9+-])
+
+    >>> exp_list_ranges('1-4-5')
+    Traceback (most recent call last):
+    ValueError: Invalid nodes list: 1-4-5 ([0-9+-])
+    """
+    ranges = []
+    try:
+        for minus_str in nodes_str.split('+'):
+            # ['6'] or ['1', '4']
+            bounds = [int(num) for num in minus_str.split('-')]
+            first, last = bounds[0], bounds[-1]
+            # invalid: 6-3 or 3-3 or 6-7-8
+            if len(bounds) > 2 or (len(bounds) == 2 and first >= last):
+                raise ValueError
+            ranges.append((first, last))
+    except ValueError:
+        raise ValueError('Invalid nodes list: %s ([0-9+-])' % nodes_str)
+    return ranges
+
+
+def merge_ranges(ranges):
+    """ Sort and merge overlapping or contiguous (first, last) ranges
+
+    >>> merge_ranges([(5, 8), (1, 3), (4, 4), (7, 10), (12, 12)])
+    [(1, 10), (12, 12)]
+    """
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def ranges_length(ranges):
+    """ Number of ids in (first, last) ranges
+
+    >>> ranges_length([(1, 34), (72, 72)])
+    35
+    """
+    return sum(last - first + 1 for first, last in ranges)
+
+
+def exp_list_str(ranges):
+    """ Format (first, last) ranges to short nodes list '1-5+6+8-12'
+
+    >>> exp_list_str([(1, 34), (72, 72)])
+    '1-34+72'
+    """
+    return '+'.join(('%u' % first) if first == last else
+                    ('%u-%u' % (first, last)) for first, last in ranges)
+
+
+def ids_ranges(ids):
+    """ Compact an iterable of node ids to sorted (first, last) ranges
+
+    >>> ids_ranges([8, 3, 1, 2, 7, 2, 10])
+    [(1, 3), (7, 8), (10, 10)]
+    """
+    ranges = []
+    for num in sorted(set(ids)):
+        if ranges and ranges[-1][1] == num - 1:
+            ranges[-1][1] = num
+        else:
+            ranges.append([num, num])
+    return [(first, last) for first, last in ranges]
+
+
+class NodesRanges(object):
+    """ Nodes list lazily expanded from (first, last) `ranges` of numbers,
+    formatted with `fmt`. Length, membership and indexing do not expand it.
+
+    :param fmt: node format like 'm3-%u', nodes are numbers if None
+    :param key: (site, node_type) registered as nodes sort keys prefix
+
+    >>> nodes = NodesRanges([(1, 3), (7, 7)], 'm3-%u')
+    >>> len(nodes), nodes[3], nodes[-2], 'm3-2' in nodes, 'm3-5' in nodes
+    (4, 'm3-7', 'm3-3', True, False)
+    >>> 'm3-02' in nodes
+    False
+    >>> nodes == ['m3-1', 'm3-2', 'm3-3', 'm3-7'], nodes
+    (True, NodesRanges('1-3+7', 'm3-%u'))
+    >>> list(NodesRanges([(1, 2)])), 1 in NodesRanges([(1, 2)])
+    ([1, 2], True)
+    """
+    __slots__ = ('ranges', 'fmt', 'key', '_affixes')
+
+    def __init__(self, ranges, fmt=None, key=None):
+        self.ranges = ranges
+        self.fmt = fmt
+        self.key = key
+        # (prefix, suffix) around node number
+        self._affixes = None if fmt is None else tuple(fmt.split('%u'))
+
+    def __len__(self):
+        return ranges_length(self.ranges)
+
+    def __iter__(self):
+        if self.fmt is None:
+            return itertools.chain.from_iterable(
+                itertools.islice(itertools.count(first), last - first + 1)
+                for first, last in self.ranges)
+        return (self._node(num) for num in NodesRanges(self.ranges))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        for first, last in self.ranges:
+            if 0 <= index <= last - first:
+                return first + index if self.fmt is None else \
+                    self._node(first + index)
+            index -= last - first + 1
+        raise IndexError('nodes index out of range')
+
+    def __contains__(self, node):
+        num = self._number(node)
+        return num is not None and any(first <= num <= last
+                                       for first, last in self.ranges)
+
+    def __eq__(self, other):
+        if not isinstance(other, (NodesRanges, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'NodesRanges(%r, %r)' % (exp_list_str(self.ranges), self.fmt)
+
+    def _node(self, num):
+        """ Node for `num`, its sort key is registered """
+        node = self.fmt % num
+        if self.key is not None:
+            set_node_url_sort_key(node, self.key + (num,))
+        return node
+
+    def _number(self, node):
+        """ Number of `node` if it matches fmt, else None """
+        if self._affixes is None:
+            return node if isinstance(node, int) else None
+        prefix, suffix = self._affixes
+        try:
+            if not (node.startswith(prefix) and node.endswith(suffix)):
+                return None
+        except AttributeError:  # not a string
+            return None
+        num = node[len(prefix):len(node) - len(suffix)]
+        # formatted numbers are not zero padded
+        if not num.isdigit() or str(int(num)) != num:
+            return None
+        return int(num)
+
+
+def compact_nodes_list(nodes):
+    """ Compact a list of nodes hostnames to the 'exp_list' format, as
+    returned by the server for resources id lists.
+
+    >>> compact_nodes_list(['m3-2.grenoble.iot-lab.info', \
+'m3-1.grenoble.iot-lab.info', 'm3-3.grenoble.iot-lab.info', \
+'m3-7.grenoble.iot-lab.info', 'a8-1.strasbourg.iot-lab.info']) \
+== {'grenoble': {'m3': '1-3+7'}, 'strasbourg': {'a8': '1'}}
+    True
+
+    >>> compact_nodes_list([])
+    {}
+    """
+    ids = {}
+    for node in nodes:
+        site, node_type, num = node_url_sort_key(node)
+        ids.setdefault(site, {}).setdefault(node_type, []).append(num)
+
+    return dict((site, dict((node_type, exp_list_str(ids_ranges(nums)))
+                            for node_type, nums in types.items()))
+                for site, types in ids.items())
 
 
 class FilesDict(dict):  # pylint: disable=too-few-public-methods
@@ -201,10 +449,222 @@ def check_experiment_state(state_str=None):
     return state_str
 
 
+class Serializable(object):
+    """ Base class for model objects stored in `__slots__` and serialized as
+    json objects of their `_fields`
+
+    >>> class Point(Serializable):
+    ...     __slots__ = _fields = ('x', 'y')
+    ...     def __init__(self, x, y):
+    ...         self.x, self.y = x, y
+    >>> Point(1, 2).to_dict() == {'x': 1, 'y': 2}
+    True
+    >>> Point(1, 2) == Point(1, 2), Point(1, 2) != Point(1, 3)
+    (True, True)
+    """
+    __slots__ = ()
+    _fields = ()
+
+    def to_dict(self):
+        """ Return object attributes as a dict """
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+    def __eq__(self, other):
+        return (isinstance(other, self.__class__) and
+                self.to_dict() == other.to_dict())
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class _Encoder(json.JSONEncoder):  # pylint: disable=too-few-public-methods
+    """ Encoder for serialization object python to JSON format """
+    def default(self, obj):  # pylint: disable=method-hidden
+        if isinstance(obj, NodesRanges):
+            return list(obj)
+        try:
+            return obj.to_dict()
+        except AttributeError:
+            return obj.__dict__
+
+
 def json_dumps(obj):
     """ Dumps data to json """
-    class _Encoder(json.JSONEncoder):  # pylint: disable=too-few-public-methods
-        """ Encoder for serialization object python to JSON format """
-        def default(self, obj):  # pylint: disable=method-hidden
-            return obj.__dict__
     return json.dumps(obj, cls=_Encoder, sort_keys=True, indent=4)
+
+
+def json_line(obj):
+    """ Dumps data to json on a single line
+
+    >>> print(json_line({'state': 'Running', 'id': 123}))
+    {"id": 123, "state": "Running"}
+    """
+    return json.dumps(obj, cls=_Encoder, sort_keys=True)
+
+
+def json_iterencode(obj):
+    """ Iterate over the chunks of json_dumps(obj) output
+
+    >>> ''.join(json_iterencode({'a': [1, 2]})) == json_dumps({'a': [1, 2]})
+    True
+    """
+    return _Encoder(sort_keys=True, indent=4).iterencode(obj)
+
+
+class JsonContent(object):
+    """ Streamed json_dumps(obj) content, encoded as utf-8
+
+    >>> content = JsonContent({'a': 1})
+    >>> len(content) == len(json_dumps({'a': 1}))
+    True
+    >>> b''.join(content) == json_dumps({'a': 1}).encode('utf-8')
+    True
+    """
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __iter__(self):
+        for chunk in json_iterencode(self.obj):
+            yield chunk.encode('utf-8')
+
+    def __len__(self):
+        # output is ascii only so chunks length is their encoded length
+        return sum(len(chunk) for chunk in json_iterencode(self.obj))
+
+
+class FileContent(object):
+    """ Streamed file content, read by chunks when iterated """
+    chunk_size = 65536
+
+    def __init__(self, file_path):
+        self.path = os.path.expanduser(file_path)
+
+    def __iter__(self):
+        with open(self.path, 'rb') as _fd:
+            chunk = _fd.read(self.chunk_size)
+            while chunk:
+                yield chunk
+                chunk = _fd.read(self.chunk_size)
+
+    def __len__(self):
+        return os.path.getsize(self.path)
+
+    def __eq__(self, other):
+        if not isinstance(other, FileContent):
+            return False
+        return (os.path.abspath(self.path) == os.path.abspath(other.path) or
+                read_file(self.path, 'b') == read_file(other.path, 'b'))
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class MultipartBody(object):
+    """ File-like 'multipart/form-data' body for `files`.
+    Values may be bytes, text or streamed contents (JsonContent,
+    FileContent), which are only read while the body is read.
+
+    >>> body = MultipartBody({'a.json': JsonContent([1])}, boundary='xx')
+    >>> body.content_type
+    'multipart/form-data; boundary=xx'
+    >>> body.read() == (b'--xx\\r\\nContent-Disposition: form-data; '
+    ...                 b'name="a.json"; filename="a.json"\\r\\n\\r\\n'
+    ...                 b'[\\n    1\\n]\\r\\n--xx--\\r\\n')
+    True
+    >>> len(body) == len(b''.join(body))
+    True
+    """
+    def __init__(self, files, boundary=None):
+        self.files = files
+        self.boundary = boundary or uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+        self.headers = {'content-type': self.content_type}
+        self._chunks = None
+        self._buffer = b''
+
+    def _part_header(self, name):
+        """ Multipart header for file `name` """
+        return ('--{0}\r\nContent-Disposition: form-data; name="{1}"; '
+                'filename="{1}"\r\n\r\n'.format(self.boundary, name)
+                ).encode('utf-8')
+
+    def _footer(self):
+        """ Multipart closing boundary """
+        return '--{0}--\r\n'.format(self.boundary).encode('utf-8')
+
+    def __iter__(self):
+        for name, content in self.files.items():
+            yield self._part_header(name)
+            for chunk in _iter_content(content):
+                yield chunk
+            yield b'\r\n'
+        yield self._footer()
+
+    def __len__(self):
+        length = len(self._footer())
+        for name, content in self.files.items():
+            length += len(self._part_header(name))
+            length += len(_encode(content)) if _is_string(content) else \
+                len(content)
+            length += len(b'\r\n')
+        return length
+
+    def read(self, size=-1):
+        """ Read up to `size` bytes of the body, everything if negative """
+        if self._chunks is None:
+            self._chunks = iter(self)
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class CompressedBody(io.BytesIO):
+    """ Request `body` compressed with `encoding` 'gzip' or 'deflate'.
+    `headers` are the body headers with the content-encoding.
+
+    >>> body = MultipartBody({'a.hex': ':00000001FF' * 100}, boundary='xx')
+    >>> compressed = CompressedBody(body, 'gzip')
+    >>> len(compressed) < len(body)
+    True
+    >>> sorted(compressed.headers.items())
+    [('content-encoding', 'gzip'), \
+('content-type', 'multipart/form-data; boundary=xx')]
+    >>> zlib.decompress(compressed.read(), 16 + zlib.MAX_WBITS) == body.read()
+    True
+    """
+    # zlib wbits for each encoding, 'deflate' is the zlib format
+    WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+    def __init__(self, body, encoding):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, self.WBITS[encoding])
+        data = b''.join([compressor.compress(chunk) for chunk in body] +
+                        [compressor.flush()])
+        io.BytesIO.__init__(self, data)
+        self.headers = dict(body.headers)
+        self.headers['content-encoding'] = encoding
+
+    def __len__(self):
+        return len(self.getvalue())
+
+
+def _is_string(value):
+    """ Value is text or bytes """
+    return isinstance(value, bytes) or hasattr(value, 'encode')
+
+
+def _encode(value):
+    """ Encode text values to utf-8 """
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+def _iter_content(content):
+    """ Iterate over content bytes chunks """
+    if _is_string(content):
+        return iter([_encode(content)])
+    return iter(content)
@@ -0,0 +1,241 @@
+# -*- coding:utf-8 -*-
+""" Local queue of experiments to submit
+
+Experiments specs are stored in a sqlite database, and submitted later with
+bounded concurrency. Each job records its state and the submitted experiment
+id, so an interrupted run can be resumed without submitting twice.
+
+Experiment names are the jobs keys. Each job also gets a unique tag, added to
+the submitted experiment name as '<name>-<tag>': a job interrupted while
+being submitted is looked for by tagged name in the user experiments before
+being submitted again, so past experiments with the same name are ignored.
+
+    >>> import tempfile, shutil
+    >>> tmp_dir = tempfile.mkdtemp()
+    >>> queue = JobQueue(os.path.join(tmp_dir, 'jobs.db'))
+    >>> queue.add('exp_1', 20, [experiment.exp_resources(
+    ...     experiment.AliasNodes(2, 'grenoble', 'm3:at86rf231'))])
+    >>> [(job['name'], job['state']) for job in queue.jobs()] == [
+    ...     ('exp_1', 'queued')]
+    True
+    >>> queue.close(); shutil.rmtree(tmp_dir)
+"""
+
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from multiprocessing.pool import ThreadPool
+
+from iotlabcli import deadline
+from iotlabcli import experiment
+from iotlabcli import helpers
+from iotlabcli import selection
+
+JOBS_DB = (os.getenv('IOTLAB_JOBS_DB') or
+           os.path.join(os.path.expanduser('~'), '.iotlab-jobs.db'))
+SUBMIT_JOBS = 4
+# user experiments page size when looking for interrupted jobs
+RECOVER_PAGE = 100
+
+# jobs states
+QUEUED = 'queued'
+SUBMITTING = 'submitting'
+SUBMITTED = 'submitted'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    spec TEXT NOT NULL,
+    state TEXT NOT NULL,
+    exp_id INTEGER,
+    error TEXT,
+    tag TEXT NOT NULL
+)"""
+
+
+class JobQueue(object):
+    """ Experiments submission queue stored in sqlite database `path` """
+    def __init__(self, path=None):
+        self.path = path or JOBS_DB
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.expanduser(self.path),
+                                   check_same_thread=False)
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        """ Close the database """
+        self._db.close()
+
+    def add(self, name, duration, resources, start_time=None):
+        """ Queue experiment, arguments are the `submit_experiment` ones
+
+        :param name: experiment name, unique in the queue
+        :raises ValueError: if `name` is already in the queue, or if
+            `name` or `resources` are empty
+        """
+        if not name:
+            raise ValueError('Queued experiments require a name')
+        if not resources:
+            raise ValueError('Queued experiments require resources')
+        spec = {'duration': duration, 'start_time': start_time,
+                'resources': [_encode_resources(res) for res in resources]}
+        try:
+            self._execute('INSERT INTO jobs (name, spec, state, tag) '
+                          'VALUES (?, ?, ?, ?)',
+                          name, helpers.json_line(spec), QUEUED,
+                          uuid.uuid4().hex[:8])
+        except sqlite3.IntegrityError:
+            raise ValueError('Experiment %r already in queue' % name)
+
+    def jobs(self, state=None):
+        """ Return jobs list, optionally only in `state` """
+        query = 'SELECT name, state, exp_id, error FROM jobs'
+        args = ()
+        if state is not None:
+            query += ' WHERE state = ?'
+            args = (state,)
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY rowid', args)
+            return [dict(zip(('name', 'state', 'exp_id', 'error'), row))
+                    for row in rows.fetchall()]
+
+    def run(self, api, jobs=SUBMIT_JOBS, retry=False):
+        """ Submit queued experiments with `jobs` concurrent submissions
+
+        Interrupted, and with `retry` failed, jobs are first looked for in
+        user experiments by tagged name, and only submitted if not found.
+
+        :returns: {'submitted': {name: exp_id}, 'failed': {name: error}}
+        """
+        resumed = [SUBMITTING, FAILED] if retry else [SUBMITTING]
+        recovered = self._recover(api, resumed)
+        pending = [job['name'] for state in [QUEUED] + resumed
+                   for job in self.jobs(state)]
+
+        pool = ThreadPool(max(1, min(jobs, len(pending))))
+        try:
+            pool.map(deadline.bind(lambda name: self._submit(api, name)),
+                     pending)
+        finally:
+            pool.close()
+
+        jobs_by_name = dict((job['name'], job) for job in self.jobs())
+        result = {'submitted': {}, 'failed': {}}
+        for job in (jobs_by_name[name] for name in recovered + pending):
+            if job['state'] == SUBMITTED:
+                result['submitted'][job['name']] = job['exp_id']
+            else:
+                result['failed'][job['name']] = job['error']
+        return result
+
+    def _recover(self, api, states):
+        """ Mark jobs in `states` as submitted if an experiment with their
+        tagged name exists
+        :returns: recovered jobs names """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT name, tag FROM jobs WHERE state IN (%s)' %
+                ','.join('?' * len(states)), states).fetchall()
+        names = dict((_tagged_name(name, tag), name) for name, tag in rows)
+        recovered = []
+        exps = _user_experiments(api) if names else []
+        for exp in exps:
+            name = names.pop(exp.get('name'), None)
+            if name is not None:
+                self._set_state(name, SUBMITTED, exp_id=exp['id'])
+                recovered.append(name)
+            if not names:
+                break
+        return recovered
+
+    def _submit(self, api, name):
+        """ Submit job `name` and record its result """
+        with self._lock:
+            spec, tag = self._db.execute(
+                'SELECT spec, tag FROM jobs WHERE name = ?',
+                (name,)).fetchone()
+        spec = json.loads(spec)
+        self._set_state(name, SUBMITTING)
+        try:
+            ret = experiment.submit_experiment(
+                api, _tagged_name(name, tag), spec['duration'],
+                [_decode_resources(res) for res in spec['resources']],
+                spec['start_time'])
+        except deadline.DeadlineExceeded:
+            # not submitted, or not known, resumed by next run
+            raise
+        except (IOError, ValueError, RuntimeError) as err:
+            self._set_state(name, FAILED, error=str(err))
+        else:
+            self._set_state(name, SUBMITTED, exp_id=ret['id'])
+
+    def _set_state(self, name, state, exp_id=None, error=None):
+        """ Update job `name` state """
+        self._execute('UPDATE jobs SET state = ?, exp_id = ?, error = ? '
+                      'WHERE name = ?', state, exp_id, error, name)
+
+    def _execute(self, query, *args):
+        """ Execute and commit `query` """
+        with self._lock:
+            self._db.execute(query, args)
+            self._db.commit()
+
+
+def _tagged_name(name, tag):
+    """ Submitted experiment name for job `name`
+
+    >>> _tagged_name('exp_1', '2c1fe4a0')
+    'exp_1-2c1fe4a0'
+    """
+    return '%s-%s' % (name, tag)
+
+
+def _user_experiments(api):
+    """ Generate user experiments in all states, requested by pages """
+    offset = 0
+    while True:
+        exps = api.get_experiments(state=','.join(helpers.OAR_STATES),
+                                   limit=RECOVER_PAGE, offset=offset)
+        for exp in exps['items']:
+            yield exp
+        if len(exps['items']) < RECOVER_PAGE:
+            return
+        offset += RECOVER_PAGE
+
+
+def _encode_resources(res):
+    """ Return `exp_resources` dict as json compatible dict
+
+    >>> _encode_resources(experiment.exp_resources(
+    ...     selection.NodesPick(2, ['lille'], 'm3')))['nodes'] == {
+    ...     'pick': {'count': 2, 'sites': ['lille'], 'archi': 'm3',
+    ...              'contiguous': False}}
+    True
+    """
+    nodes = res['nodes']
+    if isinstance(nodes, experiment.AliasNodes):
+        nodes = {'alias': {'nbnodes': nodes.nbnodes,
+                           'site': nodes.properties['site'],
+                           'archi': nodes.properties['archi'],
+                           'mobile': nodes.properties['mobile']}}
+    elif isinstance(nodes, selection.NodesPick):
+        nodes = {'pick': nodes.to_dict()}
+    firmware = res['firmware']
+    if firmware is not None:
+        # jobs may be run from another directory
+        firmware = os.path.abspath(os.path.expanduser(firmware))
+    return dict(res, nodes=nodes, firmware=firmware)
+
+
+def _decode_resources(res):
+    """ Return `exp_resources` dict from `_encode_resources` dict """
+    nodes = res['nodes']
+    if 'alias' in nodes:
+        nodes = experiment.AliasNodes(**nodes['alias'])
+    elif 'pick' in nodes:
+        nodes = selection.NodesPick(**nodes['pick'])
+    return experiment.exp_resources(nodes, res['firmware'], res['profile'])
@@ -2,6 +2,7 @@
 
 """ Implement the 'node' requests """
 import json
+from iotlabcli import firmware
 from iotlabcli import helpers
 
 NODE_FILENAME = 'nodes.json'
@@ -23,12 +24,51 @@ def node_command(api, command, exp_id, nodes_list=(), firmware_path=None):
     result = None
     if 'update' == command:
         assert firmware_path is not None, '`firmware_path` required for update'
-        files = helpers.FilesDict()
-
-        files.add_firmware(firmware_path)
-        files[NODE_FILENAME] = json.dumps(nodes_list)
-        result = api.node_update(exp_id, files)
+        _fw = firmware.prepare_firmwares([firmware_path])[0]
+        result = node_update(api, exp_id, nodes_list, _fw)
     else:
         result = api.node_command(command, exp_id, nodes_list)
 
     return result
+
+
+def node_update(api, exp_id, nodes_list, _fw):
+    """ Update nodes with firmware `_fw`
+
+    If the firmware has already been uploaded for the experiment, it is
+    referenced by its sha1 instead of uploaded again when references are
+    enabled, see firmware.FirmwareRegistry, and supported by the server.
+
+    :param _fw: firmware.Firmware object
+    """
+    registry = firmware.FirmwareRegistry(api)
+    if registry.reference_supported and \
+            _fw.sha1 in registry.uploaded(exp_id):
+        result = _node_update_reference(api, registry, exp_id, nodes_list,
+                                        _fw.sha1)
+        if result is not None:
+            return result
+
+    files = helpers.FilesDict()
+    files[_fw.name] = _fw.content
+    files[NODE_FILENAME] = json.dumps(nodes_list)
+    result = api.node_update(exp_id, files)
+    registry.add(exp_id, [_fw.sha1])
+    return result
+
+
+def _node_update_reference(api, registry, exp_id, nodes_list, sha1):
+    """ Update nodes with uploaded firmware `sha1`
+    :returns: result or None if firmware should be uploaded """
+    try:
+        result = api.node_update_reference(exp_id, sha1, nodes_list)
+    except NotImplementedError:
+        registry.reference_unsupported()
+        return None
+    except RuntimeError:
+        # maybe transient, not recorded
+        return None
+    if result is None:
+        # firmware unknown to the server, only upload it
+        registry.discard(exp_id, sha1)
+    return result
@@ -3,13 +3,16 @@
 """ Common parsing methods """
 
 from __future__ import print_function
+import os
 import sys
+import types
 import argparse
-import itertools
 import iotlabcli
 from iotlabcli import helpers
 from iotlabcli import rest
 DOMAIN_DNS = 'iot-lab.info'
+# a nodes list is rejected above this number of nodes, before expanding it
+NODES_LIST_MAX = int(os.getenv('IOTLAB_NODES_LIST_MAX') or 10000)
 
 
 def base_parser(user_required=False):
@@ -22,6 +25,61 @@ def base_parser(user_required=False):
     return parser
 
 
+# pylint:disable=protected-access
+class LazySubParsersAction(argparse._SubParsersAction):
+    """ Subparsers action where subcommands parsers are only built when used
+
+    Use it with `parser.add_subparsers(action=LazySubParsersAction)` and
+    register subcommands with `add_lazy_parser`. Subcommands help listing
+    builds all of them.
+
+    >>> parser = argparse.ArgumentParser(prog='cli')
+    >>> subparsers = parser.add_subparsers(dest='command',
+    ...                                    action=LazySubParsersAction)
+    >>> subparsers.add_lazy_parser(
+    ...     'get', lambda sub: sub.add_argument('-s', action='store_true'))
+    >>> subparsers.add_lazy_parser('stop', lambda sub: sub.foo())
+    >>> opts = parser.parse_args(['get', '-s'])  # 'stop' is not built
+    >>> opts.command, opts.s
+    ('get', True)
+    """
+    def __init__(self, *args, **kwargs):
+        super(LazySubParsersAction, self).__init__(*args, **kwargs)
+        # registered names instead of parsers dict
+        self.choices = []
+        self._builders = {}
+
+    def add_lazy_parser(self, name, build, **kwargs):
+        """ Register subcommand `name`, its parser is created with
+        add_parser `kwargs` and configured by `build(parser)` when used """
+        self.choices.append(name)
+        self._builders[name] = (build, kwargs)
+
+    def parser(self, name):
+        """ Return subcommand `name` parser, built on first use """
+        if name not in self._name_parser_map:
+            build, kwargs = self._builders[name]
+            build(self.add_parser(name, **kwargs))
+        return self._name_parser_map[name]
+
+    def build_all(self):
+        """ Build all subcommands parsers """
+        for name in self.choices:
+            self.parser(name)
+        # help lines in registration order, not in build order
+        self._choices_actions.sort(
+            key=lambda action: self.choices.index(action.dest))
+
+    def _get_subactions(self):
+        self.build_all()
+        return super(LazySubParsersAction, self)._get_subactions()
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        self.parser(values[0])
+        super(LazySubParsersAction, self).__call__(parser, namespace, values,
+                                                   option_string)
+
+
 def add_auth_arguments(parser, usr_required=False):
     """ Add 'user' and 'password' arguments
     :param user_required: set 'user' argument as required or not  """
@@ -41,7 +99,7 @@ def main_cli(function, parser, args=None):  # flake8: noqa
     try:
         parser_opts = parser.parse_args(args)
         result = function(parser_opts)
-        print(helpers.json_dumps(result))
+        print_result(result)
     except (IOError, ValueError) as err:
         parser.error(str(err))
     except RuntimeError as err:
@@ -52,6 +110,16 @@ def main_cli(function, parser, args=None):  # flake8: noqa
         sys.exit()
 
 
+def print_result(result):
+    """ Print result as json, or generated results as json lines """
+    if not isinstance(result, types.GeneratorType):
+        print(helpers.json_dumps(result))
+        return
+    for item in result:
+        print(helpers.json_line(item))
+        sys.stdout.flush()
+
+
 def sites_list():
     """ Return the list of sites """
     sites_dict = rest.Api.get_sites()
@@ -75,6 +143,93 @@ def check_site_with_server(site_name, _sites_list=None):
     raise argparse.ArgumentTypeError("Unknown site name %r" % site_name)
 
 
+def check_sites(sites, _sites_list=None):
+    """ Check that all `sites` exist with only one sites listing.
+    If sites_list is given, it is used instead of doing a remote request
+
+    >>> sites = ["strasbourg", "grenoble"]
+    >>> check_sites(["grenoble", "strasbourg", "grenoble"], sites)
+    >>> check_sites(["lille", "grenoble", "paris", "lille"], sites)
+    Traceback (most recent call last):
+    ValueError: Unknown site names 'lille', 'paris'
+    """
+    sites = list(sites)
+    if not sites:
+        return
+    known = set(_sites_list or sites_list())
+    unknown = sorted(set(sites) - known, key=sites.index)
+    if not unknown:
+        return
+    raise ValueError("Unknown site name%s %s" % (
+        's' if len(unknown) > 1 else '', ', '.join(map(repr, unknown))))
+
+
+class SitesDeferred(object):  # pylint:disable=too-few-public-methods
+    """ Command line value built with `function(*args)` only once its
+    `sites` have been checked, so the sites of all arguments are checked
+    together after parsing with `resolve_sites`
+
+    >>> SitesDeferred(['grenoble'], int, '42').build()
+    42
+    """
+    __slots__ = ('sites', 'function', 'args')
+
+    def __init__(self, sites, function, *args):
+        self.sites = sites
+        self.function = function
+        self.args = args
+
+    def build(self):
+        """ Return value, to call after sites check """
+        return self.function(*self.args)
+
+
+def resolve_sites(opts, dests, _sites_list=None):
+    """ Check the sites of SitesDeferred lists `opts.<dest>` for `dests` in
+    one pass, then replace them by their built values. Missing lists are left
+    as is.
+
+    >>> opts = argparse.Namespace(nodes=[SitesDeferred(['grenoble'], int, '1'),
+    ...                                  SitesDeferred(['lille'], int, '2')],
+    ...                           exclude=None)
+    >>> resolve_sites(opts, ['nodes', 'exclude'],
+    ...               _sites_list=['grenoble', 'lille'])
+    >>> opts.nodes, opts.exclude
+    ([1, 2], None)
+    """
+    lists = [(dest, getattr(opts, dest)) for dest in dests
+             if getattr(opts, dest) is not None]
+    check_sites((site for _, values in lists for value in values
+                 for site in value.sites), _sites_list)
+    for dest, values in lists:
+        setattr(opts, dest, [value.build() for value in values])
+
+
+def interval_type(interval):
+    """ Argparse type for integers in schema.Interval `interval`, checked in
+    constant time and reported compactly, unlike argparse choices
+
+    >>> from iotlabcli.schema import Interval
+    >>> interval_type(Interval(1, 65535))('42')
+    42
+    >>> interval_type(Interval(1, 65535))('0')  \
+        # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    ArgumentTypeError: invalid choice: 0 (choose from 1..65535)
+    """
+    def _interval_type(value):
+        """ Return `value` as an int in interval """
+        try:
+            num = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError('invalid int value: %r' % value)
+        if num not in interval:
+            raise argparse.ArgumentTypeError(
+                'invalid choice: %d (choose from %s)' % (num, interval))
+        return num
+    return _interval_type
+
+
 def nodes_list_from_info(site, archi, nodes_str):
     """ Cheks archi, nodes_str format and return nodes list
 
@@ -96,12 +251,23 @@ def nodes_list_from_info(site, archi, nodes_str):
     Traceback (most recent call last):
     ValueError: Invalid node archi: 'inval_arch' not in ['wsn430', 'm3', 'a8']
     """
+    return list(nodes_ranges_from_info(site, archi, nodes_str))
+
 
+def nodes_ranges_from_info(site, archi, nodes_str):
+    """ Same as `nodes_list_from_info` but return a lazy helpers.NodesRanges,
+    for nodes lists only tested for membership
+
+    >>> nodes = nodes_ranges_from_info('grenoble', 'm3', '1-10000')
+    >>> len(nodes), 'm3-42.grenoble.iot-lab.info' in nodes
+    (10000, True)
+    """
     _check_archi(archi)
-    nodes_list = nodes_id_list(archi, nodes_str)
-    fmt = "%s.{site}.{domain}".format(site=site, domain=DOMAIN_DNS)
-    nodes_url_list = [fmt % node for node in nodes_list]
-    return nodes_url_list
+    ranges = _short_nodes_ranges(nodes_str).ranges
+    fmt = "{archi}-%u.{site}.{domain}".format(archi=archi, site=site,
+                                              domain=DOMAIN_DNS)
+    # identity is known here, save parsing it when sorting
+    return helpers.NodesRanges(ranges, fmt, (site, archi))
 
 
 def _check_archi(archi):
@@ -127,39 +293,22 @@ def nodes_id_list(archi, nodes_list):
     """
 
     nodes_num_list = expand_short_nodes_list(nodes_list)
-
     node_fmt = '{archi}-%u'.format(archi=archi)
-    nodes = [node_fmt % num for num in nodes_num_list]
-
-    return nodes
+    return [node_fmt % num for num in nodes_num_list]
 
 
-def _expand_minus_str(minus_nodes_str):
-    """ Expand a '1-5' or '6' string to a list on integer
-    :raises: ValueError on invalid values
-    """
-    minus_node = minus_nodes_str.split('-')
-    if len(minus_node) == 1:
-        # ['6']
-        return [int(minus_node[0])]
-    else:
-        # ['1', '4'] or ['7', '8']
-        first, last = minus_node
-        nodes_range = range(int(first), int(last) + 1)
-        # first >= last
-        if len(nodes_range) <= 1:
-            raise ValueError
-
-        # Add nodes range
-        return nodes_range
-
-
-def expand_short_nodes_list(nodes_str):
+def expand_short_nodes_list(nodes_str, max_nodes=None):
     """ Expand short nodes_list '1-5+6+8-12' to a regular nodes list
 
+    :param max_nodes: maximum number of nodes, default NODES_LIST_MAX
+
     >>> expand_short_nodes_list('1-4+6+7-8')
     [1, 2, 3, 4, 6, 7, 8]
 
+    >>> expand_short_nodes_list('1-100000')
+    Traceback (most recent call last):
+    ValueError: Too many nodes in nodes list: 1-100000 (100000 > 10000)
+
     >>> expand_short_nodes_list('1-4-5')
     Traceback (most recent call last):
     ValueError: Invalid nodes list: 1-4-5 ([0-9+-])
@@ -176,13 +325,17 @@ def expand_short_nodes_list(nodes_str):
     Traceback (most recent call last):
     ValueError: Invalid nodes list: a-b ([0-9+-])
     """
-
-    try:
-        # '1-4+6+8-8'
-        nodes_ll = [_expand_minus_str(minus_nodes_str) for minus_nodes_str in
-                    nodes_str.split('+')]
-        # [[1, 2, 3], [6], [12]]
-        return list(itertools.chain.from_iterable(nodes_ll))  # flatten
-    except ValueError:
-        # invalid: 6-3 or 6-7-8 or non int values
-        raise ValueError('Invalid nodes list: %s ([0-9+-])' % nodes_str)
+    return list(_short_nodes_ranges(nodes_str, max_nodes))
+
+
+def _short_nodes_ranges(nodes_str, max_nodes=None):
+    """ Short nodes_list '1-5+6+8-12' as a helpers.NodesRanges of numbers,
+    checked not to exceed `max_nodes` before expanding it """
+    # '1-4+6+7-8' -> [(1, 4), (6, 6), (7, 8)]
+    ranges = helpers.exp_list_ranges(nodes_str)
+    max_nodes = NODES_LIST_MAX if max_nodes is None else max_nodes
+    length = helpers.ranges_length(ranges)
+    if length > max_nodes:
+        raise ValueError('Too many nodes in nodes list: %s (%u > %u)' %
+                         (nodes_str, length, max_nodes))
+    return helpers.NodesRanges(ranges)
@@ -8,13 +8,18 @@ from argparse import ArgumentParser, RawTextHelpFormatter, ArgumentTypeError
 
 from iotlabcli import experiment
 from iotlabcli import helpers
+from iotlabcli import jobs
+from iotlabcli import selection
 from iotlabcli import rest
 from iotlabcli import auth
 from iotlabcli.parser import common, help_msgs
 
 
-def parse_options():
-    """ Handle experiment-cli command-line options with argparse """
+def parse_options(lazy=False):
+    """ Handle experiment-cli command-line options with argparse
+
+    :param lazy: only build the parser of the subcommand being parsed
+    """
     parent_parser = common.base_parser()
 
     # We create top level parser
@@ -25,12 +30,43 @@ def parse_options():
         {'cli': 'experiment', 'option': 'submit'},
         formatter_class=RawTextHelpFormatter)
 
-    subparsers = parser.add_subparsers(dest='command')
+    subparsers = parser.add_subparsers(dest='command',
+                                       action=common.LazySubParsersAction)
 
-    submit_parser = subparsers.add_parser(
-        'submit', help='submit user experiment',
+    subparsers.add_lazy_parser(
+        'submit', _submit_arguments, help='submit user experiment',
         epilog=help_msgs.SUBMIT_EPILOG, formatter_class=RawTextHelpFormatter)
+    subparsers.add_lazy_parser('stop', _stop_arguments,
+                               help='stop user experiment')
+    subparsers.add_lazy_parser(
+        'get', _get_arguments, epilog=help_msgs.GET_EPILOG,
+        help='get user\'s experiment', formatter_class=RawTextHelpFormatter)
+    subparsers.add_lazy_parser(
+        'load', _load_arguments, epilog=help_msgs.LOAD_EPILOG,
+        help='load and submit user experiment',
+        formatter_class=RawTextHelpFormatter)
+    subparsers.add_lazy_parser(
+        'info', _info_arguments, epilog=help_msgs.INFO_EPILOG,
+        help='resources description list',
+        formatter_class=RawTextHelpFormatter)
+    subparsers.add_lazy_parser(
+        'wait', _wait_arguments, help='wait user experiment started',
+        epilog=help_msgs.WAIT_EPILOG, formatter_class=RawTextHelpFormatter)
+    subparsers.add_lazy_parser(
+        'queue', _queue_arguments, help='list or submit queued experiments',
+        epilog=help_msgs.QUEUE_EPILOG, formatter_class=RawTextHelpFormatter)
+    subparsers.add_lazy_parser(
+        'watch', _watch_arguments,
+        help='stream experiments state changes as json lines',
+        epilog=help_msgs.WATCH_EPILOG, formatter_class=RawTextHelpFormatter)
+
+    if not lazy:
+        subparsers.build_all()
+    return parser
 
+
+def _submit_arguments(submit_parser):
+    """ Add 'submit' subcommand arguments """
     submit_parser.add_argument('-l', '--list', action='append',
                                dest='nodes_list', required=True,
                                type=exp_resources_from_str,
@@ -49,18 +85,26 @@ def parse_options():
                                dest='print_json', action='store_true',
                                help='print experiment submission')
 
-    # ####### STOP PARSER ###############
-    stop_parser = subparsers.add_parser('stop', help='stop user experiment')
+    submit_parser.add_argument(
+        '--validate', action='store_true',
+        help='check experiment with testbed resources before submitting')
+
+    submit_parser.add_argument(
+        '--queue', action='store_true',
+        help=('add experiment to the local submission queue, see `queue`, '
+              'not with --print or --validate'))
+    submit_parser.add_argument(
+        '--db', help='queue database, default %s' % jobs.JOBS_DB)
+
+
+def _stop_arguments(stop_parser):
+    """ Add 'stop' subcommand arguments """
     stop_parser.add_argument('-i', '--id', dest='experiment_id', type=int,
                              help='experiment id submission')
 
-    # ####### GET PARSER ###############
-    get_parser = subparsers.add_parser(
-        'get',
-        epilog=help_msgs.GET_EPILOG,
-        help='get user\'s experiment',
-        formatter_class=RawTextHelpFormatter)
 
+def _get_arguments(get_parser):
+    """ Add 'get' subcommand arguments """
     get_parser.add_argument('-i', '--id', dest='experiment_id', type=int,
                             help='experiment id')
 
@@ -96,11 +140,9 @@ def parse_options():
 
     get_parser.add_argument('--state', help='experiment list state filter')
 
-    # ####### LOAD PARSER ###############
-    load_parser = subparsers.add_parser('load', epilog=help_msgs.LOAD_EPILOG,
-                                        help='load and submit user experiment',
-                                        formatter_class=RawTextHelpFormatter)
 
+def _load_arguments(load_parser):
+    """ Add 'load' subcommand arguments """
     load_parser.add_argument('-f', '--file', dest='path_file',
                              required=True, help='experiment path file')
 
@@ -108,12 +150,18 @@ def parse_options():
                              type=(lambda s: s.split(',')),
                              help='comma separated firmware(s) path list')
 
-    # ####### INFO PARSER ###############
-    info_parser = subparsers.add_parser('info', epilog=help_msgs.INFO_EPILOG,
-                                        help='resources description list',
-                                        formatter_class=RawTextHelpFormatter)
+    load_parser.add_argument(
+        '--validate', action='store_true',
+        help='check experiment with testbed resources before submitting')
+
 
+def _info_arguments(info_parser):
+    """ Add 'info' subcommand arguments """
     info_parser.add_argument('--site', help='resources list filter by site')
+    info_parser.add_argument(
+        '--archi', help='resources list filter by archi, comma separated')
+    info_parser.add_argument(
+        '--state', help='resources list filter by state, comma separated')
     # subcommand
     info_group = info_parser.add_mutually_exclusive_group(required=True)
     info_group.add_argument('-l', '--list', dest='list_id',
@@ -122,12 +170,12 @@ def parse_options():
                             action='store_true',
                             help=('resources id list by archi and state '
                                   '(EXP_LIST format : 1-34+72)'))
+    info_group.add_argument('--count', action='store_true',
+                            help='resources count by archi and state')
 
-    # ####### WAIT PARSER ###############
-    wait_parser = subparsers.add_parser(
-        'wait', help='wait user experiment started',
-        epilog=help_msgs.WAIT_EPILOG, formatter_class=RawTextHelpFormatter)
 
+def _wait_arguments(wait_parser):
+    """ Add 'wait' subcommand arguments """
     wait_parser.add_argument('-i', '--id', dest='experiment_id', type=int,
                              help='experiment id submission')
 
@@ -141,16 +189,42 @@ def parse_options():
         '--timeout', default=float('+inf'), type=float,
         help="Max time to wait in seconds")
 
-    return parser
+
+def _queue_arguments(queue_parser):
+    """ Add 'queue' subcommand arguments """
+    queue_parser.add_argument(
+        '--run', action='store_true', help='submit queued experiments')
+    queue_parser.add_argument(
+        '--retry', action='store_true', help='also submit failed experiments')
+    queue_parser.add_argument(
+        '-j', '--jobs', type=int, default=jobs.SUBMIT_JOBS,
+        help='concurrent submissions, default %(default)s')
+    queue_parser.add_argument(
+        '--db', help='queue database, default %s' % jobs.JOBS_DB)
+
+
+def _watch_arguments(watch_parser):
+    """ Add 'watch' subcommand arguments """
+    watch_parser.add_argument(
+        '-i', '--id', dest='experiment_ids', type=int, action='append',
+        help='experiment id to watch, all user experiments by default')
+    watch_parser.add_argument(
+        '--step', default=5, type=int,
+        help="Wait time in seconds between each check")
+    watch_parser.add_argument(
+        '--timeout', default=float('+inf'), type=float,
+        help="Max time to watch in seconds")
 
 
 def exp_resources_from_str(exp_str):
-    """ Extract an 'experiment.exp_resources' from parameter string
+    """ Extract an 'experiment.exp_resources' from parameter string, as a
+    common.SitesDeferred built once all the command line sites are checked.
     Accepted formats:
         + 9,archi=wsn430:cc1101+site=grenoble,tp.hex,battery
 
         * grenoble,m3,1-20,/home/cc1101.hex
         * rocquencourt,a8,1-5,,battery
+        * grenoble+lille,m3,pick:10:contiguous,tp.elf
 
     """
     try:
@@ -161,12 +235,24 @@ def exp_resources_from_str(exp_str):
         if param_list:
             raise ArgumentTypeError(
                 'Invalid number or arguments in experiment list %r' % exp_str)
-
-        return experiment.exp_resources(nodes, firmware_path, profile_name)
     except ValueError as err:
         raise ArgumentTypeError(
             'Invalid arguments in experiment list %r: %s' % (exp_str, err))
 
+    return common.SitesDeferred(nodes.sites, _exp_resources, exp_str, nodes,
+                                firmware_path, profile_name)
+
+
+def _exp_resources(exp_str, nodes, firmware_path, profile_name):
+    """ Return 'experiment.exp_resources' with `nodes` SitesDeferred built,
+    nodes lists are only expanded here """
+    try:
+        return experiment.exp_resources(nodes.build(), firmware_path,
+                                        profile_name)
+    except ValueError as err:
+        raise ValueError(
+            'Invalid arguments in experiment list %r: %s' % (exp_str, err))
+
 
 def _extract_non_empty_val(param_list):
     """ Safe extract value from param_list.
@@ -279,11 +365,12 @@ def mobile_from_mobile_str(mobile_str=None):
 
 def _extract_firmware_nodes_list(param_list):
     """
-    Extract a firmware nodes list from param_list
+    Extract a firmware nodes list from param_list, as a common.SitesDeferred
     param_list is modified by the function call
     :param param_list: can have following formats
         * ['9', 'archi=wsn430:cc1101+site=grenoble', ...]  Alias type
         * ['grenoble', 'm3', '1-4+8-12+7', ...]  Physical type
+        * ['grenoble+lille', 'm3', 'pick:10', ...]  Physical nodes selection
     """
 
     # list in experiment-cli (alias or physical)
@@ -296,16 +383,44 @@ def _extract_firmware_nodes_list(param_list):
         # parse parameters
         site, archi, _mobile = get_alias_properties(properties_str)
         mobile = mobile_from_mobile_str(_mobile)
-        nodes = experiment.AliasNodes(int(nb_nodes), site, archi, mobile)
-    else:  # physical selection
-        # extract parameters
-        site, archi, nodes_str = param_list[0:3]
-        del param_list[0:3]
+        return common.SitesDeferred([site], experiment.AliasNodes,
+                                    int(nb_nodes), site, archi, mobile)
+
+    # physical selection
+    # extract parameters
+    site, archi, nodes_str = param_list[0:3]
+    del param_list[0:3]
+
+    # parse parameters
+    if nodes_str.startswith('pick:'):
+        return nodes_pick(site, archi, nodes_str)
+    return common.SitesDeferred([site], common.nodes_list_from_info,
+                                site, archi, nodes_str)
 
-        # parse parameters
-        nodes = common.nodes_list_from_info(site, archi, nodes_str)
-    common.check_site_with_server(site)
-    return nodes
+
+def nodes_pick(sites_str, archi, pick_str):
+    """ Return the NodesPick for `pick_str` 'pick:N[:contiguous]' selection
+    on '+' separated sites, as a common.SitesDeferred
+
+    >>> pick = nodes_pick('grenoble+lille', 'm3', 'pick:10:contiguous')
+    >>> pick.sites
+    ['grenoble', 'lille']
+    >>> pick.build()
+    NodesPick(10, ['grenoble', 'lille'], 'm3', contiguous=True)
+
+    >>> nodes_pick('grenoble', 'm3', 'pick:ten')
+    Traceback (most recent call last):
+    ValueError: Invalid nodes pick: 'pick:ten' (pick:N[:contiguous])
+    """
+    params = pick_str.split(':')
+    if (len(params) not in (2, 3) or not params[1].isdigit() or
+            params[2:] not in ([], ['contiguous'])):
+        raise ValueError('Invalid nodes pick: %r (pick:N[:contiguous])' %
+                         pick_str)
+    common._check_archi(archi)
+    sites = sites_str.split('+')
+    return common.SitesDeferred(sites, selection.NodesPick, int(params[1]),
+                                sites, archi, params[2:] == ['contiguous'])
 
 
 def _get_property(properties, key):
@@ -343,12 +458,24 @@ def _get_property(properties, key):
 
 def submit_experiment_parser(opts):
     """ Parse namespace 'opts' and execute requested 'submit' command """
+    if opts.queue and (opts.print_json or opts.validate):
+        raise ValueError('--queue cannot be used with --print or --validate')
+    common.resolve_sites(opts, ['nodes_list'])
+    if opts.queue:
+        queue = jobs.JobQueue(opts.db)
+        try:
+            queue.add(opts.name, opts.duration, opts.nodes_list,
+                      opts.reservation)
+        finally:
+            queue.close()
+        return {'name': opts.name, 'state': jobs.QUEUED}
+
     user, passwd = auth.get_user_credentials(opts.username, opts.password)
     api = rest.Api(user, passwd)
 
     return experiment.submit_experiment(api, opts.name, opts.duration,
                                         opts.nodes_list, opts.reservation,
-                                        opts.print_json)
+                                        opts.print_json, opts.validate)
 
 
 def stop_experiment_parser(opts):
@@ -379,14 +506,19 @@ def load_experiment_parser(opts):
 
     user, passwd = auth.get_user_credentials(opts.username, opts.password)
     api = rest.Api(user, passwd)
-    return experiment.load_experiment(api, opts.path_file, opts.firmware_list)
+    return experiment.load_experiment(api, opts.path_file, opts.firmware_list,
+                                      opts.validate)
 
 
 def info_experiment_parser(opts):
     """ Parse namespace 'opts' object and execute requested 'info' command """
     user, passwd = auth.get_user_credentials(opts.username, opts.password)
     api = rest.Api(user, passwd)
-    return experiment.info_experiment(api, opts.list_id, opts.site)
+    if opts.count:
+        return experiment.count_resources(api, opts.site, opts.archi,
+                                          opts.state)
+    return experiment.info_experiment(api, opts.list_id, opts.site,
+                                      opts.archi, opts.state)
 
 
 def wait_experiment_parser(opts):
@@ -405,6 +537,32 @@ def wait_experiment_parser(opts):
                                       opts.step, opts.timeout)
 
 
+def queue_experiment_parser(opts):
+    """ Parse namespace 'opts' object and execute requested 'queue' command
+    """
+    queue = jobs.JobQueue(opts.db)
+    try:
+        if not opts.run:
+            return queue.jobs()
+
+        user, passwd = auth.get_user_credentials(opts.username,
+                                                 opts.password)
+        api = rest.Api(user, passwd)
+        return queue.run(api, opts.jobs, opts.retry)
+    finally:
+        queue.close()
+
+
+def watch_experiment_parser(opts):
+    """ Parse namespace 'opts' object and execute requested 'watch' command
+    """
+    user, passwd = auth.get_user_credentials(opts.username, opts.password)
+    api = rest.Api(user, passwd)
+
+    return experiment.watch_experiments(api, opts.experiment_ids,
+                                        opts.step, opts.timeout)
+
+
 def experiment_parse_and_run(opts):
     """ Parse namespace 'opts' object and execute requested command
     Return result object
@@ -416,6 +574,8 @@ def experiment_parse_and_run(opts):
         'load': load_experiment_parser,
         'info': info_experiment_parser,
         'wait': wait_experiment_parser,
+        'watch': watch_experiment_parser,
+        'queue': queue_experiment_parser,
     }[opts.command]
 
     return command(opts)
@@ -424,5 +584,5 @@ def experiment_parse_and_run(opts):
 def main(args=None):
     """ Main command-line execution loop." """
     args = args or sys.argv[1:]
-    parser = parse_options()
+    parser = parse_options(lazy=True)
     common.main_cli(experiment_parse_and_run, parser, args)
@@ -7,6 +7,8 @@ AUTH_PARSER = """
 auth-cli command-line store your credentials.
 It creates a file .iotlabrc in your home directory
 with username and password options.
+Credentials can also be given with IOTLAB_USERNAME and
+IOTLAB_PASSWORD environment variables.
 
 """
 
@@ -57,11 +59,19 @@ Examples:
         + grenoble,wsn430,1-5+8+9-11,cc1101.hex,battery
         + grenoble,m3,1-20
 
+    * Physical experiment list with nodes selected in 'Alive' nodes:
+        + <sites,archi,pick:number[:contiguous],firmware_path,profile_name>
+        + grenoble,m3,pick:10,tp.elf
+        + grenoble+lille,m3,pick:20:contiguous  (spread across sites)
+
     * Alias experiment list:
         + <resources_number,properties,firmware_path,profile_name>
         + 9,archi=wsn430:cc1101+site=grenoble,tp.hex,battery
         + 9,archi=m3:at86rf231+site=grenoble,gre.elf
         + 5,archi=m3:at86rf231+site=strasbourg,stras.elf
+
+    * Check nodes, archis and firmwares locally before uploading:
+        $ experiment-cli submit --validate -d 20 -l grenoble,m3,1-20,tp.elf
 """
 
 WAIT_EPILOG = """
@@ -75,6 +85,39 @@ Examples:
 --timeout 60
 """
 
+QUEUE_EPILOG = """
+Experiments are added to the queue with `submit --queue`, using their name
+as key, and submitted later with `queue --run` named '<name>-<tag>', with a
+tag unique to the queued experiment.
+A run interrupted while submitting can be run again: experiments already
+submitted are found by tagged name and not submitted twice.
+
+Examples:
+    * queue experiments:
+        $ experiment-cli submit --queue -n exp_1 -d 20 -l 5,archi=m3:at86rf231\
++site=grenoble
+        $ experiment-cli submit --queue -n exp_2 -d 20 -l grenoble,m3,1-10
+
+    * list queued experiments:
+        $ experiment-cli queue
+
+    * submit them, 8 at a time, and retry the failed ones:
+        $ experiment-cli queue --run --jobs 8 --retry
+"""
+
+WATCH_EPILOG = """
+Print a json line for each experiment state change:
+    {"id": 1234, "previous": "Launching", "state": "Running", "time": ...}
+'previous' is null on the first line of each experiment.
+
+Examples:
+    * watch all user experiments:
+        $ experiment-cli watch
+
+    * watch given experiments until they are finished, checking every second
+        $ experiment-cli watch -i 1234 -i 1235 --step 1
+"""
+
 LOAD_EPILOG = """
 
 Examples:
@@ -103,6 +146,9 @@ Examples:
     * Get user's experiment list with filter by state and number
         $ experiment-cli get -l --state Running,Terminated \\
             --offset 10 --limit 20
+
+Terminated and Error experiments results are cached on disk, up to
+IOTLAB_CACHE_MAX_SIZE bytes.
 """
 
 
@@ -113,6 +159,11 @@ Examples:
         $ expriment-cli info -l --site grenoble
     * Get resources id list (e.g. 1-34+72)
         $ experiment-cli info -li
+    * Get available m3 nodes id list on grenoble and lille
+        $ experiment-cli info -li --site grenoble,lille --archi m3 \\
+            --state Alive
+    * Count resources by archi and state
+        $ experiment-cli info --count
 
 """
 
@@ -130,6 +181,19 @@ Examples :
 """
 
 
+SYNC_EPILOG = """
+
+Examples :
+    * Add or update profiles from JSON files in 'profiles' directory
+        $ profile-cli sync profiles/
+    * Also delete user profiles not in 'profiles' directory
+        $ profile-cli sync --delete profiles/
+
+Server profiles list is cached for 'profile-cli get' commands.
+
+"""
+
+
 COMMAND_EPILOG = """
 
 Examples:
@@ -144,5 +208,7 @@ Examples:
         $ node-cli --reset -l grenoble,wsn430,1-34+72
     * command with several experiments with state Running
         $ node-cli -i <expid> --reset
+    * print result nodes lists in short format (e.g. 1-34+72)
+        $ node-cli --reset --compact
 
 """
@@ -55,31 +55,46 @@ def parse_options():
 
     list_group.add_argument(
         '-e', '--exclude', action='append',
-        type=nodes_list_from_str,
+        type=_exclude_nodes_from_str,
         dest='exclude_nodes_list', help='exclude nodes list')
     list_group.add_argument(
         '-l', '--list', action='append',
         type=nodes_list_from_str,
         dest='nodes_list', help='nodes list')
 
+    parser.add_argument(
+        '--compact', action='store_true',
+        help='print result nodes lists in EXP_LIST format (1-34+72)')
+
     return parser
 
 
 def nodes_list_from_str(nodes_list_str):
-    """ Convert the nodes_list_str to a list of nodes hostname
-    Checks that given site exist
+    """ Convert the nodes_list_str to a list of nodes hostname, as a
+    common.SitesDeferred built once all the command line sites are checked
     :param nodes_list_str: short nodes format: site_name,archi,node_id_list
                            example: 'grenoble,m3,1-34+72'
-    :returns: ['m3-1.grenoble.iot-lab.info', ...]
+    :returns: SitesDeferred of ['m3-1.grenoble.iot-lab.info', ...]
     """
+    return _nodes_from_str(nodes_list_str, common.nodes_list_from_info)
+
+
+def _exclude_nodes_from_str(nodes_list_str):
+    """ Same as `nodes_list_from_str` with a lazy helpers.NodesRanges,
+    exclude lists are only tested for membership """
+    return _nodes_from_str(nodes_list_str, common.nodes_ranges_from_info)
+
+
+def _nodes_from_str(nodes_list_str, nodes_from_info):
+    """ SitesDeferred of `nodes_from_info(site, archi, nodes_str)` """
     try:
         # 'grenoble,m3,1-34+72' -> ['grenoble', 'm3', '1-34+72']
         site, archi, nodes_str = nodes_list_str.split(',')
     except ValueError:
         raise ArgumentTypeError(
             'Invalid number of argument in nodes list: %r' % nodes_list_str)
-    common.check_site_with_server(site)  # needs an external request
-    return common.nodes_list_from_info(site, archi, nodes_str)
+    return common.SitesDeferred([site], nodes_from_info,
+                                site, archi, nodes_str)
 
 
 def _get_experiment_nodes_list(api, exp_id):
@@ -97,12 +112,11 @@ def list_nodes(api, exp_id, nodes_ll=None, excl_nodes_ll=None):
         nodes = list(itertools.chain.from_iterable(nodes_ll))
 
     elif excl_nodes_ll is not None:
-        # flatten lists into one
-        excl_nodes = set(itertools.chain.from_iterable(excl_nodes_ll))
-
-        # remove exclude nodes from experiment nodes
+        # remove exclude nodes from experiment nodes, lazy nodes lists
+        # membership is tested without expanding them
         exp_nodes = set(_get_experiment_nodes_list(api, exp_id))
-        nodes = list(exp_nodes - excl_nodes)
+        nodes = [node for node in exp_nodes
+                 if not any(node in excl for excl in excl_nodes_ll)]
     else:
         nodes = []  # all the nodes
 
@@ -111,6 +125,7 @@ def list_nodes(api, exp_id, nodes_ll=None, excl_nodes_ll=None):
 
 def node_parse_and_run(opts):
     """ Parse namespace 'opts' object and execute requested command """
+    common.resolve_sites(opts, ['nodes_list', 'exclude_nodes_list'])
     user, passwd = auth.get_user_credentials(opts.username, opts.password)
     api = rest.Api(user, passwd)
     exp_id = helpers.get_current_experiment(api, opts.experiment_id)
@@ -120,7 +135,23 @@ def node_parse_and_run(opts):
 
     nodes = list_nodes(api, exp_id, opts.nodes_list, opts.exclude_nodes_list)
 
-    return iotlabcli.node.node_command(api, command, exp_id, nodes, firmware)
+    result = iotlabcli.node.node_command(api, command, exp_id, nodes,
+                                         firmware)
+    if opts.compact:
+        result = compact_result(result)
+    return result
+
+
+def compact_result(result):
+    """ Compact nodes lists of a node command result
+
+    >>> compact_result({'0': ['m3-1.grenoble.iot-lab.info', \
+'m3-2.grenoble.iot-lab.info'], '1': ['m3-4.grenoble.iot-lab.info']}) \
+== {'0': {'grenoble': {'m3': '1-2'}}, '1': {'grenoble': {'m3': '4'}}}
+    True
+    """
+    return dict((key, helpers.compact_nodes_list(nodes))
+                for key, nodes in result.items())
 
 
 def main(args=None):
@@ -2,6 +2,7 @@
 """ Profile parser"""
 
 import json
+import os
 import sys
 import argparse
 from argparse import RawTextHelpFormatter
@@ -11,11 +12,15 @@ from iotlabcli import rest
 from iotlabcli import auth
 from iotlabcli.parser import help_msgs
 from iotlabcli.parser import common
+from iotlabcli import profile as iotlab_profile
 from iotlabcli.profile import ProfileWSN430, ProfileM3, ProfileA8
 
 
-def parse_options():
-    """ Handle profile-cli command-line opts with argparse """
+def parse_options(lazy=False):
+    """ Handle profile-cli command-line opts with argparse
+
+    :param lazy: only build the parser of the subcommand being parsed
+    """
     parent_parser = common.base_parser()
     # We create top level parser
     parser = argparse.ArgumentParser(
@@ -24,93 +29,97 @@ def parse_options():
         % {'cli': 'profile', 'option': 'add'},
         formatter_class=RawTextHelpFormatter)
 
-    subparsers = parser.add_subparsers(dest='subparser_name')
+    subparsers = parser.add_subparsers(dest='subparser_name',
+                                       action=common.LazySubParsersAction)
 
-    add_wsn430_parser = subparsers.add_parser(
-        'addwsn430', help='add wsn430 user profile',
+    subparsers.add_lazy_parser(
+        'addwsn430', add_wsn430_parser, help='add wsn430 user profile',
         epilog=help_msgs.ADD_EPILOG, formatter_class=RawTextHelpFormatter)
-
-    #
-    # m3 profile
-    #
-    add_m3_parser = subparsers.add_parser(
-        'addm3', help='add m3 user profile',
+    subparsers.add_lazy_parser(
+        'addm3', lambda subparser: add_m3_a8_parser('M3', subparser),
+        help='add m3 user profile',
         epilog=help_msgs.ADD_EPILOG, formatter_class=RawTextHelpFormatter)
-    add_m3_a8_parser('M3', add_m3_parser)
-
-    #
-    # a8 profile
-    #
-    add_a8_parser = subparsers.add_parser(
-        'adda8', help='add a8 user profile',
+    subparsers.add_lazy_parser(
+        'adda8', lambda subparser: add_m3_a8_parser('A8', subparser),
+        help='add a8 user profile',
         epilog=help_msgs.ADD_EPILOG, formatter_class=RawTextHelpFormatter)
-    add_m3_a8_parser('A8', add_a8_parser)
-
-    del_parser = subparsers.add_parser('del', help='delete user profile')
-    get_parser = subparsers.add_parser('get', help='get user\'s profile')
-    load_parser = subparsers.add_parser('load', help='load user profile')
-
-    #
-    # WSN430 profile
-    #
-    add_wsn430_parser.add_argument('-n', '--name', required=True,
-                                   help='profile name')
-    add_wsn430_parser.add_argument(
+    subparsers.add_lazy_parser('del', _del_arguments,
+                               help='delete user profile')
+    subparsers.add_lazy_parser('get', _get_arguments,
+                               help='get user\'s profile')
+    subparsers.add_lazy_parser('load', _load_arguments,
+                               help='load user profile')
+    subparsers.add_lazy_parser(
+        'sync', _sync_arguments,
+        help='synchronize user profiles with a directory',
+        epilog=help_msgs.SYNC_EPILOG, formatter_class=RawTextHelpFormatter)
+
+    if not lazy:
+        subparsers.build_all()
+    return parser
+
+
+def add_wsn430_parser(add_parser):
+    """ Add options for wsn430 parser """
+    add_parser.add_argument('-n', '--name', required=True,
+                            help='profile name')
+    add_parser.add_argument(
         '-j', '--json', action='store_true',
         help='print profile JSON representation without add it')
 
-    add_wsn430_parser.add_argument(
+    add_parser.add_argument(
         '-p', '--power',
         dest='power_mode', default='dc',
         help='power mode (dc by default)',
         choices=ProfileWSN430.choices['power_mode'])
 
     # WSN430 Consumption
-    group_wsn430_consumption = add_wsn430_parser.add_argument_group(
-        'Consumption measure')
+    group_consumption = add_parser.add_argument_group('Consumption measure')
 
-    group_wsn430_consumption.add_argument(
+    group_consumption.add_argument(
         '-cfreq', dest='cfreq', type=int,
         choices=ProfileWSN430.choices['consumption']['frequency'],
         help='frequency measure (ms)')
 
-    group_wsn430_consumption.add_argument(
+    group_consumption.add_argument(
         '-power', action='store_true',
         help='power measure')
-    group_wsn430_consumption.add_argument(
+    group_consumption.add_argument(
         '-voltage', action='store_true',
         help='voltage measure')
-    group_wsn430_consumption.add_argument(
+    group_consumption.add_argument(
         '-current', action='store_true',
         help='current measure')
 
     # WSN430 Radio
-    group_wsn430_radio = add_wsn430_parser.add_argument_group(
-        'Radio measure')
-    group_wsn430_radio.add_argument(
+    group_radio = add_parser.add_argument_group('Radio measure')
+    group_radio.add_argument(
         '-rfreq', dest='rfreq', type=int,
         choices=ProfileWSN430.choices['radio']['frequency'],
         help='frequency measure (ms)')
 
     # WSN430 Sensor
-    group_wsn430_sensor = add_wsn430_parser.add_argument_group(
-        'Sensor measure')
-    group_wsn430_sensor.add_argument(
+    group_sensor = add_parser.add_argument_group('Sensor measure')
+    group_sensor.add_argument(
         '-sfreq', dest='sfreq', type=int,
         choices=ProfileWSN430.choices['sensor']['frequency'],
         help='frequency measure (ms)')
 
-    group_wsn430_sensor.add_argument(
+    group_sensor.add_argument(
         '-temperature', action='store_true',
         help='temperature measure')
-    group_wsn430_sensor.add_argument(
+    group_sensor.add_argument(
         '-luminosity', action='store_true',
         help='luminosity measure')
 
-    # Delete Profile
+
+def _del_arguments(del_parser):
+    """ Add 'del' subcommand arguments """
     del_parser.add_argument('-n', '--name', required=True, help='profile name')
 
-    # Get Profile
+
+def _get_arguments(get_parser):
+    """ Add 'get' subcommand arguments """
     get_group = get_parser.add_mutually_exclusive_group(required=True)
 
     get_group.add_argument('-n', '--name', help='profile name')
@@ -119,12 +128,24 @@ def parse_options():
         '-l', '--list', action='store_true',
         help='print profile\'s list JSON representation')
 
-    # Load Profile
+
+def _load_arguments(load_parser):
+    """ Add 'load' subcommand arguments """
     load_parser.add_argument(
         '-f', '--file', dest='path_file', required=True,
         help='profile JSON representation path file')
 
-    return parser
+
+def _sync_arguments(sync_parser):
+    """ Add 'sync' subcommand arguments """
+    sync_parser.add_argument(
+        'directory', help='directory with profiles JSON representation files')
+    sync_parser.add_argument(
+        '--delete', action='store_true',
+        help='delete profiles not in directory')
+    sync_parser.add_argument(
+        '--jobs', type=int, default=iotlab_profile.SYNC_JOBS,
+        help='number of concurrent requests, default: %(default)s')
 
 
 def add_m3_a8_parser(node_type, subparser):
@@ -173,20 +194,23 @@ def add_m3_a8_parser(node_type, subparser):
         '-rssi', dest='mode', action='store_const', const='rssi',
         help='RSSI measure')
 
+    # integers intervals are not argparse choices, checked by linear scan
+    channels = node_class.choices['radio']['channels']
     radio.add_argument(
         '-channels', dest='channels', nargs='+',
-        type=int, choices=node_class.choices['radio']['channels'],
-        metavar='{11..26}', help='List of channels (11 to 26)')
+        type=common.interval_type(channels), metavar='{%s}' % channels,
+        help='List of channels (%d to %d)' % (channels.first, channels.last))
 
+    num_per_channel = node_class.choices['radio']['num_per_channel']
     radio.add_argument(
-        '-num', dest='num_per_channel', default=0, type=int,
-        choices=node_class.choices['radio']['num_per_channel'],
-        metavar='{0..255}', help='Number of measure by channel')
+        '-num', dest='num_per_channel', default=0,
+        type=common.interval_type(num_per_channel),
+        metavar='{%s}' % num_per_channel, help='Number of measure by channel')
 
+    period = node_class.choices['radio']['period']
     radio.add_argument(
-        '-rperiod', dest='rperiod', type=int,
-        choices=node_class.choices['radio']['period'],
-        metavar='{1..65535}', help='period measure')
+        '-rperiod', dest='rperiod', type=common.interval_type(period),
+        metavar='{%s}' % period, help='period measure')
 
 
 def _wsn430_profile(opts):
@@ -225,9 +249,10 @@ def _a8_profile(opts):
 def _add_profile(api, name, profile, json_out=False):
     """ Add user profile. if json, dump json dict to stdout """
     if json_out:
+        iotlab_profile.check_profiles([profile])
         return profile
     else:
-        return api.add_profile(name, profile)
+        return iotlab_profile.add_profile(api, name, profile)
 
 
 def add_profile_parser(api, opts):
@@ -241,11 +266,8 @@ def add_profile_parser(api, opts):
                       'addm3': _m3_profile,
                       'adda8': _a8_profile}
 
-    try:
-        profile = profile_func_d[opts.subparser_name](opts)
-        return _add_profile(api, opts.name, profile, opts.json)
-    except AssertionError as err:   # pragma: no cover
-        raise ValueError(str(err))
+    profile = profile_func_d[opts.subparser_name](opts)
+    return _add_profile(api, opts.name, profile, opts.json)
 
 
 def load_profile_parser(api, opts):
@@ -255,12 +277,38 @@ def load_profile_parser(api, opts):
     :param opts: command-line parser opts
     :type opts: Namespace object with opts attribute
     """
-    try:
-        profile = json.loads(helpers.read_file(opts.path_file))
-        return _add_profile(api, profile['profilename'], profile)
-    except KeyError:  # pragma: no cover
+    profile = _load_profile(opts.path_file)
+    return _add_profile(api, profile['profilename'], profile)
+
+
+def _load_profile(path):
+    """ Load profile description from JSON file `path` """
+    profile = json.loads(helpers.read_file(path))
+    if 'profilename' not in profile:
         raise ValueError(
-            "'profilename' required in profile JSON file: %r" % opts.path_file)
+            "'profilename' required in profile JSON file: %r" % path)
+    return profile
+
+
+def sync_profile_parser(api, opts):
+    """ Synchronize user profiles with profiles JSON files in directory
+
+    :param api: API Rest api object
+    :param opts: command-line parser opts
+    :type opts: Namespace object with opts attribute
+    """
+    profiles = {}
+    for file_name in sorted(os.listdir(opts.directory)):
+        if not file_name.endswith('.json'):
+            continue
+        path = os.path.join(opts.directory, file_name)
+        profile = _load_profile(path)
+        if profile['profilename'] in profiles:
+            raise ValueError("Profile %r defined twice, in %r" %
+                             (profile['profilename'], path))
+        profiles[profile['profilename']] = profile
+    return iotlab_profile.sync_profiles(api, list(profiles.values()),
+                                        opts.delete, opts.jobs)
 
 
 def del_profile_parser(api, opts):
@@ -270,7 +318,7 @@ def del_profile_parser(api, opts):
     :param opts: command-line parser opts
     :type opts: Namespace object with opts attribute
     """
-    return api.del_profile(opts.name)
+    return iotlab_profile.del_profile(api, opts.name)
 
 
 def get_profile_parser(api, opts):
@@ -285,9 +333,9 @@ def get_profile_parser(api, opts):
     assert opts.list or opts.name is not None
 
     if opts.list:
-        profile_dict = api.get_profiles()
+        profile_dict = iotlab_profile.get_profiles(api)
     else:
-        profile_dict = api.get_profile(opts.name)
+        profile_dict = iotlab_profile.get_profile(api, opts.name)
 
     return profile_dict
 
@@ -304,6 +352,7 @@ def profile_parse_and_run(opts):
         'load': load_profile_parser,
         'get': get_profile_parser,
         'del': del_profile_parser,
+        'sync': sync_profile_parser,
     }[opts.subparser_name]
 
     return fct_parser(api, opts)
@@ -312,5 +361,5 @@ def profile_parse_and_run(opts):
 def main(args=None):
     """ Main command-line execution loop." """
     args = args or sys.argv[1:]
-    parser = parse_options()
+    parser = parse_options(lazy=True)
     common.main_cli(profile_parse_and_run, parser, args)
@@ -1,22 +1,36 @@
 # -*- coding:utf-8 -*-
-"""Class python for Profile serialization JSON"""
+"""Class python for Profile serialization JSON
+
+Profiles are checked against their `validation_schema` when created and
+configured, and profiles dicts when added or synced.
+"""
 
 # pylint:disable=too-few-public-methods
 
+import json
+from multiprocessing.pool import ThreadPool
+
+from iotlabcli import cache
+from iotlabcli import deadline
+from iotlabcli import helpers
+from iotlabcli import schema
 
-class ProfileM3A8(object):
+
+class ProfileM3A8(helpers.Serializable):
     """A generic Profile for M3 and A8 """
+    __slots__ = _fields = ('nodearch', 'profilename', 'power', 'consumption',
+                           'radio')
     choices = {
         'power_mode': ['dc', 'battery'],
         'consumption': {'period': [140, 204, 332, 588, 1100, 2116, 4156, 8244],
                         'average': [1, 4, 16, 64, 128, 256, 512, 1024]},
-        'radio': {'channels': range(11, 27), 'num_per_channel': range(0, 256),
-                  'period': range(1, 2**16)}
+        'radio': {'channels': schema.Interval(11, 26),
+                  'num_per_channel': schema.Interval(0, 255),
+                  'period': schema.Interval(1, 2**16 - 1), 'mode': ['rssi']}
     }
     arch = None
 
     def __init__(self, profilename, power):
-        assert power in self.choices['power_mode']
         assert self.arch is not None, "Using Generic class"
         self.nodearch = self.arch
         self.profilename = profilename
@@ -24,6 +38,7 @@ class ProfileM3A8(object):
 
         self.consumption = None
         self.radio = None
+        check_profiles([self])
 
     # pylint: disable=too-many-arguments
     def set_consumption(self, period, average,
@@ -31,11 +46,6 @@ class ProfileM3A8(object):
         """ Configure consumption measures """
         if not power and not voltage and not current:
             return
-        _err = "Required values period/average for consumption measure."
-        assert period is not None and average is not None, _err
-
-        assert period in self.choices['consumption']['period']
-        assert average in self.choices['consumption']['average']
         self.consumption = {
             'period': period,
             'average': average,
@@ -43,109 +53,331 @@ class ProfileM3A8(object):
             'voltage': voltage,
             'current': current,
         }
+        check_profiles([self])
 
     def set_radio(self, mode, channels, period=None, num_per_channel=0):
         """ Configure radio measures """
         if not mode:
             return
-        for channel in channels:
-            assert channel in self.choices['radio']['channels']
-
-        assert mode in ['rssi']
-        self._check_radio_rssi(channels, period, num_per_channel)
-
         self.radio = {
             'mode': mode,
             'period': period,
             'channels': channels,
             'num_per_channel': num_per_channel,
         }
+        check_profiles([self])
 
-    def _check_radio_rssi(self, channels, period, num_per_channel=0):
-        """ Check parameters for rssi measures """
-
-        _err = "Required 'channels/period' for radio rssi measure"
-        assert period is not None and channels is not None, _err
-
-        # num_per_channels is required when multiple channels are given
-        _err = "Required 'num_per_channels' as multiple channels provided"
-        assert len(channels) == 1 or num_per_channel != 0, _err
-
-        assert period in self.choices['radio']['period']
-        assert num_per_channel in self.choices['radio']['num_per_channel']
+    @classmethod
+    def validation_schema(cls):
+        """ Profile description schema """
+        return {
+            'nodearch': [cls.arch],
+            'profilename': schema.STRING,
+            'power': cls.choices['power_mode'],
+            'consumption': schema.Nullable(dict(
+                cls.choices['consumption'],
+                power=bool, voltage=bool, current=bool)),
+            'radio': schema.Nullable(dict(
+                cls.choices['radio'],
+                channels=schema.ListOf(cls.choices['radio']['channels']))),
+        }
 
-    def __eq__(self, other):  # pragma: no cover
-        return self.__dict__ == other.__dict__
+    @staticmethod
+    def checks(profile):
+        """ Errors for constraints between profile values """
+        radio = profile.get('radio') or {}
+        if len(radio.get('channels') or []) > 1 and \
+                not radio.get('num_per_channel'):
+            return ["Required 'radio.num_per_channel' as multiple channels "
+                    "provided"]
+        return []
 
 
 class ProfileM3(ProfileM3A8):
     """A Profile measure class for M3 """
+    __slots__ = ()
     arch = 'm3'
 
 
 class ProfileA8(ProfileM3A8):
     """A Profile measure class for A8 """
+    __slots__ = ()
     arch = 'a8'
 
 
-class ProfileWSN430(object):
+class ProfileWSN430(helpers.Serializable):
     """A Profile measure class for WSN430 """
+    __slots__ = _fields = ('nodearch', 'profilename', 'power', 'consumption',
+                           'radio', 'sensor')
     choices = {
         'power_mode': ['dc', 'battery'],
         'consumption': {'frequency': [5000, 1000, 500, 100, 70]},
         'radio': {'frequency': [5000, 1000, 500]},
         'sensor': {'frequency': [30000, 10000, 5000, 1000]},
     }
+    arch = 'wsn430'
 
     def __init__(self, profilename, power):
-        assert power in ProfileWSN430.choices['power_mode']
-        self.nodearch = 'wsn430'
+        self.nodearch = self.arch
         self.profilename = profilename
         self.power = power
 
         self.consumption = None
         self.radio = None
         self.sensor = None
+        check_profiles([self])
 
     def set_consumption(self, frequency, power=False, voltage=False,
                         current=False):
         """ Configure consumption measures """
         if not power and not voltage and not current:
             return
-        _err = "Required 'frequency' for consumption measure"
-        assert frequency is not None, _err
-
-        assert frequency in self.choices['consumption']['frequency']
         self.consumption = {
             'frequency': frequency,
             'power': power,
             'voltage': voltage,
             'current': current,
         }
+        check_profiles([self])
 
     def set_radio(self, frequency):
         """ Configure radio measures """
         if not frequency:
             return
-        assert frequency in self.choices['radio']['frequency']
         self.radio = {
             'frequency': frequency,
             'rssi': True,
         }
+        check_profiles([self])
 
     def set_sensors(self, frequency, temperature=False, luminosity=False):
         """ Configure sensor measures """
         if not temperature and not luminosity:
             return
-        _err = "Required 'frequency' for sensor measure"
-        assert frequency is not None, _err
-
-        assert frequency in self.choices['sensor']['frequency']
         self.sensor = {
             'frequency': frequency,
             'luminosity': luminosity,
             'temperature': temperature,
         }
+        check_profiles([self])
+
+    @classmethod
+    def validation_schema(cls):
+        """ Profile description schema """
+        return {
+            'nodearch': [cls.arch],
+            'profilename': schema.STRING,
+            'power': cls.choices['power_mode'],
+            'consumption': schema.Nullable(dict(
+                cls.choices['consumption'],
+                power=bool, voltage=bool, current=bool)),
+            'radio': schema.Nullable(dict(cls.choices['radio'], rssi=bool)),
+            'sensor': schema.Nullable(dict(
+                cls.choices['sensor'], luminosity=bool, temperature=bool)),
+        }
+
+    @staticmethod
+    def checks(_):
+        """ Errors for constraints between profile values """
+        return []
+
+
+PROFILE_CLASSES = dict((cls.arch, cls) for cls in
+                       (ProfileM3, ProfileA8, ProfileWSN430))
+
+
+def profile_errors(profile):
+    """ Return the list of errors in `profile` description
+
+    :param profile: Profile object or dict as loaded from JSON
+
+    >>> prof = {'profilename': 'prof', 'nodearch': 'm3', 'power': 'dc',
+    ...         'consumption': {'period': 140, 'average': None, 'power': True,
+    ...                         'voltage': False, 'current': False},
+    ...         'radio': {'mode': 'rssi', 'channels': [11, 27], 'period': 1,
+    ...                   'num_per_channel': 0}}
+    >>> for error in profile_errors(prof):
+    ...     print(error)
+    Required 'consumption.average'
+    Invalid 'radio.channels': 27 not in 11..26
+    Required 'radio.num_per_channel' as multiple channels provided
+
+    >>> profile_errors({'nodearch': 'm4'})
+    ["Invalid 'nodearch': 'm4' not in ['a8', 'm3', 'wsn430']"]
+    """
+    profile = _profile_dict(profile)
+    if not isinstance(profile, dict):
+        return ['Invalid profile: %r is not an object' % (profile,)]
+    cls = PROFILE_CLASSES.get(profile.get('nodearch'))
+    if cls is None:
+        return ['Invalid %r: %r not in %s' % (
+            'nodearch', profile.get('nodearch'), sorted(PROFILE_CLASSES))]
+    errors = schema.errors(cls.validation_schema(), profile)
+    return errors + cls.checks(profile)
+
+
+def _profile_dict(profile):
+    """ Profile description dict for Profile objects or dicts """
+    return profile.to_dict() if hasattr(profile, 'to_dict') else profile
+
+
+def check_profiles(profiles):
+    """ Check profiles descriptions, errors are reported for all of them
+
+    >>> check_profiles([ProfileM3('prof', 'dc'), {'profilename': 'other',
+    ...                 'nodearch': 'wsn430', 'power': 'ac'}])
+    Traceback (most recent call last):
+    ValueError: Invalid profile:
+      - other: Invalid 'power': 'ac' not in ['dc', 'battery']
+
+    :raises ValueError: with all profiles errors """
+    errors = []
+    for profile in profiles:
+        profile = _profile_dict(profile)
+        name = profile.get('profilename') if isinstance(profile, dict) \
+            else None
+        errors.extend('%s: %s' % (name, err) for err in
+                      profile_errors(profile))
+    if errors:
+        raise ValueError('Invalid profile:\n  - ' + '\n  - '.join(errors))
+
+
+# Profiles REST calls, with listing cached on disk
+
+PROFILES_MAX_AGE = 300
+SYNC_JOBS = 4
+
+
+def get_profiles(api, max_age=PROFILES_MAX_AGE):
+    """ Return user's profiles list, cached for `max_age` seconds """
+    disk_cache = cache.api_cache(api)
+    profiles = disk_cache.get('profiles', max_age=max_age)
+    if profiles is None:
+        profiles = api.get_profiles()
+        disk_cache.set('profiles', profiles)
+    return profiles
+
+
+def get_profile(api, name, max_age=PROFILES_MAX_AGE):
+    """ Return user's profile `name`, from cached profiles list if any """
+    profiles = cache.api_cache(api).get('profiles', max_age=max_age) or []
+    for profile in profiles:
+        if profile.get('profilename') == name:
+            return profile
+    return api.get_profile(name)
+
+
+def add_profile(api, name, profile):
+    """ Check and add user profile, and invalidate cached profiles list """
+    check_profiles([profile])
+    cache.api_cache(api).delete('profiles')
+    return api.add_profile(name, profile)
+
+
+def del_profile(api, name):
+    """ Delete user profile and invalidate cached profiles list """
+    cache.api_cache(api).delete('profiles')
+    return api.del_profile(name)
+
+
+def sync_profiles(api, profiles, delete=False, jobs=SYNC_JOBS):
+    """ Make user's profiles match `profiles`
+
+    Only profiles missing or different on the server are added, and
+    with `delete`, server profiles not in `profiles` are deleted.
+    Requests are run concurrently with `jobs` threads.
+
+    :param profiles: list of profiles dicts
+    :returns: {'added': [], 'updated': [], 'deleted': [], 'unchanged': [],
+               'errors': {name: error}}
+    """
+    check_profiles(profiles)
+    local = dict((prof['profilename'], prof) for prof in profiles)
+    remote = dict((prof['profilename'], prof)
+                  for prof in get_profiles(api, max_age=0))
+
+    result = {'added': [], 'updated': [], 'deleted': [], 'unchanged': [],
+              'errors': {}}
+    actions = []
+    for name in sorted(set(local) | set(remote)):
+        action = _sync_action(local.get(name), remote.get(name), delete)
+        if action is None:
+            result['unchanged'].append(name)
+        else:
+            actions.append((action, name, local.get(name)))
+
+    pool = ThreadPool(max(1, min(jobs, len(actions))))
+    try:
+        errors = pool.map(
+            deadline.bind(lambda action: _sync_run(api, *action)), actions)
+    finally:
+        pool.close()
+
+    for (action, name, profile), error in zip(actions, errors):
+        if error is None:
+            result[action].append(name)
+            remote[name] = profile
+        else:
+            result['errors'][name] = error
+
+    _cache_sync_result(api, remote, result['errors'])
+    return result
+
+
+def _cache_sync_result(api, remote, errors):
+    """ Cache profiles list after sync, `remote` deleted profiles are None
+    Cache is invalidated if there were errors """
+    disk_cache = cache.api_cache(api)
+    if errors:
+        disk_cache.delete('profiles')
+    else:
+        disk_cache.set('profiles', [remote[name] for name in sorted(remote)
+                                    if remote[name] is not None])
+
+
+def _sync_action(local, remote, delete):
+    """ Return sync action for profile with `local` and `remote` values
+
+    >>> _sync_action({'power': 'dc'}, None, False)
+    'added'
+    >>> _sync_action({'power': 'dc'}, {'power': 'battery'}, False)
+    'updated'
+    >>> _sync_action(None, {'power': 'dc'}, True)
+    'deleted'
+    >>> _sync_action(None, {'power': 'dc'}, False)
+    >>> _sync_action({'power': 'dc'}, {'power': 'dc'}, False)
+    >>> _sync_action({'power': 'dc', 'radio': None}, {'power': 'dc'}, False)
+    """
+    if local is None:
+        return 'deleted' if delete else None
+    if remote is None:
+        return 'added'
+    if _sync_normalized(local) != _sync_normalized(remote):
+        return 'updated'
+    return None
+
+
+def _sync_normalized(profile):
+    """ Profile as decoded from json, without unset (None) values
+
+    >>> _sync_normalized({'power': 'dc', 'radio': None}) == {'power': 'dc'}
+    True
+    """
+    profile = json.loads(helpers.json_dumps(profile))
+    return dict((key, value) for key, value in profile.items()
+                if value is not None)
+
 
-    def __eq__(self, other):  # pragma: no cover
-        return self.__dict__ == other.__dict__
+def _sync_run(api, action, name, profile):
+    """ Run sync `action` for profile `name`
+    Updated profiles are overwritten by adding them again, so they are
+    never lost if the request fails.
+    :returns: None or error message """
+    try:
+        if action == 'deleted':
+            api.del_profile(name)
+        else:
+            api.add_profile(name, profile)
+    except RuntimeError as err:
+        return str(err)
+    return None
@@ -0,0 +1,133 @@
+# -*- coding:utf-8 -*-
+""" Index of testbed resources for fast local queries """
+
+import time
+from iotlabcli import cache
+from iotlabcli import helpers
+
+# Resources listing is re-used from cache for this number of seconds
+RESOURCES_MAX_AGE = 60
+_RESOURCES_CACHE = {}
+FIELDS = ('site', 'archi', 'state', 'mobile')
+
+
+def get_resources(api, max_age=RESOURCES_MAX_AGE):
+    """ Return testbed resources list, as in `api.get_resources()['items']`
+
+    The listing is cached in memory and on disk for `max_age` seconds.
+    """
+    disk_cache = cache.api_cache(api)
+    key = disk_cache.directory
+    timestamp, resources = _RESOURCES_CACHE.get(key, (0, None))
+    if time.time() - timestamp < max_age:
+        return resources
+
+    resources = disk_cache.get('resources', max_age=max_age)
+    if resources is None:
+        resources = api.get_resources()['items']
+        disk_cache.set('resources', resources)
+    _RESOURCES_CACHE[key] = (time.time(), resources)
+    return resources
+
+
+class ResourcesIndex(object):
+    """ Resources indexed by site, archi, state and mobility
+
+    Filters values may be given as comma separated strings.
+    Archi matches both the full archi 'm3:at86rf231' or the node type 'm3'.
+
+    >>> index = ResourcesIndex([
+    ...     {'network_address': 'm3-1.grenoble.iot-lab.info', 'mobile': 0,
+    ...      'site': 'grenoble', 'archi': 'm3:at86rf231', 'state': 'Alive'},
+    ...     {'network_address': 'm3-2.grenoble.iot-lab.info', 'mobile': 0,
+    ...      'site': 'grenoble', 'archi': 'm3:at86rf231', 'state': 'Busy'},
+    ...     {'network_address': 'a8-1.grenoble.iot-lab.info', 'mobile': 1,
+    ...      'site': 'grenoble', 'archi': 'a8:at86rf231', 'state': 'Alive'},
+    ...     {'network_address': 'm3-1.lille.iot-lab.info', 'mobile': 0,
+    ...      'site': 'lille', 'archi': 'm3:at86rf231', 'state': 'Alive'},
+    ... ])
+    >>> index.nodes(site='grenoble', archi='m3')
+    ['m3-1.grenoble.iot-lab.info', 'm3-2.grenoble.iot-lab.info']
+    >>> index.nodes(state='Alive', mobile=False)
+    ['m3-1.grenoble.iot-lab.info', 'm3-1.lille.iot-lab.info']
+    >>> index.count(archi='m3', state='Alive,Busy')
+    3
+    >>> index.exp_list(site='grenoble') == {'items': [{'grenoble': {
+    ...     'm3': {'Alive': '1', 'Busy': '2'}, 'a8': {'Alive': '1'}}}]}
+    True
+    """
+    def __init__(self, resources):
+        self.resources = resources
+        self._index = dict((field, {}) for field in FIELDS)
+        for pos, res in enumerate(resources):
+            for field, value in self._index_values(res):
+                self._index[field].setdefault(value, []).append(pos)
+
+    @classmethod
+    def from_api(cls, api, max_age=RESOURCES_MAX_AGE):
+        """ Create index from `api` resources, see `get_resources` """
+        return cls(get_resources(api, max_age))
+
+    @staticmethod
+    def _index_values(res):
+        """ Return the (field, value) the resource should be indexed with """
+        archi = res['archi']
+        return [('site', res['site']), ('state', res['state']),
+                ('mobile', bool(int(res['mobile']))),
+                ('archi', archi), ('archi', archi.split(':')[0])]
+
+    def _positions(self, field, values):
+        """ Positions of resources with `field` in `values` """
+        if hasattr(values, 'split'):
+            values = values.split(',')
+        elif not isinstance(values, (list, tuple, set)):
+            values = [values]
+        index = self._index[field]
+        return set(pos for value in values for pos in index.get(value, []))
+
+    def filter(self, **filters):
+        """ Return resources matching filters: site, archi, state, mobile """
+        positions = None
+        for field, values in filters.items():
+            if values is None:
+                continue
+            matching = self._positions(field, values)
+            positions = matching if positions is None else \
+                positions & matching
+        if positions is None:
+            return list(self.resources)
+        return [self.resources[pos] for pos in sorted(positions)]
+
+    def count(self, **filters):
+        """ Return number of resources matching filters """
+        return len(self.filter(**filters))
+
+    def nodes(self, **filters):
+        """ Return network addresses of resources matching filters """
+        return [res['network_address'] for res in self.filter(**filters)]
+
+    def exp_list(self, **filters):
+        """ Return resources matching filters in exp_list format:
+        {'items': [{site: {node_type: {state: '1-34+72'}}}]} """
+        ids = {}
+        for res in self.filter(**filters):
+            site, node_type, num = helpers.node_url_sort_key(
+                res['network_address'])
+            ids.setdefault((site, node_type, res['state']), []).append(num)
+
+        result = {}
+        for (site, node_type, state), nums in ids.items():
+            result.setdefault(site, {}).setdefault(node_type, {})[state] = \
+                helpers.exp_list_str(helpers.ids_ranges(nums))
+        return {'items': [result]}
+
+    def counts(self, **filters):
+        """ Return resources count matching filters per site, node type and
+        state: {'items': [{site: {node_type: {state: count}}}]} """
+        result = {}
+        for res in self.filter(**filters):
+            site, node_type, _ = helpers.node_url_sort_key(
+                res['network_address'])
+            states = result.setdefault(site, {}).setdefault(node_type, {})
+            states[res['state']] = states.get(res['state'], 0) + 1
+        return {'items': [result]}
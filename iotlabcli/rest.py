@@ -8,34 +8,141 @@ first parameter to the function.
 
 """
 
-import requests
+import os
+import copy
 import json
-from requests.auth import HTTPBasicAuth
+import time
+import threading
 try:
     # pylint: disable=import-error,no-name-in-module
     from urllib.parse import urljoin
 except ImportError:  # pragma: no cover
     # pylint: disable=import-error,no-name-in-module
     from urlparse import urljoin
+import requests
+from requests.auth import HTTPBasicAuth
+from iotlabcli import deadline
 from iotlabcli import helpers
+from iotlabcli import transport as _transport
 
 
 API_URL = helpers.read_custom_api_url() or 'https://www.iot-lab.info/rest/'
+# Multipart requests bodies compression: 'gzip', 'deflate' or None
+API_COMPRESSION = os.getenv('IOTLAB_API_COMPRESSION') or None
+COMPRESSIONS = ('gzip', 'deflate')
+# smaller bodies are not worth compressing
+MIN_COMPRESSED_SIZE = 1024
+UNSUPPORTED_MEDIA_TYPE = 415
+# requests (connect, read) timeouts in seconds, read timeout is the maximum
+# time without receiving data, like while nodes are flashed
+TIMEOUT = (10, 300)
+# maximum number of GET results kept in an Api read cache
+READS_MAX = 128
+
+
+def _tag(url):
+    """ Cache tag of api relative `url`: its collection or item
+
+    >>> _tag('experiments?state=Running'), _tag('experiments/123/nodes?reset')
+    ('experiments', 'experiments/123')
+    """
+    return '/'.join(url.split('?')[0].split('/')[:2])
+
+
+def _touched_tags(url):
+    """ Cache tags touched by a write on api relative `url`. Writes on an
+    item also touch its collection, not writes on its sub-resources.
+
+    >>> _touched_tags('experiments'), _touched_tags('experiments/123')
+    (['experiments'], ['experiments/123', 'experiments'])
+    >>> _touched_tags('experiments/123/nodes?reset')
+    ['experiments/123']
+    """
+    path = url.split('?')[0].split('/')
+    tags = [_tag(url)]
+    if len(path) == 2:
+        tags.append(path[0])
+    return tags
+
+
+class _SingleFlight(object):  # pylint:disable=too-few-public-methods
+    """ Run identical concurrent calls once, callers waiting for the running
+    call share its result or exception """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def run(self, key, function, *args):
+        """ Return `function(*args)`, or the result of the running call with
+        the same `key` """
+        with self._lock:
+            call = self._calls.get(key)
+            running = call is not None
+            if not running:
+                call = self._calls[key] = {'done': threading.Event()}
+        if running:
+            deadline.wait(call['done'])
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = function(*args)
+            return call['result']
+        except Exception as err:
+            call['error'] = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
 
 
 # pylint: disable=maybe-no-member,no-member
 class Api(object):
     """ IoT-Lab REST API """
     _cache = {}
-
-    def __init__(self, username, password, url=API_URL):
+    # identical GET requests running concurrently are sent once
+    _single_flight = _SingleFlight()
+    # invalidations count, GET requests started before a write are not
+    # re-used after it
+    _generation = 0
+    # protects _generation and read caches
+    _reads_lock = threading.Lock()
+
+    # pylint:disable=too-many-arguments
+    def __init__(self, username, password, url=API_URL,
+                 compression=API_COMPRESSION, timeout=TIMEOUT, transport=None,
+                 cache_max_age=None):
         """
         :param username: username for Basic password auth
         :param password: password for Basic auth
         :param url: url of API.
+        :param compression: multipart bodies content-encoding, in
+            COMPRESSIONS or None. Requests are sent uncompressed if the
+            server does not support it.
+        :param timeout: requests timeout, (connect, read) or seconds, None
+            for no timeout. Timeouts are bounded by the current
+            `deadline.Deadline`
+        :param transport: requests sender, see `transport` module,
+            default uses requests module functions
+        :param cache_max_age: GET results are re-used for this number of
+            seconds, None to disable. Writes done through this Api evict the
+            results they affect: experiments listings, experiment info and
+            state, profiles. Raw results are not cached, and callers get
+            copies of cached results.
         """
+        if compression not in (None,) + COMPRESSIONS:
+            raise ValueError('Invalid compression %r not in %r' %
+                             (compression, COMPRESSIONS))
         self.url = url
         self.auth = HTTPBasicAuth(username, password)
+        self.compression = compression
+        self.timeout = timeout
+        self.transport = transport
+        self.cache_max_age = cache_max_age
+        # read cache {url: (time, tag, result)}
+        self._reads = {}
 
     def get_resources(self, list_id=False, site=None):
         """ Get testbed resources description
@@ -52,7 +159,7 @@ class Api(object):
         """ Submit user experiment
 
         :param files: experiment description and firmware(s)
-        :type files: dictionnary
+        :type files: dictionnary or helpers.MultipartBody
         :returns JSONObject
         """
         return self.method('experiments', method='MULTIPART', data=files)
@@ -112,6 +219,34 @@ class Api(object):
         return self.method('experiments/%s/nodes?update' % expid,
                            method='MULTIPART', data=files)
 
+    def node_update_reference(self, expid, sha1, nodes=()):
+        """ Update nodes with a firmware already uploaded for the experiment,
+        referenced by its content sha1
+
+        :param expid: experiment id submission (e.g. OAR scheduler)
+        :param sha1: firmware content sha1 hex digest
+        :param nodes: list of nodes, all nodes by default
+        :returns: JSONObject, or None if the server does not have this
+            firmware (HTTP 404)
+        :raises NotImplementedError: if the server does not support
+            firmware references (HTTP 405 or 501)
+        :raises RuntimeError: on other HTTP errors
+        """
+        url = urljoin(self.url, 'experiments/%s/nodes?update=%s' %
+                      (expid, sha1))
+        try:
+            status, content = self._request(url, 'POST', self.auth, nodes,
+                                            self._timeout(), self.transport)
+        finally:
+            self.invalidate(*_touched_tags('experiments/%s/nodes' % expid))
+        if status in (requests.codes.method_not_allowed,
+                      requests.codes.not_implemented):
+            raise NotImplementedError(
+                'HTTP error: %u, firmware references not supported' % status)
+        if status == requests.codes.not_found:
+            return None
+        return self._result(status, content)
+
     # Profile methods
 
     def get_profiles(self):
@@ -153,27 +288,124 @@ class Api(object):
 
     # Common methods
 
-    def method(self, url, method='GET', data=None, raw=False):
+    # pylint:disable=too-many-arguments
+    def method(self, url, method='GET', data=None, raw=False, timeout=None):
         """
         :param url: url of API.
         :param method: request method
         :param data: request data
+        :param timeout: request timeout instead of api one
         """
         method_url = urljoin(self.url, url)
-
-        return self._method(method_url, method, self.auth, data, raw)
+        if method == 'GET':
+            return self._get(method_url, _tag(url), raw, timeout)
+
+        try:
+            if method == 'MULTIPART' and self._compress():
+                return self._compressed_multipart(method_url, data, raw,
+                                                  timeout)
+            return self._method(method_url, method, self.auth, data, raw,
+                                self._timeout(timeout), self.transport)
+        finally:
+            # even failed writes may have been applied
+            self.invalidate(*_touched_tags(url))
+
+    def _get(self, url, tag, raw, timeout=None):
+        """ GET `url` result, from read cache if enabled and fresh """
+        with Api._reads_lock:
+            cached = None if raw else self._reads.get(url)
+            generation = Api._generation
+        if cached is not None and \
+                time.time() - cached[0] < self.cache_max_age:
+            return copy.deepcopy(cached[2])
+
+        result = self._single_flight.run(
+            (url, self.auth.username, raw, generation), self._method, url,
+            'GET', self.auth, None, raw, self._timeout(timeout),
+            self.transport)
+        if self.cache_max_age and not raw:
+            self._store_read(url, tag, copy.deepcopy(result), generation)
+        return result
+
+    def _store_read(self, url, tag, result, generation):
+        """ Cache `url` result, requested at `generation`, dropping expired
+        and oldest results to keep at most READS_MAX of them.
+        Results are not cached if invalidated while requesting. """
+        now = time.time()
+        with Api._reads_lock:
+            if generation != Api._generation:
+                return
+            reads = sorted(self._reads.items(), key=lambda item: item[1][0])
+            for key, (read_time, _, _) in reads:
+                if now - read_time >= self.cache_max_age or \
+                        len(self._reads) >= READS_MAX:
+                    del self._reads[key]
+            self._reads[url] = (now, tag, result)
+
+    def invalidate(self, *tags):
+        """ Evict read cache results with `tags`, all results if no tags
+
+        :param tags: api urls collection or item, like 'experiments',
+            'experiments/123' or 'profiles'
+        """
+        with Api._reads_lock:
+            Api._generation += 1
+            for key, (_, tag, _) in list(self._reads.items()):
+                if not tags or tag in tags:
+                    del self._reads[key]
+
+    def _timeout(self, timeout=None):
+        """ Request timeout, `timeout` or api one, bounded by deadline """
+        return deadline.request_timeout(
+            self.timeout if timeout is None else timeout)
+
+    def _compress(self):
+        """ Multipart bodies should be compressed """
+        return (self.compression is not None and
+                self._cache.get(('compression', self.url), True))
+
+    def _compressed_multipart(self, url, files, raw, timeout=None):
+        """ Post multipart `files` compressed if big enough.
+        Fallback to uncompressed body if the server does not support it """
+        body = helpers.MultipartBody(getattr(files, 'files', files))
+        if len(body) < MIN_COMPRESSED_SIZE:
+            return self._method(url, 'MULTIPART', self.auth, files, raw,
+                                self._timeout(timeout), self.transport)
+
+        compressed = helpers.CompressedBody(body, self.compression)
+        status, content = self._request(url, 'MULTIPART', self.auth,
+                                        compressed, self._timeout(timeout),
+                                        self.transport)
+        if status == UNSUPPORTED_MEDIA_TYPE:
+            self._cache[('compression', self.url)] = False
+            body = helpers.MultipartBody(body.files, body.boundary)
+            status, content = self._request(url, 'MULTIPART', self.auth, body,
+                                            self._timeout(timeout),
+                                            self.transport)
+        return self._result(status, content, raw)
 
     @classmethod
     def _method(cls, url, method='GET',  # pylint:disable=too-many-arguments
-                auth=None, data=None, raw=False):
+                auth=None, data=None, raw=False, timeout=None,
+                transport=None):
         """
         :param url: url to request.
         :param method: request method
         :param auth: HTTPBasicAuth object
         :param data: request data
         :param raw: Should data be loaded as json or not
+        :param timeout: requests timeout
+        :param transport: requests sender, transport.DEFAULT if None
+        """
+        status, content = cls._request(url, method, auth, data, timeout,
+                                       transport)
+        return cls._result(status, content, raw)
+
+    @staticmethod
+    def _result(status, content, raw=False):
+        """ Return request result from `status` and `content`
+        :param raw: Should data be loaded as json or not
         """
-        status, content = cls._request(url, method, auth, data)
         if status != requests.codes.ok:  # we have HTTP error (code != 200)
             raise RuntimeError("HTTP error: {0}\n{1}".format(status, content))
         # return result json object or request content
@@ -183,30 +415,39 @@ class Api(object):
             return json.loads(content.decode('utf-8'))
 
     @staticmethod
-    def _request(url, method='GET', auth=None, data=None):
+    def _request(url, method='GET',  # pylint:disable=too-many-arguments
+                 auth=None, data=None, timeout=None, transport=None):
         """
         Call http `method` on url with `auth` and `data`
         :param url: url to request.
         :param method: request method
         :param auth: HTTPBasicAuth object
         :param data: request data
+        :param timeout: requests timeout
+        :param transport: requests sender, transport.DEFAULT if None
+        :raises RuntimeError: on connection errors and timeouts
         """
+        kwargs = {'auth': auth, 'timeout': timeout}
+        http_method = 'POST'
         if method == 'POST':
-            headers = {'content-type': 'application/json'}
-            req = requests.post(url, auth=auth, headers=headers,
-                                data=helpers.json_dumps(data).encode('utf-8'))
+            kwargs['headers'] = {'content-type': 'application/json'}
+            kwargs['data'] = helpers.json_dumps(data).encode('utf-8')
+        elif method == 'MULTIPART' and isinstance(
+                data, (helpers.MultipartBody, helpers.CompressedBody)):
+            # streamed or compressed body
+            kwargs.update(headers=data.headers, data=data)
         elif method == 'MULTIPART':
-            req = requests.post(url, auth=auth, files=data)
-        elif method == 'DELETE':
-            req = requests.delete(url, auth=auth)
+            kwargs['files'] = data
         else:
-            req = requests.get(url, auth=auth)
-        return (req.status_code, req.content)
+            http_method = 'DELETE' if method == 'DELETE' else 'GET'
+        transport = transport or _transport.DEFAULT
+        return transport.request(http_method, url, **kwargs)
 
     @staticmethod
-    def get_sites():
+    def get_sites(transport=None):
         """ Get testbed sites description
-        May be run unauthicated
+        May be run unauthicated, so it does not use an Api instance
+        transport, give it as `transport`, transport.DEFAULT if None
 
         :returns JSONObject
         """
@@ -214,6 +455,9 @@ class Api(object):
 
         if 'sites' not in Api._cache:
             # unauthenticated request
-            sites = Api._method(urljoin(API_URL, 'experiments?sites'))
+            url = urljoin(API_URL, 'experiments?sites')
+            sites = Api._single_flight.run(
+                (url, None, False), Api._method, url, 'GET', None, None,
+                False, deadline.request_timeout(TIMEOUT), transport)
             Api._cache['sites'] = sites
         return Api._cache['sites']
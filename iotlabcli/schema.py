@@ -0,0 +1,157 @@
+# -*- coding:utf-8 -*-
+""" Declarative validation of json like values
+
+A schema is made of:
+ * a dict: value is a dict, each key validated with its schema
+ * a list, tuple, range or `Interval`: allowed values
+ * a type: value should be an instance of it
+ * a `Nullable` or `ListOf` schema
+ * a function: returns an error message or None
+
+>>> schema = {'name': STRING, 'power': ['dc', 'battery'],
+...           'radio': Nullable({'channels': ListOf(Interval(11, 26))})}
+>>> errors(schema, {'name': 'prof', 'power': 'dc', 'radio': None})
+[]
+>>> for err in errors(schema, {'power': 'ac', 'radio': {'channels': [1, 11]},
+...                            'other': 1}):
+...     print(err)
+Required 'name'
+Invalid 'power': 'ac' not in ['dc', 'battery']
+Invalid 'radio.channels': 1 not in 11..26
+Unknown field 'other'
+"""
+
+import numbers
+
+try:  # pragma: no cover
+    # pylint:disable=invalid-name,undefined-variable
+    STRING = basestring
+    RANGE = xrange
+except NameError:  # pragma: no cover
+    # pylint:disable=invalid-name
+    STRING = str
+    RANGE = range
+
+
+class Interval(object):
+    """ Integers from `first` to `last` included, with constant time
+    membership test, even on python2
+
+    >>> period = Interval(1, 2**16 - 1)
+    >>> 65535 in period, 0 in period, True in period, 1.0 in period
+    (True, False, False, False)
+    >>> str(period), len(period), list(Interval(1, 3))
+    ('1..65535', 65535, [1, 2, 3])
+    """
+    __slots__ = ('first', 'last')
+
+    def __init__(self, first, last):
+        self.first = first
+        self.last = last
+
+    def __contains__(self, value):
+        return (isinstance(value, numbers.Integral) and
+                not isinstance(value, bool) and
+                self.first <= value <= self.last)
+
+    def __iter__(self):
+        return iter(RANGE(self.first, self.last + 1))
+
+    def __len__(self):
+        return self.last - self.first + 1
+
+    def __str__(self):
+        return '%d..%d' % (self.first, self.last)
+
+    def __repr__(self):
+        return 'Interval(%d, %d)' % (self.first, self.last)
+
+
+class Nullable(object):  # pylint:disable=too-few-public-methods
+    """ Schema allowing None values """
+    def __init__(self, schema):
+        self.schema = schema
+
+
+class ListOf(object):  # pylint:disable=too-few-public-methods
+    """ Schema for non empty lists of values validated with `schema` """
+    def __init__(self, schema):
+        self.schema = schema
+
+
+def errors(schema, value, path=''):
+    """ Return the list of `value` errors with `schema` """
+    if isinstance(schema, Nullable):
+        return [] if value is None else errors(schema.schema, value, path)
+    if value is None:
+        return ['Required %r' % path]
+
+    if isinstance(schema, dict):
+        return _dict_errors(schema, value, path)
+    if isinstance(schema, ListOf):
+        return _list_errors(schema.schema, value, path)
+    error = _value_error(schema, value)
+    return [] if error is None else ['Invalid %r: %s' % (path, error)]
+
+
+def _dict_errors(schema, value, path):
+    """ Errors for dict `value` """
+    if not isinstance(value, dict):
+        return ['Invalid %r: %r is not an object' % (path, value)]
+    prefix = path + '.' if path else ''
+    errs = []
+    for key in sorted(schema):
+        errs.extend(errors(schema[key], value.get(key), prefix + key))
+    errs.extend('Unknown field %r' % (prefix + key)
+                for key in sorted(set(value) - set(schema)))
+    return errs
+
+
+def _list_errors(schema, value, path):
+    """ Errors for list `value` """
+    if not isinstance(value, (list, tuple)) or not value:
+        return ['Invalid %r: %r is not a non empty list' % (path, value)]
+    errs = []
+    for item in value:
+        errs.extend(errors(schema, item, path))
+    return errs
+
+
+def _value_error(schema, value):
+    """ Error for simple `value`, or None """
+    if isinstance(schema, type):
+        if isinstance(value, schema) and not _is_bool_as_int(schema, value):
+            return None
+        return '%r is not a %s' % (value, schema.__name__)
+    if isinstance(schema, (list, tuple, RANGE, Interval)):
+        return None if _in_choices(value, schema) else \
+            '%r not in %s' % (value, choices_str(schema))
+    return schema(value)
+
+
+def _is_bool_as_int(schema, value):
+    """ bool is an int subclass, but should not be accepted as an int """
+    return isinstance(value, bool) and schema is not bool
+
+
+def _in_choices(value, choices):
+    """ Value in choices, refusing bool and non numbers in numeric ranges """
+    if isinstance(value, bool) or (isinstance(choices, RANGE) and
+                                   not isinstance(value, numbers.Integral)):
+        return False
+    return value in choices
+
+
+def choices_str(choices):
+    """ Compact representation of choices
+
+    >>> choices_str(RANGE(11, 27)), choices_str(Interval(0, 255))
+    ('11..26', '0..255')
+    >>> choices_str([140, 204])
+    '[140, 204]'
+    """
+    if isinstance(choices, RANGE):
+        return '%d..%d' % (choices[0], choices[-1])
+    if isinstance(choices, Interval):
+        return str(choices)
+    return repr(list(choices))
@@ -0,0 +1,160 @@
+# -*- coding:utf-8 -*-
+""" Physical nodes selection from the testbed resources index """
+
+from iotlabcli import helpers
+from iotlabcli.resources import ResourcesIndex
+
+SELECTION_STATES = ('Alive',)
+
+
+def select_nodes(index, count,  # pylint:disable=too-many-arguments
+                 sites=None, archi=None, contiguous=False, exclude=()):
+    """ Select `count` available nodes in `index`
+
+    When multiple sites are given, nodes are spread evenly across them.
+
+    :param index: ResourcesIndex
+    :param count: number of nodes
+    :param sites: list of sites, all sites if None
+    :param archi: archi, 'm3:at86rf231' or 'm3', all archis if None
+    :param contiguous: select nodes with consecutive ids on each site
+    :param exclude: nodes that should not be selected
+    :returns: sorted nodes list
+
+    >>> index = ResourcesIndex([
+    ...     {'network_address': 'm3-%u.%s.iot-lab.info' % (num, site),
+    ...      'site': site, 'archi': 'm3:at86rf231', 'mobile': 0,
+    ...      'state': state}
+    ...     for site in ('grenoble', 'lille')
+    ...     for num, state in ((1, 'Alive'), (2, 'Busy'), (3, 'Alive'),
+    ...                        (4, 'Alive'), (5, 'Alive'))])
+    >>> select_nodes(index, 3, ['grenoble'], 'm3')
+    ['m3-1.grenoble.iot-lab.info', 'm3-3.grenoble.iot-lab.info', \
+'m3-4.grenoble.iot-lab.info']
+    >>> select_nodes(index, 2, ['grenoble'], contiguous=True)
+    ['m3-3.grenoble.iot-lab.info', 'm3-4.grenoble.iot-lab.info']
+    >>> select_nodes(index, 2, ['grenoble', 'lille'], 'm3:at86rf231')
+    ['m3-1.grenoble.iot-lab.info', 'm3-1.lille.iot-lab.info']
+    >>> select_nodes(index, 5, ['grenoble'])
+    Traceback (most recent call last):
+    ValueError: Not enough available nodes: 5 requested, 4 available
+
+    """
+    exclude = set(exclude)
+    groups = []
+    for site in sites or [None]:
+        nodes = [node for node in index.nodes(site=site, archi=archi,
+                                              state=SELECTION_STATES)
+                 if node not in exclude]
+        nodes.sort(key=helpers.node_url_sort_key)
+        groups.append(_runs(nodes) if contiguous else [nodes])
+
+    capacities = [max([len(run) for run in runs] + [0]) if contiguous else
+                  len(runs[0]) for runs in groups]
+    quotas = spread(count, capacities)
+
+    selected = []
+    for runs, quota in zip(groups, quotas):
+        selected.extend(_best_run(runs, quota)[:quota])
+    return sorted(selected, key=helpers.node_url_sort_key)
+
+
+def spread(count, capacities):
+    """ Spread `count` evenly in buckets with `capacities`
+
+    >>> spread(10, [4, 10, 10])
+    [4, 3, 3]
+    >>> spread(7, [1, 10, 10])
+    [1, 3, 3]
+    >>> spread(5, [2, 2])
+    Traceback (most recent call last):
+    ValueError: Not enough available nodes: 5 requested, 4 available
+    """
+    if count > sum(capacities):
+        raise ValueError(
+            'Not enough available nodes: %d requested, %d available' %
+            (count, sum(capacities)))
+
+    quotas = [0] * len(capacities)
+    remaining = count
+    while remaining:
+        open_buckets = [i for i, cap in enumerate(capacities)
+                        if quotas[i] < cap]
+        share = max(1, remaining // len(open_buckets))
+        for i in open_buckets[:remaining]:
+            take = min(share, capacities[i] - quotas[i], remaining)
+            quotas[i] += take
+            remaining -= take
+    return quotas
+
+
+def _runs(nodes):
+    """ Split sorted `nodes` in runs of consecutive ids of the same type
+
+    >>> _runs(['m3-1.grenoble.iot-lab.info', 'm3-2.grenoble.iot-lab.info',
+    ...        'm3-4.grenoble.iot-lab.info', 'a8-5.grenoble.iot-lab.info'])
+    [['m3-1.grenoble.iot-lab.info', 'm3-2.grenoble.iot-lab.info'], \
+['m3-4.grenoble.iot-lab.info'], ['a8-5.grenoble.iot-lab.info']]
+    """
+    runs = []
+    previous = None
+    for node in nodes:
+        site, node_type, num = helpers.node_url_sort_key(node)
+        if previous != (site, node_type, num - 1):
+            runs.append([])
+        runs[-1].append(node)
+        previous = (site, node_type, num)
+    return runs
+
+
+def _best_run(runs, size):
+    """ Return the smallest run with at least `size` nodes, keeping bigger
+    runs for other selections """
+    return min([run for run in runs if len(run) >= size] or [[]], key=len)
+
+
+class NodesPick(helpers.Serializable):
+    # pylint:disable=too-few-public-methods
+    """ Physical nodes to select when submitting the experiment
+
+    >>> NodesPick(10, ['grenoble', 'lille'], 'm3', contiguous=True)
+    NodesPick(10, ['grenoble', 'lille'], 'm3', contiguous=True)
+    """
+    __slots__ = _fields = ('count', 'sites', 'archi', 'contiguous')
+
+    def __init__(self, count, sites, archi=None, contiguous=False):
+        self.count = count
+        self.sites = sites
+        self.archi = archi
+        self.contiguous = contiguous
+
+    def select(self, index, exclude=()):
+        """ Select nodes in index, see `select_nodes` """
+        return select_nodes(index, self.count, self.sites, self.archi,
+                            self.contiguous, exclude)
+
+    def __repr__(self):
+        return 'NodesPick(%r, %r, %r, contiguous=%r)' % (
+            self.count, self.sites, self.archi, self.contiguous)
+
+
+def resolve_picks(api, resources):
+    """ Return `resources` with NodesPick nodes replaced by selected nodes.
+
+    Selection uses `api` cached resources index and avoids nodes already
+    used by other resources.
+    """
+    if not any(isinstance(res['nodes'], NodesPick) for res in resources):
+        return resources
+
+    index = ResourcesIndex.from_api(api)
+    used = set(node for res in resources if res['type'] == 'physical' and
+               not isinstance(res['nodes'], NodesPick)
+               for node in res['nodes'])
+    resolved = []
+    for res in resources:
+        if isinstance(res['nodes'], NodesPick):
+            res = dict(res, nodes=res['nodes'].select(index, used))
+            used.update(res['nodes'])
+        resolved.append(res)
+    return resolved
@@ -24,6 +24,14 @@ class TestAuthModule(unittest.TestCase):
         except OSError:
             pass
         patch('iotlabcli.auth.RC_FILE', TEST_RC_FILE).start()
+        patch.dict('iotlabcli.auth._RC_CACHE', clear=True).start()
+        patch.dict('iotlabcli.auth._KEYRING_PASSWORDS', clear=True).start()
+        patch.dict('os.environ').start()
+        os.environ.pop('IOTLAB_USERNAME', None)
+        os.environ.pop('IOTLAB_PASSWORD', None)
+        os.environ.pop('IOTLAB_PASSWORD_FILE', None)
+        self.keyring = patch('iotlabcli.auth._keyring_lookup').start()
+        self.keyring.return_value = None
         self.passwords = []
         m_getpass = patch('getpass.getpass').start()
         m_getpass.side_effect = self.getpass
@@ -73,3 +81,62 @@ class TestAuthModule(unittest.TestCase):
         open(TEST_RC_FILE, 'wb').close()
         with patch(open_name, m_open, create=True):
             self.assertRaises(ValueError, auth._read_password_file)
+
+    def test_password_file_cache(self):
+        """ Test password file is only read again when modified """
+        auth.write_password_file('username', 'password')
+        with patch('iotlabcli.auth._parse_password_file') as m_parse:
+            self.assertEquals(('username', 'password'),
+                              auth.get_user_credentials())
+            self.assertFalse(m_parse.called)
+
+        # modified file
+        with open(TEST_RC_FILE, 'w') as rc_file:
+            rc_file.write('other_user:cGFzc3dvcmQ=\n')
+        self.assertEquals(('other_user', 'password'),
+                          auth.get_user_credentials())
+        with patch('iotlabcli.auth._parse_password_file') as m_parse:
+            auth.get_user_credentials()
+            self.assertFalse(m_parse.called)
+
+        os.remove(TEST_RC_FILE)
+        self.assertEquals((None, None), auth.get_user_credentials())
+
+    def test_password_file_env(self):
+        """ Test password file path set in environment after import """
+        auth.write_password_file('username', 'password')
+        env_rc_file = TEST_RC_FILE + '_env'
+        os.environ['IOTLAB_PASSWORD_FILE'] = env_rc_file
+        try:
+            self.assertEquals((None, None), auth.get_user_credentials())
+            auth.write_password_file('env_user', 'env_password')
+            self.assertEquals(('env_user', 'env_password'),
+                              auth.get_user_credentials())
+        finally:
+            os.remove(env_rc_file)
+
+    def test_env_and_keyring_credentials(self):
+        """ Test environment and keyring credentials providers """
+        auth.write_password_file('username', 'password')
+        os.environ['IOTLAB_USERNAME'] = 'env_user'
+        # no password, fallback to password file
+        self.assertEquals(('username', 'password'),
+                          auth.get_user_credentials())
+
+        self.keyring.side_effect = {'user': 'keyring_passwd',
+                                    'env_user': 'env_keyring_passwd'}.get
+        self.assertEquals(('user', 'keyring_passwd'),
+                          auth.get_user_credentials('user'))
+        # keyring looked up once per user
+        self.assertEquals(('username', 'password'),
+                          auth.get_user_credentials())
+        self.assertEquals(2, self.keyring.call_count)
+        auth._KEYRING_PASSWORDS.clear()  # pylint:disable=protected-access
+        self.assertEquals(('env_user', 'env_keyring_passwd'),
+                          auth.get_user_credentials())
+
+        os.environ['IOTLAB_PASSWORD'] = 'env_passwd'
+        self.assertEquals(('env_user', 'env_passwd'),
+                          auth.get_user_credentials())
+        self.assertEquals(('user', 'passwd'),
+                          auth.get_user_credentials('user', 'passwd'))
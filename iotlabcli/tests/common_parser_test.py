@@ -11,6 +11,12 @@ try:
 except ImportError:  # pragma: no cover
     # pylint: disable=import-error,no-name-in-module
     from unittest.mock import patch, Mock
+try:
+    # pylint: disable=import-error,no-name-in-module
+    from StringIO import StringIO
+except ImportError:  # pragma: no cover
+    # pylint: disable=import-error,no-name-in-module
+    from io import StringIO
 from iotlabcli.parser import common
 
 
@@ -36,6 +42,12 @@ class TestCommonParser(unittest.TestCase):
 
         common.main_cli(function, parser)
 
+        # generated results are printed as json lines
+        function.return_value = (res for res in [{'a': 1}, {'b': 2}])
+        with patch('sys.stdout', StringIO()) as stdout:
+            common.main_cli(function, parser)
+        self.assertEquals('{"a": 1}\n{"b": 2}\n', stdout.getvalue())
+
         function.side_effect = IOError()
         self.assertRaises(SystemExit, common.main_cli, function, parser)
 
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+""" Test the iotlabcli.deadline module """
+
+# pylint: disable=too-many-public-methods
+import time
+import threading
+import unittest
+from multiprocessing.pool import ThreadPool
+from iotlabcli import deadline
+
+
+class TestDeadline(unittest.TestCase):
+    """ Test iotlabcli.deadline """
+
+    def test_cancel(self):
+        """ Cancel a deadline from another thread """
+        with deadline.Deadline() as dline:
+            threading.Timer(0.05, dline.cancel).start()
+            start = time.time()
+            self.assertRaises(deadline.DeadlineExceeded, deadline.sleep, 10)
+            self.assertTrue(time.time() - start < 1)
+            self.assertRaises(deadline.DeadlineExceeded, dline.remaining)
+
+    def test_nested(self):
+        """ Nested deadlines end with their parent """
+        with deadline.Deadline(10) as parent:
+            with deadline.Deadline(100) as child:
+                self.assertEquals(parent.end, child.end)
+                self.assertTrue(deadline.current() is child)
+                parent.cancel()
+                self.assertRaises(deadline.DeadlineExceeded, child.sleep, 1)
+            self.assertTrue(deadline.current() is parent)
+        self.assertTrue(deadline.current() is None)
+
+        # sleep not interrupted
+        with deadline.Deadline(10):
+            deadline.sleep(0.01)
+        deadline.sleep(0.01)
+
+    def test_wait(self):
+        """ Wait for an event, bounded by the deadline """
+        event = threading.Event()
+        threading.Timer(0.05, event.set).start()
+        deadline.wait(event)
+        self.assertTrue(event.is_set())
+
+        with deadline.Deadline(0.05):
+            self.assertRaises(deadline.DeadlineExceeded, deadline.wait,
+                              threading.Event())
+
+    def test_request_timeout(self):
+        """ Requests timeouts bounded by the deadline """
+        self.assertEquals((10, None), deadline.request_timeout((10, None)))
+        with deadline.Deadline(5):
+            connect, read = deadline.request_timeout((10, None))
+            self.assertTrue(4 < connect <= 5 and connect == read)
+            self.assertEquals(1, deadline.request_timeout(1))
+        with deadline.Deadline(0):
+            self.assertRaises(deadline.DeadlineExceeded,
+                              deadline.request_timeout, 1)
+
+    def test_bind(self):
+        """ Deadline used in worker threads """
+        pool = ThreadPool(2)
+        self.assertEquals([None, None],
+                          pool.map(deadline.bind(lambda _: deadline.current()),
+                                   [1, 2]))
+        with deadline.Deadline(10) as dline:
+            self.assertEquals(
+                [dline, dline],
+                pool.map(deadline.bind(lambda _: deadline.current()), [1, 2]))
+        pool.close()
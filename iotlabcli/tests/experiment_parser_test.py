@@ -13,6 +13,7 @@ except ImportError:  # pragma: no cover
 from iotlabcli.tests.my_mock import MainMock
 import iotlabcli.parser.experiment as experiment_parser
 from iotlabcli import experiment
+from iotlabcli import selection
 
 
 class TestMainInfoParser(MainMock):
@@ -27,9 +28,19 @@ class TestMainInfoParser(MainMock):
         info_exp.return_value = {}
 
         experiment_parser.main(['info', '--list'])
-        info_exp.assert_called_with(self.api, False, None)
+        info_exp.assert_called_with(self.api, False, None, None, None)
         experiment_parser.main(['info', '--list-id', '--site', 'grenoble'])
-        info_exp.assert_called_with(self.api, True, 'grenoble')
+        info_exp.assert_called_with(self.api, True, 'grenoble', None, None)
+        experiment_parser.main(['info', '-li', '--archi', 'm3',
+                                '--state', 'Alive,Busy'])
+        info_exp.assert_called_with(self.api, True, None, 'm3', 'Alive,Busy')
+
+    @patch('iotlabcli.experiment.count_resources')
+    def test_main_info_count_parser(self, count_res):
+        """ Run experiment_parser.main.info --count """
+        count_res.return_value = {}
+        experiment_parser.main(['info', '--count', '--site', 'grenoble'])
+        count_res.assert_called_with(self.api, 'grenoble', None, None)
 
     @patch('iotlabcli.experiment.stop_experiment')
     def test_main_stop_parser(self, stop_exp):
@@ -84,14 +95,14 @@ class TestMainInfoParser(MainMock):
                 None, None)
         ]
         submit_exp.assert_called_with(self.api, 'exp_name', 20, nodes_list,
-                                      314159, False)
+                                      314159, False, False)
 
         # print with simple options
         nodes = [experiment.exp_resources(['m3-1.grenoble.iot-lab.info'])]
         experiment_parser.main(
             ['submit', '-p', '-d', '20', '-l', 'grenoble,m3,1'])
         submit_exp.assert_called_with(self.api, None, 20, nodes,
-                                      None, True)
+                                      None, True, False)
 
         # Alias tests
         experiment_parser.main([
@@ -114,7 +125,22 @@ class TestMainInfoParser(MainMock):
         ]
 
         submit_exp.assert_called_with(self.api, None, 20, nodes_list,
-                                      None, False)
+                                      None, False, False)
+
+        # validate
+        experiment_parser.main(['submit', '-d', '20', '--validate',
+                                '-l', 'grenoble,m3,1'])
+        submit_exp.assert_called_with(self.api, None, 20, nodes,
+                                      None, False, True)
+
+        # nodes selection
+        experiment_parser.main(['submit', '-d', '20', '-l',
+                                'grenoble+strasbourg,m3,pick:4,tp.elf'])
+        nodes_list = [experiment.exp_resources(
+            selection.NodesPick(4, ['grenoble', 'strasbourg'], 'm3'),
+            'tp.elf')]
+        submit_exp.assert_called_with(self.api, None, 20, nodes_list,
+                                      None, False, False)
 
     def test_main_submit_parser_error(self):
         """ Run experiment_parser.main.submit with error"""
@@ -129,6 +155,38 @@ class TestMainInfoParser(MainMock):
             SystemExit, experiment_parser.main,
             ['submit', '--duration', '20', '-l', 'grenoble,m3,100-1'])
 
+        # Nodes selection
+        self.assertRaises(
+            SystemExit, experiment_parser.main,
+            ['submit', '--duration', '20', '-l', 'grenoble,m3,pick:1:spread'])
+        self.assertRaises(
+            SystemExit, experiment_parser.main,
+            ['submit', '--duration', '20', '-l', 'grenoble+lille,m3,pick:1'])
+
+    @patch('iotlabcli.experiment.submit_experiment')
+    def test_main_submit_parser_sites(self, submit_exp):
+        """ Run experiment_parser.main.submit sites checked in one pass """
+        submit_exp.return_value = {}
+        lists = ['-l', 'grenoble,m3,1-2', '-l', 'strasbourg,a8,1',
+                 '-l', '2,archi=m3:at86rf231+site=euratech',
+                 '-l', 'grenoble+euratech,m3,pick:2']
+        with patch('iotlabcli.parser.common.sites_list') as sites_list:
+            sites_list.return_value = ['grenoble', 'strasbourg', 'euratech']
+            experiment_parser.main(['submit', '-d', '20'] + lists)
+            self.assertEquals(1, sites_list.call_count)
+            self.assertEquals(4, len(submit_exp.call_args[0][3]))
+
+            # unknown sites are all reported, nodes lists are not expanded
+            sites_list.reset_mock()
+            with patch('iotlabcli.parser.common.nodes_list_from_info') as \
+                    nodes:
+                self.assertRaises(
+                    SystemExit, experiment_parser.main,
+                    ['submit', '-d', '20', '-l', 'lille,m3,1',
+                     '-l', 'paris,m3,1'] + lists)
+                self.assertFalse(nodes.called)
+            self.assertEquals(1, sites_list.call_count)
+
     @patch('iotlabcli.experiment.wait_experiment')
     def test_main_wait_parser(self, wait_exp):
         """ Run experiment_parser.main.info """
@@ -141,6 +199,57 @@ class TestMainInfoParser(MainMock):
                                 '--timeout', '60'])
         wait_exp.assert_called_with(self.api, 42, 'Launching,Running', 1, 60)
 
+    @patch('iotlabcli.experiment.watch_experiments')
+    def test_main_watch_parser(self, watch_exps):
+        """ Run experiment_parser.main.watch """
+        watch_exps.return_value = (evt for evt in [{'id': 42}])
+
+        experiment_parser.main(['watch'])
+        watch_exps.assert_called_with(self.api, None, 5, float('+inf'))
+        experiment_parser.main(['watch', '-i', '42', '-i', '43',
+                                '--step', '1', '--timeout', '60'])
+        watch_exps.assert_called_with(self.api, [42, 43], 1, 60)
+
+    @patch('iotlabcli.jobs.JobQueue')
+    def test_main_queue_parser(self, queue_class):
+        """ Run experiment_parser.main.queue """
+        queue = queue_class.return_value
+        queue.jobs.return_value = []
+        queue.run.return_value = {}
+
+        experiment_parser.main(['submit', '--queue', '-n', 'exp', '-d', '20',
+                                '-l', 'grenoble,m3,1-2'])
+        queue.add.assert_called_with(
+            'exp', 20, [experiment.exp_resources(
+                ['m3-1.grenoble.iot-lab.info', 'm3-2.grenoble.iot-lab.info'])],
+            None)
+        queue_class.assert_called_with(None)
+        self.assertEquals(1, queue.close.call_count)
+
+        experiment_parser.main(['submit', '--queue', '-n', 'exp', '-d', '20',
+                                '-l', 'grenoble,m3,1-2', '--db', 'jobs.db'])
+        queue_class.assert_called_with('jobs.db')
+        self.assertEquals(2, queue.close.call_count)
+
+        # submission options not supported by the queue
+        for option in ('--print', '--validate'):
+            self.assertRaises(
+                SystemExit, experiment_parser.main,
+                ['submit', '--queue', '-n', 'exp', '-d', '20',
+                 '-l', 'grenoble,m3,1-2', option])
+        self.assertEquals(2, queue_class.call_count)
+
+        experiment_parser.main(['queue'])
+        queue_class.assert_called_with(None)
+        self.assertEquals(1, queue.jobs.call_count)
+        self.assertEquals(0, queue.run.call_count)
+
+        experiment_parser.main(['queue', '--run', '--retry', '-j', '8',
+                                '--db', 'jobs.db'])
+        queue_class.assert_called_with('jobs.db')
+        queue.run.assert_called_with(self.api, 8, True)
+        self.assertEquals(4, queue.close.call_count)
+
     @patch('iotlabcli.experiment.load_experiment')
     def test_main_load_parser(self, load_exp):
         """ Run experiment_parser.main.load """
@@ -148,4 +257,24 @@ class TestMainInfoParser(MainMock):
         experiment_parser.main(['load', '-f', '../test_exp.json',
                                 '-l', '~/firmware.elf,./firmware_2.elf'])
         load_exp.assert_called_with(self.api, '../test_exp.json',
-                                    ['~/firmware.elf', './firmware_2.elf'])
+                                    ['~/firmware.elf', './firmware_2.elf'],
+                                    False)
+
+    def test_lazy_subparsers(self):
+        """ Only the used subcommand parser is built """
+        parser = experiment_parser.parse_options(lazy=True)
+        # pylint:disable=protected-access
+        subparsers = parser._subparsers._group_actions[0]
+        self.assertEquals({}, subparsers._name_parser_map)
+
+        opts = parser.parse_args(['get', '-s'])
+        self.assertEquals('state', opts.get_cmd)
+        self.assertEquals(['get'], list(subparsers._name_parser_map))
+        self.assertRaises(SystemExit, parser.parse_args, ['unknown'])
+
+        # help lists all subcommands in registration order
+        subparsers.build_all()
+        self.assertEquals(subparsers.choices, list(
+            action.dest for action in subparsers._choices_actions))
+        self.assertEquals(sorted(subparsers.choices),
+                          sorted(subparsers._name_parser_map))
@@ -11,13 +11,16 @@ import os.path
 import unittest
 try:
     # pylint: disable=import-error,no-name-in-module
-    from mock import patch, mock_open
+    from mock import patch, mock_open, call
 except ImportError:  # pragma: no cover
     # pylint: disable=import-error,no-name-in-module
-    from unittest.mock import patch, mock_open
+    from unittest.mock import patch, mock_open, call
 import json
 from iotlabcli import experiment
+from iotlabcli import firmware
+from iotlabcli import helpers
 from iotlabcli import rest
+from iotlabcli import selection
 from iotlabcli.tests.my_mock import CommandMock, API_RET, RequestRet
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -84,7 +87,7 @@ class TestExperimentSubmit(CommandMock):
         ret = experiment.submit_experiment(self.api, 'exp_name', 20,
                                            nodes_list, start_time=314159,
                                            print_json=True)
-        self.assertEquals(ret.__dict__, expected)
+        self.assertEquals(ret.to_dict(), expected)
 
     def test_experiment_submit_alias(self):
         """ Run experiment_submit alias """
@@ -135,6 +138,18 @@ class TestExperimentSubmit(CommandMock):
         self.assertEquals(expected, exp_desc)
         self.assertTrue('firmware.elf' in files_dict)
 
+    def test_exp_submit_invalid_firmwares(self):
+        """ Invalid firmwares are all reported before submitting """
+        nodes_list = [
+            experiment.exp_resources(['m3-1.grenoble.iot-lab.info'],
+                                     CURRENT_DIR + '/missing.elf'),
+            experiment.exp_resources(['m3-2.grenoble.iot-lab.info'],
+                                     CURRENT_DIR + '/missing.hex'),
+        ]
+        self.assertRaises(ValueError, experiment.submit_experiment,
+                          self.api, 'exp_name', 20, nodes_list)
+        self.assertFalse(self.api.submit_experiment.called)
+
     def test_exp_submit_types_detect(self):
         """ Try experiment submit types detection"""
         # Physical tests and Alias Nodes
@@ -195,6 +210,191 @@ class TestExperimentSubmit(CommandMock):
             ['firmware.elf', 'firmware_2.elf', 'firmware_3.elf'])
 
 
+class TestExperimentBuilder(CommandMock):
+    """ Test iotlabcli.experiment.ExperimentBuilder """
+
+    def test_builder_submit(self):
+        """ Submit an experiment with streamed description """
+        nodes = ['m3-%u.grenoble.iot-lab.info' % num for num in range(1, 6)]
+        builder = experiment.ExperimentBuilder('exp_name', 20)
+        builder.add(nodes[0:3], CURRENT_DIR + '/firmware.elf', 'profile1')
+        builder.add(nodes[3:5], CURRENT_DIR + '/firmware_2.elf')
+        builder.submit(self.api)
+
+        body = self.api.submit_experiment.call_args[0][0]
+        self.assertTrue(isinstance(body, helpers.MultipartBody))
+        content = body.read()
+        self.assertEquals(len(body), len(content))
+        self.assertTrue(helpers.json_dumps(builder.experiment).encode('utf-8')
+                        in content)
+        self.assertTrue(helpers.read_file(CURRENT_DIR + '/firmware.elf', 'b')
+                        in content)
+
+        # same description as with 'files'
+        files = builder.files()
+        self.assertEquals(set(['new_exp.json', 'firmware.elf',
+                               'firmware_2.elf']), set(files))
+        self.assertEquals(builder.experiment.nodes, nodes)
+
+    def test_builder_nodes_pick(self):
+        """ Nodes picks should be selected before being added """
+        builder = experiment.ExperimentBuilder('exp_name', 20)
+        self.assertRaises(ValueError, builder.add,
+                          selection.NodesPick(2, ['grenoble'], 'm3'))
+        self.assertEquals([], builder.experiment.nodes)
+
+    @patch('iotlabcli.firmware.FIRMWARE_REFERENCE', True)
+    def test_submit_registers_firmwares(self):
+        """ Submitted firmwares are recorded to be referenced later """
+        self.api.submit_experiment.return_value = {'id': 123}
+        fw_1 = CURRENT_DIR + '/firmware.elf'
+        fw_2 = CURRENT_DIR + '/firmware_2.elf'
+        nodes = ['m3-%u.grenoble.iot-lab.info' % num for num in range(1, 3)]
+        registry = firmware.FirmwareRegistry(self.api)
+
+        builder = experiment.ExperimentBuilder('exp_name', 20)
+        builder.add(nodes[0:1], fw_1)
+        builder.add(nodes[1:2], fw_2)
+        builder.submit(self.api)
+        self.assertEquals(
+            set([firmware.file_sha1(fw_1), firmware.file_sha1(fw_2)]),
+            set(registry.uploaded(123)))
+
+        exp_path = os.path.join(self.cache_dir, 'exp.json')
+        with open(exp_path, 'w') as exp_file:
+            exp_file.write(helpers.json_dumps(builder.experiment))
+        self.api.submit_experiment.return_value = {'id': 124}
+        experiment.load_experiment(self.api, exp_path, [fw_1, fw_2])
+        self.assertEquals(set(registry.uploaded(123)),
+                          set(registry.uploaded(124)))
+
+    def test_builder_firmware_conflict(self):
+        """ Different firmwares with the same name """
+        builder = experiment.ExperimentBuilder('exp_name', 20)
+        builder.add(['m3-1.grenoble.iot-lab.info'],
+                    CURRENT_DIR + '/firmware.elf')
+        with patch('iotlabcli.helpers.read_file', side_effect=['a', 'b']):
+            self.assertRaises(ValueError, builder.add,
+                              ['m3-2.grenoble.iot-lab.info'],
+                              '/other/dir/firmware.elf')
+
+
+class TestExperimentValidate(CommandMock):
+    """ Test iotlabcli.experiment.validate_experiment """
+    resources = [
+        {'network_address': 'm3-%u.grenoble.iot-lab.info' % num,
+         'site': 'grenoble', 'archi': 'm3:at86rf231', 'mobile': '0',
+         'state': state}
+        for num, state in ((1, 'Alive'), (2, 'Busy'), (3, 'Absent'))]
+
+    def test_validate_physical(self):
+        """ Validate physical experiment """
+        node_fmt = 'm3-%u.grenoble.iot-lab.info'
+        exp = experiment._Experiment('exp_name', 20)
+        exp.add_exp_resources(experiment.exp_resources(
+            [node_fmt % 1, node_fmt % 2], 'firmware.elf', 'prof'))
+        self.assertEquals(
+            [], experiment.validate_experiment(
+                exp, {'firmware.elf': ''}, self.resources))
+
+        # all errors are reported
+        exp.add_exp_resources(experiment.exp_resources(
+            [node_fmt % 3, node_fmt % 4]))
+        exp.firmwareassociations.append(
+            experiment._FirmwareAssociations('other.elf', [node_fmt % 1]))
+        errors = experiment.validate_experiment(exp, {}, self.resources)
+        self.assertEquals(errors, [
+            "Node 'm3-3.grenoble.iot-lab.info' is not available: 'Absent'",
+            "Unknown node 'm3-4.grenoble.iot-lab.info'",
+            "Node 'm3-1.grenoble.iot-lab.info' has several firmwares: "
+            "'firmware.elf' and 'other.elf'",
+            "Firmware 'firmware.elf' not in experiment files",
+            "Firmware 'other.elf' not in experiment files",
+        ])
+
+    def test_validate_alias(self):
+        """ Validate alias experiment description """
+        exp = experiment._Experiment('exp_name', 20)
+        exp.add_exp_resources(experiment.exp_resources(
+            experiment.AliasNodes(2, 'grenoble', 'm3:at86rf231'),
+            None, 'prof'))
+        self.assertEquals(
+            [], experiment.validate_experiment(exp, {}, self.resources))
+
+        exp.add_exp_resources(experiment.exp_resources(
+            experiment.AliasNodes(1, 'grenoble', 'm3:at86rf231')))
+        exp.add_exp_resources(experiment.exp_resources(
+            experiment.AliasNodes(1, 'grenoble', 'a8:at86rf231')))
+
+        # json loaded description with mixed types
+        desc = json.loads(helpers.json_dumps(exp))
+        desc['nodes'].append('m3-1.grenoble.iot-lab.info')
+        desc['profileassociations'][0]['nodes'].append('4')
+        desc['nodes'][0]['properties']['archi'] = 'm4:at86rf231'
+
+        errors = experiment.validate_experiment(desc, None, self.resources)
+        self.assertEquals(errors, [
+            "Invalid archi 'm4:at86rf231' for alias '1'",
+            "Physical node in alias experiment: "
+            "'m3-1.grenoble.iot-lab.info'",
+            "Not enough 'a8:at86rf231' nodes on site 'grenoble': "
+            "1 requested, 0 available",
+            "Profile 'prof' node '4' not in experiment",
+        ])
+
+    def test_submit_validate(self):
+        """ Submit experiment with validation """
+        self.api.get_resources.return_value = {'items': self.resources}
+
+        resources = [experiment.exp_resources(
+            ['m3-1.grenoble.iot-lab.info'], CURRENT_DIR + '/firmware.elf')]
+        experiment.submit_experiment(self.api, 'exp_name', 20, resources,
+                                     validate=True)
+        self.assertTrue(self.api.submit_experiment.called)
+
+        self.api.submit_experiment.reset_mock()
+        resources = [experiment.exp_resources(
+            ['m3-3.grenoble.iot-lab.info', 'm3-4.grenoble.iot-lab.info'])]
+        self.assertRaises(ValueError, experiment.submit_experiment,
+                          self.api, 'exp_name', 20, resources, validate=True)
+        self.assertFalse(self.api.submit_experiment.called)
+        # resources only requested once
+        self.assertEquals(1, self.api.get_resources.call_count)
+
+
+class TestExperimentSelection(CommandMock):
+    """ Test submitting experiment with selected nodes """
+
+    def test_submit_nodes_pick(self):
+        """ Submit experiment with nodes selected from resources """
+        node_fmt = 'm3-%u.grenoble.iot-lab.info'
+        self.api.get_resources.return_value = {'items': [
+            {'network_address': node_fmt % num, 'site': 'grenoble',
+             'archi': 'm3:at86rf231', 'mobile': 0, 'state': 'Alive'}
+            for num in (1, 2, 3, 5, 6, 7)]}
+
+        resources = [
+            experiment.exp_resources([node_fmt % 1]),
+            experiment.exp_resources(
+                selection.NodesPick(2, ['grenoble'], 'm3'), 'tp.elf'),
+            experiment.exp_resources(
+                selection.NodesPick(3, ['grenoble'], 'm3', contiguous=True)),
+        ]
+        exp = experiment.submit_experiment(self.api, 'exp_name', 20,
+                                           resources, print_json=True)
+        self.assertEquals([node_fmt % num for num in (1, 2, 3, 5, 6, 7)],
+                          exp.nodes)
+        self.assertEquals([node_fmt % 2, node_fmt % 3],
+                          exp.firmwareassociations[0].nodes)
+
+        # not enough nodes left
+        resources.append(experiment.exp_resources(
+            selection.NodesPick(1, ['grenoble'], 'm3')))
+        self.assertRaises(ValueError, experiment.submit_experiment,
+                          self.api, 'exp_name', 20, resources)
+        self.assertEquals(1, self.api.get_resources.call_count)
+
+
 class TestExperimentStop(CommandMock):
     """ Test iotlabcli.experiment.stop_experiment """
 
@@ -221,6 +421,66 @@ class TestExperimentGet(CommandMock):
         ret = experiment.get_experiment(self.api, 123, option='resources')
         self.assertEquals(ret, API_RET)
 
+    def test_get_finished_experiment(self):
+        """ Finished experiments results are cached """
+        states = {123: 'Running', 124: 'Terminated'}
+        self.api.get_experiment_info.side_effect = (
+            lambda exp_id, option='': {'state': states[exp_id]}
+            if option == 'state' else {'items': [exp_id, option]})
+
+        for _ in range(2):
+            for exp_id in (123, 124):
+                self.assertEquals(
+                    {'state': states[exp_id]},
+                    experiment.get_experiment(self.api, exp_id, 'state'))
+                self.assertEquals(
+                    {'items': [exp_id, 'resources']},
+                    experiment.get_experiment(self.api, exp_id, 'resources'))
+        self.assertEquals(
+            [call(123, 'state'), call(123, 'resources'),
+             call(124, 'state'), call(124, 'resources'),
+             call(123, 'state'), call(123, 'resources')],
+            self.api.get_experiment_info.call_args_list)
+
+        # state is not requested for experiments not known as finished
+        self.api.get_experiment_info.reset_mock()
+        states[125] = 'Terminated'
+        for _ in range(2):
+            experiment.get_experiment(self.api, 125, 'resources')
+        self.assertEquals([call(125, 'resources'), call(125, 'resources')],
+                          self.api.get_experiment_info.call_args_list)
+
+    def test_get_finished_experiment_disabled(self):
+        """ Finished experiments cache disabled with a zero size """
+        self.api.get_experiment_info.return_value = {'state': 'Terminated'}
+        with patch.dict('os.environ', {'IOTLAB_CACHE_MAX_SIZE': '0'}):
+            for _ in range(2):
+                experiment.get_experiment(self.api, 123, 'state')
+        self.assertEquals(2, self.api.get_experiment_info.call_count)
+
+    def test_get_finished_experiment_description(self):
+        """ Description state is used to cache it, without state request """
+        self.api.get_experiment_info.return_value = {
+            'state': 'Terminated', 'id': 123}
+
+        for _ in range(2):
+            self.assertEquals(
+                {'state': 'Terminated', 'id': 123},
+                experiment.get_experiment(self.api, 123))
+        self.assertEquals({'state': 'Terminated'},
+                          experiment.get_experiment(self.api, 123, 'state'))
+        self.api.get_experiment_info.assert_called_once_with(123, '')
+
+    @patch('iotlabcli.cache.LRUCache.set')
+    def test_get_finished_experiment_cache_error(self, cache_set):
+        """ Cache write errors do not fail get_experiment """
+        cache_set.side_effect = OSError('No space left on device')
+        self.api.get_experiment_info.return_value = {'state': 'Terminated'}
+
+        self.assertEquals({'state': 'Terminated'},
+                          experiment.get_experiment(self.api, 123, 'state'))
+        self.assertTrue(cache_set.called)
+
 
 @patch('iotlabcli.experiment.get_experiment')
 class TestExperimentWait(CommandMock):
@@ -257,21 +517,79 @@ class TestExperimentWait(CommandMock):
                           self.api, 123, step=0.1, timeout=0.5)
 
 
-class TestExperimentGetWriteExpArchive(unittest.TestCase):
+@patch('iotlabcli.experiment.get_experiment')
+class TestExperimentWatch(CommandMock):
+    """ Test iotlabcli.experiment.watch_experiments """
+    @staticmethod
+    def _listing(*states):
+        """ Experiments listing with {id: state} `states` """
+        return [{'items': [{'id': exp_id, 'state': state}
+                           for exp_id, state in sorted(exps.items())]}
+                for exps in states]
+
+    def test_watch_experiments(self, get_exp):
+        """ Watch given experiments until finished """
+        self.api.get_experiments.side_effect = self._listing(
+            {123: 'Waiting', 124: 'Running', 125: 'Running'},
+            {123: 'Waiting', 124: 'Running'},
+            {123: 'Running'},
+            {})
+        get_exp.side_effect = [{'state': 'Terminated'}, {'state': 'Error'}]
+
+        events = list(experiment.watch_experiments(
+            self.api, [123, 124], step=0))
+        self.assertEquals(
+            [(123, None, 'Waiting'), (124, None, 'Running'),
+             (123, 'Waiting', 'Running'), (124, 'Running', 'Terminated'),
+             (123, 'Running', 'Error')],
+            [(evt['id'], evt['previous'], evt['state']) for evt in events])
+        self.assertTrue(all('time' in evt for evt in events))
+        self.api.get_experiments.assert_called_with(
+            state='Waiting,toLaunch,Launching,Running,Finishing')
+        self.assertEquals([call(self.api, 124, 'state'),
+                           call(self.api, 123, 'state')],
+                          get_exp.call_args_list)
+
+    def test_watch_all_experiments(self, get_exp):
+        """ Watch all experiments until timeout """
+        self.api.get_experiments.side_effect = self._listing(
+            {123: 'Running'}, {124: 'Waiting'}, {124: 'Waiting'}) * 10
+        get_exp.return_value = {'state': 'Terminated'}
+
+        events = experiment.watch_experiments(self.api, step=0.1,
+                                              timeout=0.25)
+        self.assertEquals(
+            [(123, None, 'Running'), (123, 'Running', 'Terminated'),
+             (124, None, 'Waiting')],
+            [(evt['id'], evt['previous'], evt['state']) for evt in events])
+        self.assertEquals(1, get_exp.call_count)
+
+
+class TestExperimentGetWriteExpArchive(CommandMock):
     """ Test iotlabcli.experiment.get archive """
 
     @patch('iotlabcli.experiment._write_experiment_archive')
     def test_get_experiment(self, w_exp_archive):
         """ Test experiment.get_experiment """
-        arch_content = '\x42\x69'
+        arch_content = b'\x42\x69'
 
+        state_ret = RequestRet(content=b'{"state": "Terminated"}',
+                               status_code=200)
         ret_val = RequestRet(content=arch_content, status_code=200)
-        patch('requests.get', return_value=ret_val).start()
+        get = patch('requests.get', side_effect=[state_ret, ret_val]).start()
         api = rest.Api('user', 'password')
 
+        # archive cached for experiments known as finished
+        experiment.get_experiment(api, 123, option='state')
+        ret = experiment.get_experiment(api, 123, option='data')
+        self.assertEquals(ret, 'Written')
+        w_exp_archive.assert_called_with(123, arch_content)
+
+        # finished experiment archive read from cache
         ret = experiment.get_experiment(api, 123, option='data')
         self.assertEquals(ret, 'Written')
         w_exp_archive.assert_called_with(123, arch_content)
+        self.assertEquals(2, get.call_count)
 
 
 class TestExperimentInfo(CommandMock):
@@ -285,6 +603,28 @@ class TestExperimentInfo(CommandMock):
         experiment.info_experiment(self.api, list_id=True, site='grenoble')
         self.api.get_resources.assert_called_with(True, 'grenoble')
 
+    def test_info_experiment_filter(self):
+        """ Test experiment.info_experiment with archi and state filters """
+        self.api.get_resources.return_value = {'items': [
+            {'network_address': 'm3-%u.grenoble.iot-lab.info' % num,
+             'site': 'grenoble', 'archi': 'm3:at86rf231', 'mobile': 0,
+             'state': state}
+            for num, state in ((1, 'Alive'), (2, 'Alive'), (3, 'Busy'),
+                               (5, 'Alive'))]}
+
+        ret = experiment.info_experiment(self.api, True, archi='m3',
+                                         state='Alive')
+        self.assertEquals(
+            {'items': [{'grenoble': {'m3': {'Alive': '1-2+5'}}}]}, ret)
+        ret = experiment.info_experiment(self.api, False, site='lille',
+                                         archi='m3')
+        self.assertEquals({'items': []}, ret)
+        ret = experiment.count_resources(self.api, archi='m3:at86rf231')
+        self.assertEquals(
+            {'items': [{'grenoble': {'m3': {'Alive': 3, 'Busy': 1}}}]}, ret)
+        # full listing requested only once
+        self.api.get_resources.assert_called_once_with()
+
 
 class TestWriteExperimentArchive(unittest.TestCase):
     """ Test iotlabcli.experiment._write_experiment_archive """
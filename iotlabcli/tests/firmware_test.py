@@ -0,0 +1,68 @@
+# -*- coding:utf-8 -*-
+""" Test the iotlabcli.firmware module """
+
+# pylint:disable=missing-docstring,too-many-public-methods
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from iotlabcli import firmware
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+INTEGRATION_DIR = os.path.join(os.path.dirname(os.path.dirname(CURRENT_DIR)),
+                               'integration')
+
+
+class TestPrepareFirmwares(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as _fd:
+            _fd.write(content)
+        return path
+
+    def test_prepare_firmwares(self):
+        """ Firmwares are read, checked and deduplicated """
+        paths = [os.path.join(INTEGRATION_DIR, 'tp.hex'),
+                 os.path.join(INTEGRATION_DIR, 'm3_autotest.elf'),
+                 self._write('raw.bin', b'raw binary')]
+        firmwares = firmware.prepare_firmwares(paths + paths[0:1], jobs=2)
+        firmwares.sort(key=lambda fw: fw.name)
+
+        self.assertEquals(['m3_autotest.elf', 'raw.bin', 'tp.hex'],
+                          [fw.name for fw in firmwares])
+        self.assertEquals(['elf', None, 'hex'],
+                          [fw.format for fw in firmwares])
+        with open(paths[1], 'rb') as _fd:
+            self.assertEquals(_fd.read(), firmwares[0].content)
+        self.assertEquals('05bc58017578557cb885d2ed7afbd7414ca63712',
+                          firmwares[1].sha1)
+
+    def test_prepare_firmwares_errors(self):
+        """ All invalid firmwares are reported together """
+        paths = [self._write('trunc.elf', b'\x7fELF\x01\x01'),
+                 self._write('bad.hex', b':0100000001FE\n:0000000'),
+                 self._write('no_eof.hex', b':0100000001FE\n'),
+                 os.path.join(self.tmp_dir, 'missing.elf'),
+                 os.path.join(INTEGRATION_DIR, 'tp.hex')]
+        with self.assertRaises(ValueError) as ctx:
+            firmware.prepare_firmwares(paths)
+        errors = str(ctx.exception).splitlines()
+        self.assertEquals(5, len(errors))
+        self.assertEquals('Invalid firmwares:', errors[0])
+        self.assertTrue(errors[1].endswith("bad.hex': "
+                                           "Invalid hex record line 2"))
+        self.assertTrue(errors[2].endswith("missing.elf': "
+                                           "No such file or directory"))
+        self.assertTrue(errors[3].endswith("no_eof.hex': "
+                                           "Missing hex end of file record"))
+        self.assertTrue(errors[4].endswith("trunc.elf': "
+                                           "Truncated elf header"))
@@ -56,3 +56,20 @@ class TestHelpers(unittest.TestCase):
 
         with patch('os.getenv', return_value='API_URL_2'):
             self.assertEquals('API_URL_2', helpers.read_custom_api_url())
+
+    def test_node_url_sort_key_cache(self):
+        """ Test node_url_sort_key uses registered nodes identities """
+        # pylint:disable=protected-access
+        node = 'm3-42.grenoble.iot-lab.info'
+        # registered key is used without parsing url
+        helpers.set_node_url_sort_key(node, ('site', 'archi', 0))
+        self.assertEquals(('site', 'archi', 0),
+                          helpers.node_url_sort_key(node))
+        helpers._NODES_KEYS.clear()
+        self.assertEquals(('grenoble', 'm3', 42),
+                          helpers.node_url_sort_key(node))
+
+        # cache size is bounded
+        with patch('iotlabcli.helpers.NODES_KEYS_MAX', 1):
+            helpers.node_url_sort_key('m3-1.grenoble.iot-lab.info')
+            self.assertEquals(1, len(helpers._NODES_KEYS))
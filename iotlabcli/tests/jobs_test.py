@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+""" Test the iotlabcli.jobs module """
+
+# pylint: disable=too-many-public-methods
+# pylint: disable=protected-access
+import os
+try:
+    # pylint: disable=import-error,no-name-in-module
+    from mock import patch
+except ImportError:  # pragma: no cover
+    # pylint: disable=import-error,no-name-in-module
+    from unittest.mock import patch
+from iotlabcli import experiment
+from iotlabcli import jobs
+from iotlabcli import selection
+from iotlabcli.tests.my_mock import CommandMock
+
+
+class TestJobQueue(CommandMock):
+    """ Test iotlabcli.jobs.JobQueue """
+    def setUp(self):
+        super(TestJobQueue, self).setUp()
+        self.path = os.path.join(self.cache_dir, 'jobs.db')
+        self.queue = jobs.JobQueue(self.path)
+
+    def tearDown(self):
+        self.queue.close()
+        super(TestJobQueue, self).tearDown()
+
+    def _states(self):
+        """ Return {name: (state, exp_id)} """
+        return dict((job['name'], (job['state'], job['exp_id']))
+                    for job in self.queue.jobs())
+
+    @staticmethod
+    def _submit(_, name, *__):
+        """ Submit experiment 'exp_<id>-<tag>' """
+        if name.startswith('exp_2-'):
+            raise RuntimeError('HTTP error: 500')
+        return {'id': int(name.split('-')[0].split('_')[1])}
+
+    def _tagged_names(self):
+        """ Return {name: submitted experiment name} """
+        rows = self.queue._db.execute('SELECT name, tag FROM jobs')
+        return dict((name, jobs._tagged_name(name, tag))
+                    for name, tag in rows.fetchall())
+
+    @patch('iotlabcli.experiment.submit_experiment')
+    def test_run(self, submit_exp):
+        """ Add and submit experiments """
+        submit_exp.side_effect = self._submit
+        self.queue.add('exp_1', 20, [experiment.exp_resources(
+            experiment.AliasNodes(2, 'grenoble', 'm3:at86rf231'), 'tp.elf')])
+        self.queue.add('exp_2', 30, [experiment.exp_resources(
+            ['m3-1.grenoble.iot-lab.info'])], start_time=1400000000)
+        self.queue.add('exp_3', 20, [experiment.exp_resources(
+            selection.NodesPick(2, ['lille'], 'm3'), None, 'prof')])
+        resources = [experiment.exp_resources(['m3-1.grenoble.iot-lab.info'])]
+        self.assertRaises(ValueError, self.queue.add, 'exp_1', 20, resources)
+        self.assertRaises(ValueError, self.queue.add, None, 20, resources)
+        self.assertRaises(ValueError, self.queue.add, 'exp_4', 20, [])
+
+        ret = self.queue.run(self.api, jobs=2)
+        self.assertEquals({'submitted': {'exp_1': 1, 'exp_3': 3},
+                           'failed': {'exp_2': 'HTTP error: 500'}}, ret)
+        self.assertEquals({'exp_1': ('submitted', 1),
+                           'exp_2': ('failed', None),
+                           'exp_3': ('submitted', 3)}, self._states())
+
+        # experiments specs
+        names = self._tagged_names()
+        calls = dict((name, args) for args, _ in submit_exp.call_args_list
+                     for name in names if names[name] == args[1])
+        res = calls['exp_1'][3][0]
+        self.assertEquals(os.path.abspath('tp.elf'), res['firmware'])
+        self.assertEquals(2, res['nodes'].nbnodes)
+        self.assertEquals('grenoble', res['nodes'].properties['site'])
+        self.assertEquals((self.api, names['exp_2'], 30, [{
+            'type': 'physical', 'nodes': ['m3-1.grenoble.iot-lab.info'],
+            'firmware': None, 'profile': None}], 1400000000), calls['exp_2'])
+        self.assertEquals(experiment.exp_resources(
+            selection.NodesPick(2, ['lille'], 'm3'), None, 'prof'),
+            calls['exp_3'][3][0])
+
+        # nothing more to submit
+        submit_exp.reset_mock()
+        self.assertEquals({'submitted': {}, 'failed': {}},
+                          self.queue.run(self.api))
+        self.assertEquals(0, submit_exp.call_count)
+
+    @patch('iotlabcli.experiment.submit_experiment')
+    def test_resume(self, submit_exp):
+        """ Resume interrupted submissions without submitting twice """
+        submit_exp.side_effect = self._submit
+        for name in ('exp_1', 'exp_2', 'exp_4'):
+            self.queue.add(name, 20, [experiment.exp_resources(
+                ['m3-1.grenoble.iot-lab.info'])])
+        self.queue.run(self.api)
+        # interrupted while submitting 'exp_4' and 'exp_5'
+        self.queue.add('exp_5', 20, [experiment.exp_resources(
+            ['m3-1.grenoble.iot-lab.info'])])
+        self.queue._set_state('exp_4', jobs.SUBMITTING)
+        self.queue._set_state('exp_5', jobs.SUBMITTING)
+        names = self._tagged_names()
+        # past experiments with the same names are ignored
+        self.api.get_experiments.side_effect = [
+            {'items': [{'id': 1, 'name': 'exp_5', 'state': 'Terminated'}] +
+             [{'id': 2, 'name': 'other'}] * (jobs.RECOVER_PAGE - 1)},
+            {'items': [{'id': 4, 'name': names['exp_4'],
+                        'state': 'Waiting'}]}]
+        self.queue.close()
+
+        # 'exp_4' was submitted, 'exp_5' was not, failed 'exp_2' is retried
+        self.queue = jobs.JobQueue(self.path)
+        submit_exp.reset_mock()
+        submit_exp.side_effect = lambda _, name, *__: {'id': 20}
+        ret = self.queue.run(self.api, retry=True)
+        self.assertEquals({'submitted': {'exp_4': 4, 'exp_5': 20,
+                                         'exp_2': 20}, 'failed': {}}, ret)
+        self.assertEquals([names['exp_2'], names['exp_5']],
+                          sorted(args[1] for args, _ in
+                                 submit_exp.call_args_list))
+        self.api.get_experiments.assert_called_with(
+            state='Waiting,toLaunch,Launching,Running,Finishing,'
+                  'Terminated,Error', limit=jobs.RECOVER_PAGE,
+            offset=jobs.RECOVER_PAGE)
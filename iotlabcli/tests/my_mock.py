@@ -2,6 +2,8 @@
 """ common TestCase class  for testing commands """
 
 import sys
+import shutil
+import tempfile
 import unittest
 from iotlabcli import experiment
 try:
@@ -35,6 +37,14 @@ def api_mock(ret=None):
     return api_class.return_value
 
 
+def cache_mock():
+    """ Use a temporary cache directory, return its path """
+    cache_dir = tempfile.mkdtemp()
+    patch('iotlabcli.cache.CACHE_DIR', cache_dir).start()
+    patch.dict('iotlabcli.resources._RESOURCES_CACHE', clear=True).start()
+    return cache_dir
+
+
 def api_mock_stop():
     """ Stop all patches started by api_mock.
     Actually it stops everything but not a problem """
@@ -46,17 +56,20 @@ class CommandMock(unittest.TestCase):
     """ Common mock needed for testing commands """
     def setUp(self):
         self.api = api_mock()
+        self.cache_dir = cache_mock()
         experiment.AliasNodes._alias = 0  # pylint:disable=protected-access
 
     def tearDown(self):
         api_mock_stop()
         patch.stopall()
+        shutil.rmtree(self.cache_dir)
 
 
 class MainMock(unittest.TestCase):
     """ Common mock needed for testing main function of parsers """
     def setUp(self):
         self.api = api_mock()
+        self.cache_dir = cache_mock()
 
         patch('sys.stderr', sys.stdout).start()
         patch('iotlabcli.parser.common.sites_list', Mock(
@@ -71,3 +84,4 @@ class MainMock(unittest.TestCase):
     def tearDown(self):
         api_mock_stop()
         patch.stopall()
+        shutil.rmtree(self.cache_dir)
@@ -11,7 +11,9 @@ except ImportError:  # pragma: no cover
     from unittest.mock import patch
 
 from argparse import ArgumentTypeError
+from iotlabcli import helpers
 import iotlabcli.parser.node as node_parser
+from iotlabcli.parser import common
 from iotlabcli.tests.my_mock import MainMock, api_mock, api_mock_stop
 
 # pylint: disable=missing-docstring,too-many-public-methods
@@ -58,6 +60,17 @@ class TestMainNodeParser(MainMock):
         node_command.assert_called_with(
             self.api, 'update', 123, ['m3-3'], 'tp.elf')
 
+    def test_main_compact(self, list_nodes, node_command):
+        """ Run the parser.node.main function with compact output """
+        node_command.return_value = {'0': ['m3-1.grenoble.iot-lab.info',
+                                           'm3-2.grenoble.iot-lab.info',
+                                           'm3-3.grenoble.iot-lab.info']}
+        list_nodes.return_value = []
+        with patch('iotlabcli.parser.node.compact_result') as compact:
+            compact.return_value = {}
+            node_parser.main(['--reset', '--compact'])
+            compact.assert_called_with(node_command.return_value)
+
 
 class TestNodeParser(unittest.TestCase):
     def tearDown(self):
@@ -97,6 +110,28 @@ class TestNodeParser(unittest.TestCase):
                                 "m3-3.strasbourg.iot-lab.info"])
         self.assertTrue(g_nodes_list.called)
 
+        # lazy nodes lists are not expanded for exclusion
+        excl_ll = [common.nodes_ranges_from_info('grenoble', 'm3', '2-9999'),
+                   common.nodes_ranges_from_info('strasbourg', 'm3', '1')]
+        with patch.object(helpers.NodesRanges, '__iter__') as nodes_iter:
+            res = node_parser.list_nodes(api, 123, excl_nodes_ll=excl_ll)
+            self.assertFalse(nodes_iter.called)
+        self.assertEquals(res, ["m3-1.grenoble.iot-lab.info",
+                                "m3-2.strasbourg.iot-lab.info",
+                                "m3-3.strasbourg.iot-lab.info"])
+
+        # too many nodes
+        self.assertRaises(ValueError, common.nodes_list_from_info,
+                          'grenoble', 'm3', '1-100000')
+        self.assertRaises(ValueError, common.nodes_ranges_from_info,
+                          'grenoble', 'm3', '1-100000')
+
+        # public functions return lists
+        self.assertEquals(['m3-1.grenoble.iot-lab.info'],
+                          common.nodes_list_from_info('grenoble', 'm3', '1'))
+        self.assertEquals(['m3-1', 'm3-2'], common.nodes_id_list('m3', '1-2'))
+        self.assertEquals([1, 2], common.expand_short_nodes_list('1-2'))
+
     def test__get_experiment_nodes_list(self):
         """ Run get_experiment_nodes_list """
         api = api_mock(
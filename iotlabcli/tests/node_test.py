@@ -3,6 +3,7 @@
 """ Test the iotlabcli.node module """
 
 # pylint: disable=too-many-public-methods
+import shutil
 import unittest
 try:
     # pylint: disable=import-error,no-name-in-module
@@ -16,8 +17,12 @@ from iotlabcli.tests import my_mock
 
 class TestNode(unittest.TestCase):
     """ Test the 'iotlabcli.node' module """
+    def setUp(self):
+        self.cache_dir = my_mock.cache_mock()
+
     def tearDown(self):
         my_mock.api_mock_stop()
+        shutil.rmtree(self.cache_dir)
 
     @patch('iotlabcli.helpers.read_file')
     def test_node_command(self, read_file_mock):
@@ -56,3 +61,68 @@ class TestNode(unittest.TestCase):
         # no firmware for update command
         self.assertRaises(AssertionError, node.node_command,
                           api, 'update', 123, nodes_list)
+
+    @patch('iotlabcli.firmware.FIRMWARE_REFERENCE', True)
+    @patch('iotlabcli.helpers.read_file')
+    def test_node_update_reference(self, read_file_mock):
+        """ Update with already uploaded firmware """
+        read_file_mock.return_value = 'file_data'
+        nodes_list = ["m3-1"]
+        api = my_mock.api_mock()
+
+        # first update uploads the firmware
+        node.node_command(api, 'update', 123, nodes_list, 'fw.elf')
+        self.assertEquals(1, api.node_update.call_count)
+        self.assertEquals(0, api.node_update_reference.call_count)
+
+        # then firmware is referenced, only for this experiment
+        api.reset_mock()
+        res = node.node_command(api, 'update', 123, nodes_list, 'fw.elf')
+        self.assertEquals(my_mock.API_RET, res)
+        api.node_update_reference.assert_called_with(
+            123, 'cdd9679a6f2b27112952d52672bce4803718566f', nodes_list)
+        self.assertEquals(0, api.node_update.call_count)
+        node.node_command(api, 'update', 124, nodes_list, 'fw.elf')
+        self.assertEquals(1, api.node_update.call_count)
+
+        # transient errors, firmware uploaded, references still used
+        api.reset_mock()
+        api.node_update_reference.side_effect = RuntimeError()
+        node.node_command(api, 'update', 123, nodes_list, 'fw.elf')
+        node.node_command(api, 'update', 123, nodes_list, 'fw.elf')
+        self.assertEquals(2, api.node_update_reference.call_count)
+        self.assertEquals(2, api.node_update.call_count)
+
+        # firmware unknown to the server (404), uploaded again then
+        # referenced
+        api.reset_mock()
+        api.node_update_reference.side_effect = [None, my_mock.API_RET]
+        node.node_command(api, 'update', 123, nodes_list, 'fw.elf')
+        self.assertEquals(1, api.node_update.call_count)
+        node.node_command(api, 'update', 123, nodes_list, 'fw.elf')
+        self.assertEquals(2, api.node_update_reference.call_count)
+        self.assertEquals(1, api.node_update.call_count)
+
+        # server does not support references (405/501), not tried again
+        api.reset_mock()
+        api.node_update_reference.side_effect = NotImplementedError()
+        node.node_command(api, 'update', 123, nodes_list, 'fw.elf')
+        node.node_command(api, 'update', 123, nodes_list, 'fw.elf')
+        self.assertEquals(1, api.node_update_reference.call_count)
+        self.assertEquals(2, api.node_update.call_count)
+
+        # until the unsupported record expires
+        api.reset_mock()
+        with patch('iotlabcli.firmware.REFERENCE_UNSUPPORTED_MAX_AGE', 0):
+            node.node_command(api, 'update', 123, nodes_list, 'fw.elf')
+        self.assertEquals(1, api.node_update_reference.call_count)
+
+    @patch('iotlabcli.helpers.read_file')
+    def test_node_update_reference_disabled(self, read_file_mock):
+        """ Firmware references are disabled by default """
+        read_file_mock.return_value = 'file_data'
+        api = my_mock.api_mock()
+        node.node_command(api, 'update', 123, ['m3-1'], 'fw.elf')
+        node.node_command(api, 'update', 123, ['m3-1'], 'fw.elf')
+        self.assertEquals(2, api.node_update.call_count)
+        self.assertEquals(0, api.node_update_reference.call_count)
@@ -3,6 +3,11 @@
 """ Test the iotlabcli.parser.profile module """
 # pylint:disable=missing-docstring,too-many-public-methods
 
+import os
+import json
+import shutil
+import tempfile
+
 try:
     # pylint: disable=import-error,no-name-in-module
     from mock import patch
@@ -36,6 +41,13 @@ class TestMainProfileParser(MainMock):
             SystemExit, profile_parser.main,
             ['addm3', '-n', 'profile_name', '-p', 'dc', '-power'])
 
+        # radio values out of intervals
+        for option, value in (('-channels', '27'), ('-num', '256'),
+                              ('-rperiod', '0'), ('-rperiod', 'a')):
+            self.assertRaises(
+                SystemExit, profile_parser.main,
+                ['addm3', '-n', 'profile_name', '-rssi', option, value])
+
     @staticmethod
     @patch('iotlabcli.parser.profile.ProfileM3')
     def test_opts_parsing_m3(prof_m3_class):
@@ -100,9 +112,10 @@ class TestMainProfileParser(MainMock):
             frequency=1000, temperature=True, luminosity=True)
 
     def test__add_profile(self):
+        prof = profile.ProfileM3('name', 'dc')
         ret = profile_parser._add_profile(  # pylint: disable=protected-access
-            self.api, 'name', {'test_profile': 1}, json_out=True)
-        self.assertEquals(ret, {'test_profile': 1})
+            self.api, 'name', prof, json_out=True)
+        self.assertEquals(ret, prof)
         self.assertFalse(self.api.add_profile.called)
 
     def test_main_get_parser(self):
@@ -116,14 +129,49 @@ class TestMainProfileParser(MainMock):
         profile_parser.main(['del', '--name', 'profile_name'])
         self.api.del_profile.assert_called_with('profile_name')
 
+    @patch('iotlabcli.profile.sync_profiles')
+    def test_main_sync_parser(self, sync_profiles):
+        sync_profiles.return_value = {}
+        directory = tempfile.mkdtemp()
+        try:
+            for name in ('prof1', 'prof2'):
+                with open(os.path.join(directory, name + '.json'), 'w') as _f:
+                    _f.write('{"profilename": "%s"}' % name)
+            with open(os.path.join(directory, 'README'), 'w') as _f:
+                _f.write('Not a profile')
+
+            profile_parser.main(['sync', directory, '--delete'])
+            profiles = sorted(sync_profiles.call_args[0][1],
+                              key=lambda prof: prof['profilename'])
+            self.assertEquals([{'profilename': 'prof1'},
+                               {'profilename': 'prof2'}], profiles)
+            self.assertEquals((True, 4), sync_profiles.call_args[0][2:])
+
+            # same profile twice
+            with open(os.path.join(directory, 'prof3.json'), 'w') as _f:
+                _f.write('{"profilename": "prof1"}')
+            self.assertRaises(SystemExit, profile_parser.main,
+                              ['sync', directory])
+        finally:
+            shutil.rmtree(directory)
+
     @patch('iotlabcli.helpers.read_file')
     def test_main_load_parser(self, read_file_mock):
-        read_file_mock.return_value = '{"profilename": "prof_name"}'
+        prof = {'profilename': 'prof_name', 'nodearch': 'wsn430',
+                'power': 'dc', 'consumption': None, 'radio': None,
+                'sensor': {'frequency': 1000, 'temperature': True,
+                           'luminosity': False}}
+        read_file_mock.return_value = json.dumps(prof)
         profile_parser.main(['load', '--file', 'prof.json'])
-        self.api.add_profile.assert_called_with('prof_name',
-                                                {'profilename': "prof_name"})
+        self.api.add_profile.assert_called_with('prof_name', prof)
         # invalid profile file
         self.api.add_profile.reset_mock()
         read_file_mock.return_value = '{"not_profilename_field": null}'
         self.assertRaises(SystemExit, profile_parser.main,
                           ['load', '--file', 'prof.json'])
+        # invalid profile values
+        prof['sensor']['frequency'] = 42
+        read_file_mock.return_value = json.dumps(prof)
+        self.assertRaises(SystemExit, profile_parser.main,
+                          ['load', '--file', 'prof.json'])
+        self.assertFalse(self.api.add_profile.called)
@@ -5,6 +5,7 @@
 
 import unittest
 from iotlabcli import profile
+from iotlabcli.tests.my_mock import CommandMock
 
 
 class TestM3Profile(unittest.TestCase):
@@ -15,7 +16,7 @@ class TestM3Profile(unittest.TestCase):
         m3_prof.set_radio('rssi', (11, 12, 13), period=1, num_per_channel=1)
 
         self.assertEquals(
-            m3_prof.__dict__,
+            m3_prof.to_dict(),
             {
                 'power': 'dc',
                 'profilename': 'name',
@@ -42,7 +43,7 @@ class TestM3Profile(unittest.TestCase):
         m3_prof.set_radio(mode=None, channels=None)
 
         self.assertEquals(
-            m3_prof.__dict__,
+            m3_prof.to_dict(),
             {
                 'power': 'dc',
                 'profilename': 'name',
@@ -62,7 +63,7 @@ class TestWSN430Profile(unittest.TestCase):
         wsn430_prof.set_sensors(30000, True, True)
 
         self.assertEquals(
-            wsn430_prof.__dict__,
+            wsn430_prof.to_dict(),
             {
                 'profilename': 'name',
                 'power': 'dc',
@@ -92,7 +93,7 @@ class TestWSN430Profile(unittest.TestCase):
         wsn430_prof.set_sensors(None)
 
         self.assertEquals(
-            wsn430_prof.__dict__,
+            wsn430_prof.to_dict(),
             {
                 'profilename': 'name',
                 'power': 'dc',
@@ -102,3 +103,138 @@ class TestWSN430Profile(unittest.TestCase):
                 'sensor': None,
             }
         )
+
+
+class TestProfileValidation(unittest.TestCase):
+
+    def test_all_errors(self):
+        m3_prof = {'profilename': 'name', 'nodearch': 'm3', 'power': 'ac',
+                   'consumption': {'period': 141, 'average': None,
+                                   'power': True, 'voltage': False,
+                                   'current': False},
+                   'radio': {'mode': 'rssi', 'channels': [11, 42, 12],
+                             'period': 0, 'num_per_channel': 0}}
+
+        self.assertEquals(profile.profile_errors(m3_prof), [
+            "Required 'consumption.average'",
+            "Invalid 'consumption.period': 141 not in "
+            "[140, 204, 332, 588, 1100, 2116, 4156, 8244]",
+            "Invalid 'power': 'ac' not in ['dc', 'battery']",
+            "Invalid 'radio.channels': 42 not in 11..26",
+            "Invalid 'radio.period': 0 not in 1..65535",
+            "Required 'radio.num_per_channel' as multiple channels provided",
+        ])
+
+    def test_objects_checked(self):
+        self.assertRaises(ValueError, profile.ProfileM3, 'name', 'ac')
+        self.assertRaises(ValueError, profile.ProfileWSN430, 'name', 'ac')
+        m3_prof = profile.ProfileM3('name', 'dc')
+        self.assertRaises(ValueError, m3_prof.set_consumption, 141, 1, True)
+        self.assertRaises(ValueError, m3_prof.set_radio, 'rssi', [11, 12], 1)
+        wsn430_prof = profile.ProfileWSN430('name', 'dc')
+        self.assertRaises(ValueError, wsn430_prof.set_radio, 42)
+        self.assertRaises(ValueError, wsn430_prof.set_sensors, 42, True)
+
+    def test_json_errors(self):
+        wsn430_prof = {'profilename': 'name', 'nodearch': 'wsn430',
+                       'power': 'dc', 'radio': {'frequency': 500},
+                       'sensor': {'frequency': '1000', 'temperature': 1},
+                       'mobility': None}
+        self.assertEquals(profile.profile_errors(wsn430_prof), [
+            "Required 'radio.rssi'",
+            "Invalid 'sensor.frequency': '1000' not in "
+            "[30000, 10000, 5000, 1000]",
+            "Required 'sensor.luminosity'",
+            "Invalid 'sensor.temperature': 1 is not a bool",
+            "Unknown field 'mobility'",
+        ])
+        self.assertEquals(profile.profile_errors([]),
+                          ['Invalid profile: [] is not an object'])
+
+
+def _profile(name, power):
+    return {'profilename': name, 'nodearch': 'm3', 'power': power,
+            'consumption': None, 'radio': None}
+
+
+class TestProfilesCache(CommandMock):
+
+    def setUp(self):
+        super(TestProfilesCache, self).setUp()
+        self.remote = [_profile('prof1', 'dc'),
+                       _profile('prof2', 'dc'),
+                       _profile('prof3', 'dc')]
+        self.api.get_profiles.return_value = self.remote
+        self.api.add_profile.return_value = ''
+        self.api.del_profile.return_value = ''
+
+    def test_get_profiles_cache(self):
+        self.assertEquals(self.remote, profile.get_profiles(self.api))
+        self.assertEquals(self.remote[1],
+                          profile.get_profile(self.api, 'prof2'))
+        self.assertEquals(1, self.api.get_profiles.call_count)
+        self.assertFalse(self.api.get_profile.called)
+
+        # unknown profile is requested
+        self.api.get_profile.return_value = _profile('prof4', 'dc')
+        profile.get_profile(self.api, 'prof4')
+        self.api.get_profile.assert_called_with('prof4')
+
+        # add/del invalidate the cache
+        profile.add_profile(self.api, 'prof4', _profile('prof4', 'dc'))
+        profile.get_profiles(self.api)
+        profile.del_profile(self.api, 'prof4')
+        profile.get_profiles(self.api)
+        self.assertEquals(3, self.api.get_profiles.call_count)
+
+    def test_sync_profiles(self):
+        local = [_profile('prof1', 'dc'),
+                 _profile('prof2', 'battery'),
+                 _profile('prof4', 'dc')]
+        ret = profile.sync_profiles(self.api, local)
+        self.assertEquals({'added': ['prof4'], 'updated': ['prof2'],
+                           'deleted': [], 'unchanged': ['prof1', 'prof3'],
+                           'errors': {}}, ret)
+        self.assertEquals(2, self.api.add_profile.call_count)
+        # updated profiles are overwritten, not deleted first
+        self.api.add_profile.assert_any_call('prof2', local[1])
+        self.assertFalse(self.api.del_profile.called)
+
+        # listing is cached
+        self.assertEquals(local[0:2] + [self.remote[2], local[2]],
+                          profile.get_profiles(self.api))
+        self.assertEquals(1, self.api.get_profiles.call_count)
+
+    def test_sync_profiles_update_error(self):
+        self.api.add_profile.side_effect = RuntimeError('HTTP error: 500')
+        local = [_profile('prof2', 'battery')]
+        ret = profile.sync_profiles(self.api, local)
+        self.assertEquals({'prof2': 'HTTP error: 500'}, ret['errors'])
+        self.assertFalse(self.api.del_profile.called)
+
+    def test_sync_profiles_server_listing(self):
+        # server listing omits unset values
+        self.api.get_profiles.return_value = [
+            {'profilename': 'prof1', 'nodearch': 'm3', 'power': 'dc'}]
+        ret = profile.sync_profiles(self.api, [_profile('prof1', 'dc')])
+        self.assertEquals(['prof1'], ret['unchanged'])
+        self.assertFalse(self.api.add_profile.called)
+
+    def test_sync_profiles_invalid(self):
+        local = [_profile('prof1', 'ac'), _profile('prof2', 'battery')]
+        self.assertRaises(ValueError, profile.sync_profiles, self.api, local)
+        self.assertFalse(self.api.get_profiles.called)
+
+    def test_sync_profiles_delete_errors(self):
+        self.api.add_profile.side_effect = RuntimeError('HTTP error: 500')
+        local = [_profile('prof1', 'dc'),
+                 _profile('prof4', 'dc')]
+        ret = profile.sync_profiles(self.api, local, delete=True, jobs=1)
+        self.assertEquals({'added': [], 'updated': [],
+                           'deleted': ['prof2', 'prof3'],
+                           'unchanged': ['prof1'],
+                           'errors': {'prof4': 'HTTP error: 500'}}, ret)
+
+        # cache invalidated on errors
+        profile.get_profiles(self.api)
+        self.assertEquals(2, self.api.get_profiles.call_count)
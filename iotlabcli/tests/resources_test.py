@@ -0,0 +1,44 @@
+# -*- coding:utf-8 -*-
+""" Test the iotlabcli.resources module """
+
+# pylint:disable=missing-docstring,too-many-public-methods
+
+import os
+from iotlabcli import resources
+from iotlabcli.tests.my_mock import CommandMock, patch
+
+RESOURCES = [{'network_address': 'm3-1.grenoble.iot-lab.info',
+              'site': 'grenoble', 'archi': 'm3:at86rf231', 'mobile': 0,
+              'state': 'Alive'}]
+
+
+class TestGetResources(CommandMock):
+
+    def setUp(self):
+        super(TestGetResources, self).setUp()
+        self.api.get_resources.return_value = {'items': RESOURCES}
+
+    def test_get_resources_cache(self):
+        """ Resources are cached in memory and on disk """
+        self.assertEquals(RESOURCES, resources.get_resources(self.api))
+        self.assertEquals(RESOURCES, resources.get_resources(self.api))
+        self.assertEquals(1, self.api.get_resources.call_count)
+        self.assertEquals(1, len(os.listdir(self.cache_dir)))
+
+        # new process, disk cache is used
+        resources._RESOURCES_CACHE.clear()  # pylint:disable=W0212
+        self.assertEquals(RESOURCES, resources.get_resources(self.api))
+        self.assertEquals(1, self.api.get_resources.call_count)
+
+    def test_get_resources_expired(self):
+        """ Cached resources are refreshed after max_age """
+        resources.get_resources(self.api)
+        resources.get_resources(self.api, max_age=0)
+        self.assertEquals(2, self.api.get_resources.call_count)
+
+    def test_get_resources_other_api(self):
+        """ Cache is per API url and user """
+        resources.get_resources(self.api)
+        with patch.object(self.api, 'url', 'https://example.org/rest/'):
+            resources.get_resources(self.api)
+        self.assertEquals(2, self.api.get_resources.call_count)
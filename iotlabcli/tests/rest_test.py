@@ -4,14 +4,20 @@
 # pylint: disable=too-many-public-methods
 # pylint: disable=protected-access
 
+import time
+import threading
 import unittest
+import zlib
+import requests
 try:
     # pylint: disable=import-error,no-name-in-module
     from mock import patch, Mock
 except ImportError:  # pragma: no cover
     # pylint: disable=import-error,no-name-in-module
     from unittest.mock import patch, Mock
+from iotlabcli import deadline
 from iotlabcli import rest
+from iotlabcli import helpers
 from iotlabcli.helpers import json_dumps
 from iotlabcli.tests.my_mock import RequestRet
 
@@ -40,15 +46,15 @@ class TestRest(unittest.TestCase):
 
         # call get
         ret = rest.Api._method(self._url)
-        get.assert_called_with(self._url, auth=None)
+        get.assert_called_with(self._url, auth=None, timeout=None)
         self.assertEquals(ret, ret)
         ret = rest.Api._method(self._url, method='GET', auth=_auth)
-        get.assert_called_with(self._url, auth=_auth)
+        get.assert_called_with(self._url, auth=_auth, timeout=None)
         self.assertEquals(ret, ret)
 
         # call delete
         ret = rest.Api._method(self._url, method='DELETE')
-        delete.assert_called_with(self._url, auth=None)
+        delete.assert_called_with(self._url, auth=None, timeout=None)
         self.assertEquals(ret, ret)
 
         # call post
@@ -56,14 +62,22 @@ class TestRest(unittest.TestCase):
         post.assert_called_with(
             self._url, data='{}'.encode('utf-8'),
             headers={'content-type': 'application/json'},
-            auth=None)
+            auth=None, timeout=None)
         self.assertEquals(ret, ret)
 
         # call multipart
         _files = {'entry': '{}'}
         ret = rest.Api._method(self._url, method='MULTIPART', data=_files)
-        post.assert_called_with(self._url, files=_files, auth=None)
+        post.assert_called_with(self._url, files=_files, auth=None,
+                                timeout=None)
         self.assertEquals(ret, ret)
+
+        # call multipart with streamed body
+        body = helpers.MultipartBody(_files)
+        ret = rest.Api._method(self._url, method='MULTIPART', data=body)
+        post.assert_called_with(
+            self._url, data=body, auth=None, timeout=None,
+            headers={'content-type': body.content_type})
         patch.stopall()
 
     def test__method_raw(self):
@@ -82,3 +96,232 @@ class TestRest(unittest.TestCase):
                              status_code=404)
         with patch('requests.get', return_value=ret_val):
             self.assertRaises(RuntimeError, rest.Api._method, self._url)
+
+    def test_timeouts(self):
+        """ Api and per call timeouts, bounded by the current deadline """
+        ok_ret = RequestRet(content='{}'.encode('utf-8'), status_code=200)
+        api = rest.Api('user', 'password', url='http://timeout.test/rest/',
+                       timeout=(5, 60))
+        with patch('requests.get', return_value=ok_ret) as get:
+            api.get_profiles()
+            self.assertEquals((5, 60), get.call_args[1]['timeout'])
+            api.method('profiles', timeout=1)
+            self.assertEquals(1, get.call_args[1]['timeout'])
+
+            with deadline.Deadline(2):
+                api.get_profiles()
+                connect, read = get.call_args[1]['timeout']
+                self.assertTrue(1 < connect <= 2 and connect == read)
+            with deadline.Deadline(0):
+                self.assertRaises(deadline.DeadlineExceeded,
+                                  api.get_profiles)
+
+        # connection errors and timeouts
+        with patch('requests.get',
+                   side_effect=requests.exceptions.ReadTimeout('timeout')):
+            self.assertRaises(RuntimeError, api.get_profiles)
+
+    def test_single_flight(self):
+        """ Identical concurrent GET requests are sent once """
+        ok_ret = RequestRet(content='{"items": []}'.encode('utf-8'),
+                            status_code=200)
+        api = rest.Api('user', 'password', url='http://flight.test/rest/')
+
+        with patch('requests.get', side_effect=_slow(ok_ret)) as get:
+            results = _concurrent(
+                lambda: api.get_experiment_info(123, 'resources'))
+            self.assertEquals(1, get.call_count)
+            self.assertEquals(4, len(results))
+            self.assertTrue(all(res is results[0] for res in results))
+
+            # not coalesced when not concurrent
+            api.get_experiment_info(123, 'resources')
+            self.assertEquals(2, get.call_count)
+
+        # errors are raised to all callers
+        error = requests.exceptions.ConnectionError('refused')
+        with patch('requests.get', side_effect=_slow(error)) as get:
+            errors = _concurrent(lambda: _raised(api.get_profiles))
+            self.assertEquals(1, get.call_count)
+            self.assertEquals(4, len(errors))
+            self.assertTrue(all(isinstance(err, RuntimeError)
+                                for err in errors))
+
+    def test_read_cache(self):
+        """ GET results cache invalidated by writes """
+        ok_ret = RequestRet(content=b'{}', status_code=200)
+        api = rest.Api('user', 'password', url='http://cache.test/rest/',
+                       cache_max_age=60)
+        patch('requests.post', return_value=ok_ret).start()
+        patch('requests.delete', return_value=ok_ret).start()
+        get = patch('requests.get', return_value=ok_ret).start()
+
+        def _requested(*urls):
+            """ Assert `urls` were requested since last call """
+            self.assertEquals(
+                ['http://cache.test/rest/' + url for url in urls],
+                [args[0][0] for args in get.call_args_list])
+            get.reset_mock()
+
+        def _get_all():
+            """ Get experiment state, experiments list and profiles """
+            api.get_experiment_info(123, 'state')
+            api.get_experiments()
+            api.get_profiles()
+
+        listing = 'experiments?state=Running&limit=0&offset=0'
+        _get_all()
+        _get_all()
+        _requested('experiments/123?state', listing, 'profiles')
+
+        api.node_command('reset', 123)
+        _get_all()
+        _requested('experiments/123?state')
+
+        api.stop_experiment(123)
+        _get_all()
+        _requested('experiments/123?state', listing)
+
+        api.submit_experiment({'exp.json': '{}'})
+        api.add_profile('prof', {})
+        _get_all()
+        _requested(listing, 'profiles')
+
+        api.invalidate()
+        _get_all()
+        _requested('experiments/123?state', listing, 'profiles')
+        patch.stopall()
+
+    def test_node_update_reference(self):
+        """ Firmware reference errors """
+        api = rest.Api('user', 'password', url='http://ref.test/rest/')
+        with patch('requests.post') as post:
+            post.return_value = RequestRet(content=b'{}', status_code=200)
+            self.assertEquals({}, api.node_update_reference(123, 'sha1'))
+            post.return_value = RequestRet(content=b'', status_code=404)
+            self.assertEquals(None, api.node_update_reference(123, 'sha1'))
+            for status in (405, 501):
+                post.return_value = RequestRet(content=b'', status_code=status)
+                self.assertRaises(NotImplementedError,
+                                  api.node_update_reference, 123, 'sha1')
+            post.return_value = RequestRet(content=b'', status_code=500)
+            self.assertRaises(RuntimeError, api.node_update_reference,
+                              123, 'sha1')
+
+    def test_read_cache_concurrent_write(self):
+        """ GET results invalidated while requested are not cached """
+        api = rest.Api('user', 'password', url='http://race.test/rest/',
+                       cache_max_age=60)
+        ok_ret = RequestRet(content=b'{}', status_code=200)
+
+        def _get(*args, **kwargs):  # pylint:disable=unused-argument
+            """ Profiles changed while being requested """
+            api.invalidate('profiles')
+            return ok_ret
+
+        with patch('requests.get', side_effect=_get) as get:
+            api.get_profiles()
+            api.get_profiles()
+            self.assertEquals(2, get.call_count)
+            self.assertEquals({}, api._reads)
+
+    def test_read_cache_bounds(self):
+        """ GET results cache is bounded and returns copies """
+        api = rest.Api('user', 'password', url='http://bounds.test/rest/',
+                       cache_max_age=60)
+        with patch('requests.get', return_value=RequestRet(
+                content=b'{"state": "Running"}', status_code=200)) as get:
+            api.get_experiment_info(123, 'state')['state'] = 'Modified'
+            self.assertEquals({'state': 'Running'},
+                              api.get_experiment_info(123, 'state'))
+            api.get_experiment_info(123, 'state')['state'] = 'Modified'
+            self.assertEquals({'state': 'Running'},
+                              api.get_experiment_info(123, 'state'))
+            self.assertEquals(1, get.call_count)
+
+            # raw results are not cached
+            api.get_experiment_info(123, 'data')
+            api.get_experiment_info(123, 'data')
+            self.assertEquals(3, get.call_count)
+
+            with patch('iotlabcli.rest.READS_MAX', 2):
+                for exp_id in range(124, 128):
+                    api.get_experiment_info(exp_id, 'state')
+                self.assertEquals(2, len(api._reads))
+
+            # expired results are dropped on insert
+            with patch('time.time', return_value=time.time() + 60):
+                api.get_experiment_info(123, 'state')
+            self.assertEquals(1, len(api._reads))
+
+    def test_compressed_multipart(self):
+        """ Multipart bodies compression with fallback """
+        ok_ret = RequestRet(content='{}'.encode('utf-8'), status_code=200)
+        unsupported = RequestRet(content=b'', status_code=415)
+        files = {'fw.hex': ':00000001FF\n' * 1000}
+        api = rest.Api('user', 'password', url='http://compress.test/rest/',
+                       compression='gzip')
+        with patch('requests.post', return_value=ok_ret) as post:
+            api.node_update(123, files)
+            kwargs = post.call_args[1]
+            self.assertEquals('gzip', kwargs['headers']['content-encoding'])
+            body = zlib.decompress(kwargs['data'].read(),
+                                   16 + zlib.MAX_WBITS)
+            self.assertTrue(files['fw.hex'].encode('utf-8') in body)
+
+            # small bodies are not compressed
+            api.node_update(123, {'nodes.json': '[]'})
+            post.assert_called_with(
+                'http://compress.test/rest/experiments/123/nodes?update',
+                auth=api.auth, files={'nodes.json': '[]'},
+                timeout=rest.TIMEOUT)
+
+        # server does not support compression
+        with patch('requests.post', side_effect=[unsupported, ok_ret]) as post:
+            api.node_update(123, files)
+            self.assertEquals(2, post.call_count)
+            kwargs = post.call_args[1]
+            self.assertFalse('content-encoding' in kwargs['headers'])
+            self.assertTrue(isinstance(kwargs['data'], helpers.MultipartBody))
+
+        # not compressed anymore
+        with patch('requests.post', return_value=ok_ret) as post:
+            api.node_update(123, files)
+            post.assert_called_with(
+                'http://compress.test/rest/experiments/123/nodes?update',
+                auth=api.auth, files=files, timeout=rest.TIMEOUT)
+        rest.Api._cache.pop(('compression', api.url))
+
+        self.assertRaises(ValueError, rest.Api, 'user', 'password',
+                          compression='lzma')
+
+
+def _slow(ret):
+    """ Return a slow requests function returning or raising `ret` """
+    def _request(*_, **__):
+        """ Slow request """
+        time.sleep(0.2)
+        if isinstance(ret, Exception):
+            raise ret
+        return ret
+    return _request
+
+
+def _concurrent(function, count=4):
+    """ Run `function` in `count` threads, return results """
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(function()))
+               for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _raised(function):
+    """ Return RuntimeError raised by `function` """
+    try:
+        function()
+    except RuntimeError as err:
+        return err
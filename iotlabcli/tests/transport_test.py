@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+""" Test the iotlabcli.transport module """
+
+# pylint: disable=too-many-public-methods
+import json
+import zlib
+import socket
+import threading
+import unittest
+try:
+    # pylint: disable=import-error,no-name-in-module
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:  # pragma: no cover
+    # pylint: disable=import-error,no-name-in-module
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+from iotlabcli import rest
+from iotlabcli import transport
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    """ Answer request description as json, deflate compressed if accepted
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        """ Answer request description """
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        content = json.dumps({
+            'method': self.command, 'path': self.path, 'body': len(body),
+            'auth': self.headers.get('Authorization'),
+            'type': self.headers.get('Content-Type', '').split(';')[0],
+        }).encode('utf-8')
+        self.send_response(200)
+        if 'deflate' in self.headers.get('Accept-Encoding', ''):
+            content = zlib.compress(content)
+            self.send_header('Content-Encoding', 'deflate')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_DELETE = _handle
+
+    def log_message(self, *args):  # pylint:disable=arguments-differ
+        """ Be quiet """
+        pass
+
+
+class _ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """ Threaded HTTP server, keep-alive connections use their thread """
+    daemon_threads = True
+
+
+class TestTransports(unittest.TestCase):
+    """ Test transports against a local HTTP server """
+    def setUp(self):
+        self.server = _ThreadedHTTPServer(('127.0.0.1', 0), _EchoHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/rest/' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def _check_transport(self, _transport):
+        """ Run requests with `_transport` """
+        api = rest.Api('user', 'password', url=self.url,
+                       transport=_transport)
+        auth = 'Basic dXNlcjpwYXNzd29yZA=='
+        self.assertEquals({'method': 'GET', 'path': '/rest/profiles',
+                           'body': 0, 'auth': auth, 'type': ''},
+                          api.get_profiles())
+        ret = api.node_command('reset', 123, ['m3-1'])
+        self.assertEquals(('POST', '/rest/experiments/123/nodes?reset',
+                           'application/json'),
+                          (ret['method'], ret['path'], ret['type']))
+        ret = api.node_update(123, {'fw.elf': 'a' * 100, 'nodes.json': '[]'})
+        self.assertEquals('multipart/form-data', ret['type'])
+        self.assertTrue(ret['body'] > 100)
+        self.assertEquals('DELETE', api.stop_experiment(123)['method'])
+
+        # connection refused
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        api = rest.Api('user', 'password', url='http://127.0.0.1:%d/' % port,
+                       transport=_transport)
+        self.assertRaises(RuntimeError, api.get_profiles)
+
+    def test_requests_transports(self):
+        """ Test requests functions and session transports """
+        self._check_transport(None)
+        session = transport.SessionTransport()
+        self._check_transport(session)
+        session.session.close()
+
+    def test_urllib3_transport(self):
+        """ Test urllib3 transport """
+        self._check_transport(transport.Urllib3Transport())
+
+    @unittest.skipIf(transport.asyncio is None, 'asyncio transport')
+    def test_asyncio_transport(self):
+        """ Test asyncio transport """
+        _transport = transport.AsyncioTransport()
+        sock = socket.socket()
+        try:
+            self._check_transport(_transport)
+
+            # server not answering
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(1)
+            url = 'http://127.0.0.1:%d/' % sock.getsockname()[1]
+            self.assertRaises(RuntimeError, _transport.request, 'GET', url,
+                              timeout=0.1)
+        finally:
+            sock.close()
+            _transport.close()
+
+
+class TestFakeTransport(unittest.TestCase):
+    """ Test in-process transport """
+    def test_fake_transport(self):
+        """ Answer requests with a handler """
+        requests = []
+
+        def _handler(method, path, body, headers):
+            """ Record request """
+            requests.append((method, path, body, headers['content-type']))
+            return 200, 'application/json', b'{"id": 123}'
+
+        api = rest.Api('user', 'password', url='http://fake/rest/',
+                       transport=transport.FakeTransport(_handler,
+                                                         'http://fake/rest/'))
+        self.assertEquals({'id': 123}, api.node_command('start', 123, []))
+        self.assertEquals([('POST', 'experiments/123/nodes?start', b'[]',
+                            'application/json')], requests)
+
+    def test_get_sites_transport(self):
+        """ Get sites with a transport """
+        def _handler(method, path, _body, headers):
+            """ Answer sites """
+            self.assertEquals(('GET', 'experiments?sites'), (method, path))
+            self.assertFalse('authorization' in headers)
+            return 200, 'application/json', b'{"items": []}'
+
+        # pylint:disable=protected-access
+        sites = rest.Api._cache.pop('sites', None)
+        try:
+            self.assertEquals({'items': []}, rest.Api.get_sites(
+                transport.FakeTransport(_handler, rest.API_URL)))
+        finally:
+            rest.Api._cache.pop('sites', None)
+            if sites is not None:
+                rest.Api._cache['sites'] = sites
@@ -0,0 +1,358 @@
+# -*- coding:utf-8 -*-
+""" HTTP transports used by rest.Api
+
+A transport sends a request and returns its (status_code, content):
+
+    transport.request(method, url, auth=None, timeout=None, headers=None,
+                      data=None, files=None)
+
+with `data` a bytes or a file-like body, `files` a multipart files dict and
+`auth` a requests.auth.HTTPBasicAuth. Errors are raised as RuntimeError.
+
+ * `RequestsTransport`: requests module functions, the default
+ * `SessionTransport`: a requests Session, reusing connections
+ * `Urllib3Transport`: an urllib3 connections pool
+ * `FakeTransport`: in-process handler, no socket involved
+ * `AsyncioTransport`: asyncio event loop connections, python >= 3.5
+"""
+
+import zlib
+import base64
+import threading
+try:
+    # pylint: disable=import-error,no-name-in-module
+    from urllib.parse import urlsplit
+except ImportError:  # pragma: no cover
+    # pylint: disable=import-error,no-name-in-module
+    from urlparse import urlsplit
+try:
+    import asyncio
+    import concurrent.futures
+except ImportError:  # pragma: no cover
+    asyncio = None  # pylint:disable=invalid-name
+import requests
+try:
+    import urllib3
+except ImportError:  # pragma: no cover
+    urllib3 = None  # pylint:disable=invalid-name
+
+from iotlabcli import helpers
+
+
+class RequestsTransport(object):  # pylint:disable=too-few-public-methods
+    """ Transport using requests module functions """
+    def request(self, method, url, **kwargs):
+        """ Send request and return (status_code, content)
+        :raises RuntimeError: on connection errors and timeouts """
+        try:
+            req = self._send(method, url, **kwargs)
+        except requests.exceptions.RequestException as err:
+            raise RuntimeError("Request error: {0}".format(err))
+        return (req.status_code, req.content)
+
+    def _send(self, method, url, **kwargs):
+        """ Send request with requests """
+        return {'GET': requests.get, 'POST': requests.post,
+                'DELETE': requests.delete}[method](url, **kwargs)
+
+
+class SessionTransport(RequestsTransport):
+    # pylint:disable=too-few-public-methods
+    """ Transport using a requests Session, connections are kept alive """
+    def __init__(self, session=None):
+        self.session = session or requests.Session()
+
+    def _send(self, method, url, **kwargs):
+        """ Send request with session """
+        return self.session.request(method, url, **kwargs)
+
+
+class Transport(object):  # pylint:disable=too-few-public-methods
+    """ Base class for transports sending raw bodies, subclasses define
+    `request` using `encode` """
+
+    @staticmethod
+    def encode(auth=None, headers=None, data=None, files=None):
+        """ Return request headers and body as bytes
+
+        >>> headers, body = Transport.encode(
+        ...     auth=requests.auth.HTTPBasicAuth('user', 'password'),
+        ...     files={'a.json': '[]'})
+        >>> sorted(headers)
+        ['authorization', 'content-length', 'content-type']
+        >>> headers['authorization'] == 'Basic dXNlcjpwYXNzd29yZA=='
+        True
+        """
+        headers = dict(headers or {})
+        if files is not None:
+            data = helpers.MultipartBody(files)
+            headers.update(data.headers)
+        body = data.read() if hasattr(data, 'read') else (data or b'')
+        headers['content-length'] = str(len(body))
+        if auth is not None:
+            credentials = '%s:%s' % (auth.username, auth.password)
+            headers['authorization'] = 'Basic ' + base64.b64encode(
+                credentials.encode('utf-8')).decode('ascii')
+        return headers, body
+
+
+class Urllib3Transport(Transport):  # pylint:disable=too-few-public-methods
+    """ Transport using an urllib3 connections pool """
+    def __init__(self, pool=None):
+        if urllib3 is None:  # pragma: no cover
+            raise ValueError('Urllib3Transport requires urllib3')
+        self.pool = pool or urllib3.PoolManager()
+
+    def request(self, method, url, **kwargs):
+        """ Send request and return (status_code, content)
+        :raises RuntimeError: on connection errors and timeouts """
+        timeout = kwargs.pop('timeout', None)
+        headers, body = self.encode(**kwargs)
+        headers['accept-encoding'] = 'gzip, deflate'
+        if isinstance(timeout, tuple):
+            timeout = urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        try:
+            resp = self.pool.request(method, url, headers=headers, body=body,
+                                     timeout=timeout, retries=False)
+        except urllib3.exceptions.HTTPError as err:
+            raise RuntimeError("Request error: {0}".format(err))
+        return (resp.status, resp.data)
+
+
+class FakeTransport(Transport):  # pylint:disable=too-few-public-methods
+    """ In-process transport answering with `handler`
+
+    :param handler: function(method, path, body, headers) returning
+        (status_code, content_type, content), with `path` relative to
+        `root_url`, like benchmarks FakeTestbed.handle
+
+    >>> handler = lambda method, path, body, headers: (
+    ...     200, 'application/json', ('"%s %s"' % (method, path)).encode())
+    >>> status, content = FakeTransport(handler, 'http://fake/rest/').request(
+    ...     'GET', 'http://fake/rest/experiments?id')
+    >>> (status, content) == (200, b'"GET experiments?id"')
+    True
+    """
+    def __init__(self, handler, root_url):
+        self.handler = handler
+        self.root = urlsplit(root_url).path
+
+    def request(self, method, url, **kwargs):
+        """ Answer request with handler """
+        kwargs.pop('timeout', None)
+        headers, body = self.encode(**kwargs)
+        url = urlsplit(url)
+        path = url.path[len(self.root):]
+        if url.query:
+            path += '?' + url.query
+        status, _, content = self.handler(method, path, body, headers)
+        return (status, content)
+
+
+class AsyncioTransport(Transport):
+    """ Transport using asyncio connections, run in `loop` or in a new event
+    loop thread
+
+    `request` can be used by rest.Api like other transports, from any
+    thread. In the event loop, `request_async` returns a future, to send
+    many requests concurrently. The read timeout applies to the whole
+    response.
+    """
+    def __init__(self, loop=None):
+        if asyncio is None:  # pragma: no cover
+            raise ValueError('AsyncioTransport requires python >= 3.5')
+        self._thread = None
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=loop.run_forever)
+            self._thread.daemon = True
+            self._thread.start()
+        self.loop = loop
+
+    def close(self):
+        """ Stop the event loop thread, if started by the transport """
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self._thread = None
+
+    def request(self, method, url, **kwargs):
+        """ Send request and return (status_code, content)
+        :raises RuntimeError: on connection errors and timeouts """
+        request = self._message(method, url, **kwargs)
+        result = concurrent.futures.Future()
+        self.loop.call_soon_threadsafe(
+            lambda: _chain(self._send(*request), result))
+        return result.result()
+
+    def request_async(self, method, url, **kwargs):
+        """ Send request, to be called in the event loop
+        :returns: future of (status_code, content), with RuntimeError on
+            connection errors and timeouts """
+        return self._send(*self._message(method, url, **kwargs))
+
+    def _message(self, method, url, **kwargs):
+        """ Return (url, request message, (connect, read) timeouts) """
+        timeouts = _timeouts(kwargs.pop('timeout', None))
+        url = urlsplit(url)
+        headers, body = self.encode(**kwargs)
+        return url, _request_message(method, url, headers, body), timeouts
+
+    def _send(self, url, message, timeouts):
+        """ Connect to `url` host, send `message` and return response future
+        """
+        protocol = _ResponseProtocol(message, self.loop.create_future(), url)
+        https = url.scheme == 'https'
+        port = url.port or (443 if https else 80)
+        connecting = asyncio.ensure_future(asyncio.wait_for(
+            self.loop.create_connection(lambda: protocol, url.hostname, port,
+                                        ssl=https or None),
+            timeouts[0]), loop=self.loop)
+        connecting.add_done_callback(
+            lambda fut: _connected(fut, protocol, url))
+        if timeouts[1] is not None:
+            timer = self.loop.call_later(timeouts[1], protocol.abort,
+                                         _error(asyncio.TimeoutError(), url))
+            protocol.result.add_done_callback(lambda _: timer.cancel())
+        return protocol.result
+
+
+class _ResponseProtocol(asyncio.Protocol if asyncio else object):
+    """ Send `message` to `url` and set `result` future to the parsed
+    response """
+    def __init__(self, message, result, url):
+        self.message = message
+        self.result = result
+        self.url = url
+        self.transport = None
+        self.chunks = []
+
+    def connection_made(self, transport):
+        """ Send request, or close connection if already timed out """
+        self.transport = transport
+        if self.result.done():
+            transport.abort()
+        else:
+            transport.write(self.message)
+
+    def data_received(self, data):
+        """ Store response data """
+        self.chunks.append(data)
+
+    def connection_lost(self, exc):
+        """ Parse response, connection is closed by server at its end """
+        if exc is not None:
+            self.abort(_error(exc, self.url))
+        elif not self.result.done():
+            try:
+                self.result.set_result(_parse_response(b''.join(self.chunks)))
+            except (ValueError, IndexError, zlib.error) as err:
+                self.result.set_exception(_error(err, self.url))
+
+    def abort(self, error):
+        """ Set `error` as result and close connection """
+        if not self.result.done():
+            self.result.set_exception(error)
+        if self.transport is not None:
+            self.transport.abort()
+
+
+def _connected(connecting, protocol, url):
+    """ Abort `protocol` if `connecting` future failed """
+    if not connecting.cancelled() and connecting.exception() is not None:
+        protocol.abort(_error(connecting.exception(), url))
+
+
+def _chain(future, result):
+    """ Copy asyncio `future` outcome to concurrent `result` future """
+    def _copy(fut):
+        """ Copy result or exception """
+        if fut.exception() is not None:
+            result.set_exception(fut.exception())
+        else:
+            result.set_result(fut.result())
+    future.add_done_callback(_copy)
+
+
+def _error(err, url):
+    """ RuntimeError for connection error or timeout """
+    if isinstance(err, asyncio.TimeoutError):
+        return RuntimeError("Request error: timeout for %s" % url.geturl())
+    return RuntimeError("Request error: {0}".format(err))
+
+
+def _timeouts(timeout):
+    """ Return (connect, read) timeouts
+
+    >>> _timeouts(None), _timeouts(5), _timeouts((1, 10))
+    ((None, None), (5, 5), (1, 10))
+    """
+    return timeout if isinstance(timeout, tuple) else (timeout, timeout)
+
+
+def _request_message(method, url, headers, body):
+    """ Request line, headers and body, connection closed after response
+
+    >>> _request_message('GET', urlsplit('http://host:8080/rest/a?b'), {},
+    ...                  b'') == (b'GET /rest/a?b HTTP/1.1\\r\\n'
+    ...     b'accept-encoding: gzip, deflate\\r\\nconnection: close\\r\\n'
+    ...     b'host: host:8080\\r\\n\\r\\n')
+    True
+    """
+    path = url.path or '/'
+    if url.query:
+        path += '?' + url.query
+    headers = dict(headers, host=url.netloc, connection='close')
+    headers['accept-encoding'] = 'gzip, deflate'
+    lines = ['%s %s HTTP/1.1' % (method, path)]
+    lines.extend('%s: %s' % item for item in sorted(headers.items()))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+# zlib wbits for supported Content-Encoding
+CONTENT_ENCODINGS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+def _parse_response(response):
+    """ Return (status_code, content) of whole `response` bytes
+
+    >>> _parse_response(b'HTTP/1.1 200 OK\\r\\ncontent-length: 2\\r\\n'
+    ...                 b'\\r\\n{}') == (200, b'{}')
+    True
+    >>> _parse_response(b'HTTP/1.1 200 OK\\r\\ntransfer-encoding: chunked'
+    ...                 b'\\r\\n\\r\\n2\\r\\n{}\\r\\n0\\r\\n\\r\\n'
+    ...                 ) == (200, b'{}')
+    True
+    """
+    head, _, content = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        content = _dechunk(content)
+    elif 'content-length' in headers:
+        content = content[:int(headers['content-length'])]
+    encoding = headers.get('content-encoding')
+    if encoding in CONTENT_ENCODINGS:
+        content = zlib.decompress(content, CONTENT_ENCODINGS[encoding])
+    return (status, content)
+
+
+def _dechunk(content):
+    """ Decode chunked transfer encoding body """
+    chunks = []
+    while True:
+        size, _, content = content.partition(b'\r\n')
+        size = int(size.split(b';')[0], 16)
+        if not size:
+            return b''.join(chunks)
+        chunks.append(content[:size])
+        content = content[size + 2:]  # with '\r\n'
+
+
+DEFAULT = RequestsTransport()